@@ -0,0 +1,229 @@
+import asyncio
+import codecs
+import csv
+import io
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from csv_validator import CSV_Validator
+from csvs_compiler import blocking
+from external_validators import clear_prefetched_checksums
+
+logger = logging.getLogger(__name__)
+
+# Longest the event loop is held in seconds before other tasks get a turn
+TIME_SLICE = 0.01
+# Rows checked in each executor task, for schemas with blocking rules
+ROWS_PER_TASK = 64
+# Executor tasks in flight at once
+WORKERS = 4
+
+
+def complete_length(text, quotes=0):
+    # Length of text up to the end of its last complete record, where
+    # quotes is the number of quotes in the text held back before it
+    # (only its parity matters). As in find_chunks a newline only ends a
+    # record with an even number of quotes before it.
+    quotes += text.count('"')
+    end = len(text)
+    while True:
+        newline = text.rfind("\n", 0, end)
+        if newline == -1:
+            return 0
+        quotes -= text.count('"', newline, end)
+        if not quotes % 2:
+            return newline + 1
+        end = newline
+
+
+class CSV_Async_Validator(CSV_Validator):
+    # Validates a CSV file arriving as an async iterator of bytes, like an
+    # upload's request body, in an asyncio service. Rows are parsed and
+    # checked on the event loop as the bytes come in, and the loop is
+    # given back at least every time_slice seconds so many uploads can be
+    # checked at once. If the schema has rules that wait on files, like
+    # checksum and fileExists, rows are checked in batches of
+    # rows_per_task in executor instead, with at most workers batches in
+    # flight. executor can be shared between validators, otherwise each
+    # check makes its own.
+    #
+    # async for issue in validator.iter_issues() yields each issue as it's
+    # found, await validator.check_async() just gives the verdict.
+    def __init__(self, chunks, rules, encoding="utf-8", max_errors=1, issue_writer=None,
+                 time_slice=TIME_SLICE, workers=WORKERS, rows_per_task=ROWS_PER_TASK,
+                 executor=None):
+        super().__init__(chunks, rules, max_errors=max_errors, issue_writer=issue_writer)
+        self.encoding = encoding
+        self.time_slice = time_slice
+        self.workers = workers
+        self.rows_per_task = rows_per_task
+        self.executor = executor
+        # Issues found but not yet yielded by iter_issues
+        self._found = deque()
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.csv_file!r}>"
+
+    def check(self):
+        # For callers without an event loop of their own
+        return asyncio.run(self.check_async())
+
+    async def check_async(self):
+        async for _issue in self.iter_issues():
+            pass
+        return not self.error_count
+
+    async def iter_issues(self):
+        loop = asyncio.get_running_loop()
+        self._found.clear()
+        rows = self._rows_async()
+        checked = None
+        own_executor = None
+        try:
+            header = None
+            if self.rules["@global_directives"]["header"]:
+                header = await anext(rows, None)
+            if self._read_header(iter(() if header is None else (header,))):
+                self._compile_row_errors()
+                self._start_aggregates()
+                if self._has_blocking_rules():
+                    logger.info("Schema has rules that wait on files, checking rows in an executor.")
+                    executor = self.executor
+                    if executor is None:
+                        executor = own_executor = ThreadPoolExecutor(max_workers=self.workers)
+                    checked = self._check_in_executor(rows, executor)
+                else:
+                    checked = self._check_on_loop(rows)
+                slice_end = loop.time() + self.time_slice
+                # checked yields after each row or batch
+                async for _ in checked:
+                    while self._found:
+                        yield self._found.popleft()
+                    if loop.time() >= slice_end:
+                        await asyncio.sleep(0)
+                        slice_end = loop.time() + self.time_slice
+            while self._found:
+                yield self._found.popleft()
+        finally:
+            if checked is not None:
+                await checked.aclose()
+            await rows.aclose()
+            for _index, state, _rule, _severity in self._aggregates:
+                state.close()
+            clear_prefetched_checksums()
+            if own_executor is not None:
+                own_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _add_issue(self, issue):
+        self._found.append(issue)
+        return super()._add_issue(issue)
+
+    def _has_blocking_rules(self):
+        return any(blocking(expr) for key in self.column_map.values()
+                   for expr in self.rules[key]["exprs"])
+
+    async def _rows_async(self):
+        # Rows of the chunks, each parsed once its last line has arrived.
+        # Only the new text is scanned for the end of a record, the text
+        # held back is kept as pieces along with the parity of its quotes,
+        # so a record spread over many chunks isn't scanned or copied again
+        # for each of them.
+        delimiter = self.rules['@global_directives']['separator']
+        decoder = codecs.getincrementaldecoder(self.encoding)()
+        pending = []
+        quotes = 0
+        async for chunk in self.csv_file:
+            text = decoder.decode(chunk)
+            end = complete_length(text, quotes)
+            if not end:
+                pending.append(text)
+                quotes = (quotes + text.count('"')) % 2
+                continue
+            records = "".join(pending) + text[:end]
+            pending = [text[end:]]
+            quotes = text.count('"', end) % 2
+            for row in csv.reader(io.StringIO(records, newline=""), delimiter=delimiter):
+                yield row
+        pending.append(decoder.decode(b"", final=True))
+        for row in csv.reader(io.StringIO("".join(pending), newline=""), delimiter=delimiter):
+            yield row
+
+    def _slow_aggregates(self):
+        # True if adding the next row to the cross-row checks does slow
+        # work, like integrityCheck walking its folder or unique writing
+        # a run to disk
+        return any(state.slow_add() for _index, state, _rule, _severity in self._aggregates)
+
+    async def _off_loop(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    async def _check_on_loop(self, rows):
+        row_num = self.first_row
+        async for row in rows:
+            if self._slow_aggregates():
+                # Awaited, so rows are still reported in order
+                checked = await self._off_loop(self._check_row, row_num, row)
+            else:
+                checked = self._check_row(row_num, row)
+            if not checked:
+                return
+            row_num += 1
+            yield
+        await self._finish_async()
+
+    async def _check_in_executor(self, rows, executor):
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        row_num = self.first_row
+        try:
+            async for batch in self._batches(rows):
+                future = loop.run_in_executor(executor, self._check_task, batch)
+                pending.append((row_num, batch, future))
+                row_num += len(batch)
+                if len(pending) >= self.workers:
+                    first_row, done, future = pending.popleft()
+                    if not await self._report_batch(first_row, done, await future):
+                        return
+                    yield
+            while pending:
+                first_row, done, future = pending.popleft()
+                if not await self._report_batch(first_row, done, await future):
+                    return
+                yield
+            await self._finish_async()
+        finally:
+            for _first_row, _batch, future in pending:
+                future.cancel()
+
+    async def _batches(self, rows):
+        batch = []
+        async for row in rows:
+            batch.append(row)
+            if len(batch) == self.rows_per_task:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _check_task(self, rows):
+        # Errors of each row in the batch, run in the executor
+        return [self._row_errors(row) for row in rows]
+
+    async def _report_batch(self, first_row, rows, errors):
+        # Issues are reported in file order as with the other validators
+        if first_row <= self._memo_review_row < first_row + len(rows) and self._active_memos:
+            self._review_memos()
+        for row_num, (row, row_errors) in enumerate(zip(rows, errors), first_row):
+            if self._slow_aggregates():
+                reported = await self._off_loop(self._report_row, row_num, row, row_errors)
+            else:
+                reported = self._report_row(row_num, row, row_errors)
+            if not reported:
+                return False
+        return True
+
+    async def _finish_async(self):
+        # Walking integrityCheck's folders or merging unique's runs can
+        # take a while, so it's done off the loop
+        if self._aggregates:
+            await self._off_loop(self._finish_aggregates)
@@ -0,0 +1,205 @@
+import asyncio
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import async_validator
+import integrity_check
+import unique_index
+from async_validator import CSV_Async_Validator, complete_length
+from csv_validator import CSV_Stream_Validator, CSV_Validator
+from csvs_compiler import load_rules
+
+SCHEMA = """version 1.0
+@totalColumns 3
+id: unique
+name: notEmpty length(1, 5)
+age: range(0, 120)
+"""
+
+
+@pytest.fixture
+def rules(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(SCHEMA)
+    return load_rules(schema_file, cache_dir=None)
+
+
+def _data(rows, seed=1):
+    rng = random.Random(seed)
+    names = ["", "ann", "zoë", '"a,\nb"', "toolong", "x"]
+    lines = ["id,name,age"] + [f"{i % (rows - 7)},{rng.choice(names)},{rng.randint(-5, 130)}"
+                               for i in range(rows)]
+    return "\n".join(lines).encode("utf-8")
+
+
+async def _chunks(data, seed=2, read=None):
+    # data split at random sizes, through multi-byte characters and
+    # quoted newlines
+    rng = random.Random(seed)
+    position = 0
+    while position < len(data):
+        size = rng.randint(1, 300)
+        if read is not None:
+            read.append(position)
+        yield data[position:position + size]
+        position += size
+        await asyncio.sleep(0)
+
+
+def _issues(issues):
+    return [(issue.row, issue.column, issue.value, issue.message) for issue in issues]
+
+
+def test_complete_length():
+    assert complete_length('a,b\n1,"x\ny') == 4
+    assert complete_length('a,b\n1,"x\ny"\n2,') == 12
+    assert complete_length("a,b") == 0
+    # Carrying on from text held back with an odd number of quotes
+    assert complete_length('y"\n2,', 1) == 3
+    assert complete_length('y\n2,', 1) == 0
+
+
+def test_long_record_scanned_once(rules, monkeypatch):
+    # One quoted field over many chunks, each chunk is only scanned for
+    # record ends by itself
+    data = ('id,name,age\n1,"' + "ab\n" * 20000 + '",3\n2,ann,4\n').encode("utf-8")
+    scanned = []
+
+    def counted_complete_length(text, quotes=0):
+        scanned.append(len(text))
+        return complete_length(text, quotes)
+    monkeypatch.setattr(async_validator, "complete_length", counted_complete_length)
+
+    async def chunks():
+        for position in range(0, len(data), 100):
+            yield data[position:position + 100]
+    validator = CSV_Async_Validator(chunks(), rules, max_errors=None)
+    assert not asyncio.run(validator.check_async())
+    assert sum(scanned) == len(data)
+    assert [(issue.row, issue.column) for issue in validator.issues] == [(0, 1)]
+
+
+def test_same_issues_as_stream(tmp_path, rules):
+    data = _data(3000)
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_bytes(data)
+    stream = CSV_Stream_Validator(csv_file, rules, max_errors=None)
+    assert not stream.check()
+
+    async def check():
+        validator = CSV_Async_Validator(_chunks(data), rules, max_errors=None)
+        issues = [issue async for issue in validator.iter_issues()]
+        return validator, issues
+    validator, issues = asyncio.run(check())
+    assert _issues(issues) == _issues(validator.issues) == _issues(stream.issues)
+    assert validator.error_count == stream.error_count
+    # The duplicate ids are only known at the end
+    assert any(issue.message.startswith("Duplicate") for issue in issues)
+
+
+def test_issues_as_they_are_found(rules):
+    data = _data(3000)
+    read = []
+
+    async def first_issue():
+        validator = CSV_Async_Validator(_chunks(data, read=read), rules, max_errors=None)
+        async for _issue in validator.iter_issues():
+            return read[-1]
+    assert asyncio.run(first_issue()) < len(data) / 10
+
+
+def test_loop_is_given_back(rules):
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0)
+
+    async def big_chunks(data):
+        # Every row is already there, so only the time slice lets the
+        # ticker run
+        for position in range(0, len(data), 1 << 20):
+            yield data[position:position + (1 << 20)]
+
+    async def check():
+        task = asyncio.create_task(ticker())
+        await asyncio.sleep(0)
+        ticks.clear()
+        validator = CSV_Async_Validator(big_chunks(_data(20000)), rules, max_errors=None,
+                                        time_slice=0.001)
+        valid = await validator.check_async()
+        task.cancel()
+        return valid
+    assert not asyncio.run(check())
+    assert len(ticks) > 10
+
+
+def test_blocking_rules_use_executor(tmp_path):
+    for name in ("a.tif", "b.tif"):
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "schema.csvs").write_text(
+        f'version 1.0\n@totalColumns 1\npath: fileExists("{tmp_path.as_uri()}/")\n')
+    rules = load_rules(tmp_path / "schema.csvs", cache_dir=None)
+    data = ("path\n" + "a.tif\nb.tif\nc.tif\n" * 100).encode("utf-8")
+    submitted = []
+
+    class Executor(ThreadPoolExecutor):
+        def submit(self, *args, **kwargs):
+            submitted.append(args)
+            return super().submit(*args, **kwargs)
+
+    async def check():
+        with Executor(max_workers=2) as executor:
+            validator = CSV_Async_Validator(_chunks(data), rules, max_errors=None, workers=2,
+                                            rows_per_task=16, executor=executor)
+            return validator, await validator.check_async()
+    validator, valid = asyncio.run(check())
+    assert not valid and submitted
+    assert [issue.row for issue in validator.issues] == list(range(2, 300, 3))
+
+
+def test_slow_aggregate_rows_off_loop(tmp_path, monkeypatch):
+    threads = []
+
+    def recording(function):
+        def record(*args):
+            threads.append((function.__name__, threading.current_thread()))
+            return function(*args)
+        return record
+    monkeypatch.setattr(integrity_check, "walk_manifest", recording(integrity_check.walk_manifest))
+    monkeypatch.setattr(unique_index.UniqueIndex, "_spill", recording(unique_index.UniqueIndex._spill))
+    for name in ("a.tif", "b.tif"):
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "schema.csvs").write_text(
+        'version 1.1\n@totalColumns 2\n'
+        f'path: integrityCheck("{tmp_path}/", "", "excludeFolder")\n'
+        'id: unique\n')
+    rules = load_rules(tmp_path / "schema.csvs", cache_dir=None)
+    rules[1]["aggregates"][0].memory_budget = unique_index.ENTRY_SIZE * 8
+    data = ("path,id\n" + "".join(f"{'ab'[i % 2]}.tif,{i % 40}\n" for i in range(60))).encode("utf-8")
+    stream = CSV_Validator(data.decode("utf-8"), rules, max_errors=None)
+    stream.check()
+    threads.clear()
+
+    async def check():
+        validator = CSV_Async_Validator(_chunks(data), rules, max_errors=None)
+        await validator.check_async()
+        return validator, threading.current_thread()
+    validator, loop_thread = asyncio.run(check())
+    assert _issues(validator.issues) == _issues(stream.issues)
+    assert {name for name, _thread in threads} == {"walk_manifest", "_spill"}
+    assert all(thread is not loop_thread for _name, thread in threads)
+
+
+def test_max_errors(rules):
+    validator = CSV_Async_Validator(_chunks(_data(3000)), rules, max_errors=3)
+    assert not validator.check()
+    assert len(validator.issues) == 3
+
+
+def test_no_header(rules):
+    validator = CSV_Async_Validator(_chunks(b""), rules)
+    assert not validator.check()
+    assert validator.issues[0].message == "No header found."
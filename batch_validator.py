@@ -0,0 +1,122 @@
+import csv
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from csv_validator import CSV_Stream_Validator
+from csvs_compiler import load_rules
+
+# Files sent to a worker at a time, small files are quick to check so
+# this keeps the pool from waiting on the parent
+FILES_PER_TASK = 64
+
+# Extensions of the compressed files found in directories, which are
+# recognised by their contents when they're read
+COMPRESSED_SUFFIXES = (".gz", ".bz2", ".xz")
+
+# Rules built once in each worker process
+_worker_rules = None
+
+
+def _init_worker(schema_file, adaptive):
+    global _worker_rules
+    _worker_rules = load_rules(schema_file, adaptive=adaptive)
+
+
+def expand_csv_files(paths, pattern="*.csv"):
+    # Files are used as they are, directories are searched for pattern,
+    # compressed or not, and anything else is treated as a glob. Raises
+    # FileNotFoundError for a path that finds no files, so a mistyped one
+    # isn't taken for an empty, valid batch.
+    csv_files = []
+    for path in paths:
+        path = str(path)
+        if os.path.isfile(path):
+            found = [path]
+        elif os.path.isdir(path):
+            found = set()
+            for suffix in ("",) + COMPRESSED_SUFFIXES:
+                found.update(str(p) for p in Path(path).rglob(pattern + suffix) if p.is_file())
+            found = sorted(found)
+        else:
+            found = sorted(p for p in glob.glob(path, recursive=True) if os.path.isfile(p))
+        if not found:
+            raise FileNotFoundError(f"No CSV files found at {path}")
+        csv_files.extend(found)
+    return csv_files
+
+
+def check_file(csv_file, rules, encoding="utf-8", max_errors=1):
+    # Verdict for one file, with its errors and warnings
+    validator = CSV_Stream_Validator(csv_file, rules, encoding, max_errors=max_errors)
+    result = {"file": str(csv_file)}
+    try:
+        result["valid"] = validator.check()
+    except (OSError, UnicodeDecodeError, csv.Error, LookupError, ValueError) as e:
+        # A file that can't be read is invalid, the rest of the batch
+        # is still checked
+        result["valid"] = False
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["issues"] = [issue._asdict() for issue in validator.issues]
+    return result
+
+
+def _check_file(task):
+    csv_file, encoding, max_errors = task
+    return check_file(csv_file, _worker_rules, encoding, max_errors)
+
+
+class CSV_Batch_Validator:
+    # Validates many CSV files against one schema. The schema is compiled
+    # once per worker process (and comes from the schema cache after the
+    # first), rather than once per file.
+    def __init__(self, csv_files, schema_file, workers=None, encoding="utf-8", max_errors=1,
+                 adaptive=False):
+        self.csv_files = list(csv_files)
+        self.schema_file = schema_file
+        self.adaptive = adaptive
+        self.workers = workers or os.cpu_count()
+        self.encoding = encoding
+        self.max_errors = max_errors
+        self.results = []
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {len(self.csv_files)} files>"
+
+    def check(self):
+        # An empty batch has nothing to pass
+        if not self.csv_files:
+            self.results = []
+            return False
+        tasks = [(csv_file, self.encoding, self.max_errors) for csv_file in self.csv_files]
+        if self.workers == 1:
+            rules = load_rules(self.schema_file, adaptive=self.adaptive)
+            self.results = [check_file(csv_file, rules, self.encoding, self.max_errors)
+                            for csv_file in self.csv_files]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers,
+                                     initializer=_init_worker,
+                                     initargs=(self.schema_file, self.adaptive)) as executor:
+                self.results = list(executor.map(_check_file, tasks, chunksize=FILES_PER_TASK))
+        return all(result["valid"] for result in self.results)
+
+    def summary(self):
+        valid = sum(result["valid"] for result in self.results)
+        return {
+            "schema": str(self.schema_file),
+            "files": len(self.results),
+            "valid": valid,
+            "invalid": len(self.results) - valid,
+            "results": self.results,
+        }
+
+    def write_summary(self, summary_file="-"):
+        # JSON summary to a file, or stdout for "-"
+        if summary_file == "-":
+            json.dump(self.summary(), sys.stdout, indent=2)
+            sys.stdout.write("\n")
+        else:
+            with open(summary_file, "w", encoding="utf-8") as f:
+                json.dump(self.summary(), f, indent=2)
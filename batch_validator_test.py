@@ -0,0 +1,92 @@
+import gzip
+import json
+import pytest
+import batch_validator
+from batch_validator import CSV_Batch_Validator, expand_csv_files
+
+SCHEMA = """version 1.0
+@totalColumns 2
+name: notEmpty
+age: range(0, 120)
+"""
+
+
+@pytest.fixture
+def csv_dir(tmp_path):
+    (tmp_path / "schema.csvs").write_text(SCHEMA)
+    data = tmp_path / "data"
+    (data / "sub").mkdir(parents=True)
+    (data / "a.csv").write_text("name,age\njames,21\n")
+    (data / "b.csv").write_text("name,age\nlauren,old\n")
+    (data / "sub" / "c.csv").write_text("name,age\nsimon,57\n")
+    (data / "notes.txt").write_text("not a csv")
+    return tmp_path
+
+
+def test_expand_csv_files(csv_dir):
+    data = csv_dir / "data"
+    assert expand_csv_files([data]) == [str(data / "a.csv"), str(data / "b.csv"),
+                                        str(data / "sub" / "c.csv")]
+    assert expand_csv_files([str(data / "*.csv")]) == [str(data / "a.csv"), str(data / "b.csv")]
+    assert expand_csv_files([data / "notes.txt"]) == [str(data / "notes.txt")]
+    # A path finding nothing is an error rather than an empty batch
+    for missing in (str(data / "missing*.csv"), data / "missing.csv"):
+        with pytest.raises(FileNotFoundError):
+            expand_csv_files([data / "notes.txt", missing])
+    (data / "empty").mkdir()
+    with pytest.raises(FileNotFoundError):
+        expand_csv_files([data / "empty"])
+    assert not CSV_Batch_Validator([], csv_dir / "schema.csvs", workers=1).check()
+
+
+def test_compressed_files(csv_dir):
+    data = csv_dir / "data"
+    (data / "sub" / "d.csv.gz").write_bytes(gzip.compress(b"name,age\nbob,-1\n"))
+    (data / "sub" / "e.gz").write_bytes(gzip.compress(b"name,age\nbob,1\n"))
+    csv_files = expand_csv_files([data / "sub"])
+    assert csv_files == [str(data / "sub" / "c.csv"), str(data / "sub" / "d.csv.gz")]
+    validator = CSV_Batch_Validator(csv_files, csv_dir / "schema.csvs", workers=1)
+    assert not validator.check()
+    assert [result["valid"] for result in validator.results] == [True, False]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_summary(csv_dir, workers, capsys):
+    csv_files = expand_csv_files([csv_dir / "data"]) + [str(csv_dir / "missing.csv")]
+    validator = CSV_Batch_Validator(csv_files, csv_dir / "schema.csvs", workers=workers)
+    assert not validator.check()
+    validator.write_summary()
+    summary = json.loads(capsys.readouterr().out)
+    assert (summary["files"], summary["valid"], summary["invalid"]) == (4, 2, 2)
+    verdicts = {result["file"]: result["valid"] for result in summary["results"]}
+    assert verdicts == dict(zip(csv_files, [True, False, True, False]))
+    assert summary["results"][1]["issues"] == [{
+        "row": 0, "column": 1, "column_name": "age", "rule": "range(0, 120)", "value": "old",
+        "severity": "error", "message": "Invalid element!",
+    }]
+    assert "error" in summary["results"][3]
+
+
+def test_batch_adaptive(csv_dir):
+    validator = CSV_Batch_Validator(expand_csv_files([csv_dir / "data"]), csv_dir / "schema.csvs",
+                                    workers=2, adaptive=True)
+    assert not validator.check()
+    assert [result["valid"] for result in validator.results] == [True, False, True]
+    # As each worker builds its rules
+    batch_validator._init_worker(csv_dir / "schema.csvs", True)
+    assert batch_validator._worker_rules[0]["adaptive"]
+
+
+def test_unreadable_file_is_invalid(tmp_path):
+    # No @totalColumns, so a blank first line is an empty header
+    (tmp_path / "schema.csvs").write_text("version 1.0\nname: notEmpty\n")
+    (tmp_path / "blank.csv").write_text("\njames\n")
+    # Over the csv module's field size limit
+    (tmp_path / "huge.csv").write_text("name\n" + "x" * 200_000 + "\n")
+    (tmp_path / "good.csv").write_text("name\njames\n")
+    csv_files = [str(tmp_path / name) for name in ("blank.csv", "huge.csv", "good.csv")]
+    validator = CSV_Batch_Validator(csv_files, tmp_path / "schema.csvs", workers=1)
+    assert not validator.check()
+    assert [result["valid"] for result in validator.results] == [False, False, True]
+    assert validator.results[0]["issues"][0]["message"] == "Empty header."
+    assert validator.results[1]["error"].startswith("Error: field larger than field limit")
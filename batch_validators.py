@@ -0,0 +1,290 @@
+from csvs_compiler import any_values, compile_expr
+from csvs_parser import ColumnReference, Expr
+from csvs_patterns import compile_pattern
+
+# NumPy is optional, when it's installed columns given as arrays are
+# validated with NumPy's vectorised string functions
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Batch compiler function for each Expr op
+_batch_compilers = {}
+
+
+def compiles_batch(op):
+    # Register the function that turns an Expr with this op into a batch
+    # validator. Batch validators take (values, rows, colmap), where values
+    # is one column of the rows, and return a mask of booleans.
+    def register(function):
+        _batch_compilers[op] = function
+        return function
+    return register
+
+
+def compile_batch_expr(expr):
+    compiler = _batch_compilers.get(expr.op)
+    if compiler is not None:
+        return compiler(*expr.args)
+    return _per_cell(compile_expr(expr))
+
+
+def _per_cell(validator):
+    # Anything without a vectorised version calls the normal validator
+    def batch_validator(values, rows, colmap):
+        return [bool(validator(value, row, colmap)) for value, row in zip(_as_list(values), rows)]
+    return batch_validator
+
+
+def _is_array(values):
+    return np is not None and isinstance(values, np.ndarray)
+
+
+def _as_list(values):
+    # Python loops over arrays are slow, loop over plain strings instead
+    return values.tolist() if _is_array(values) else values
+
+
+def _column(provider, values, rows, colmap):
+    # The value of a string provider for each row, a single string for
+    # literals or a column of values for column references
+    if isinstance(provider, ColumnReference):
+        index = colmap[provider.column_name]
+        column = [row[index] for row in rows]
+        return np.asarray(column) if _is_array(values) else column
+    return provider.resolve()
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except ValueError:
+        return float("nan")
+
+
+# or_expr
+@compiles_batch("or")
+def _or(left, right):
+    or1 = compile_batch_expr(left)
+    or2 = compile_batch_expr(right)
+
+    def or_batch(values, rows, colmap):
+        mask1 = or1(values, rows, colmap)
+        mask2 = or2(values, rows, colmap)
+        if _is_array(values):
+            return np.asarray(mask1, dtype=bool) | np.asarray(mask2, dtype=bool)
+        return [a or b for a, b in zip(mask1, mask2)]
+    return or_batch
+
+
+# and_expr
+@compiles_batch("and")
+def _and(left, right):
+    and1 = compile_batch_expr(left)
+    and2 = compile_batch_expr(right)
+
+    def and_batch(values, rows, colmap):
+        mask1 = and1(values, rows, colmap)
+        mask2 = and2(values, rows, colmap)
+        if _is_array(values):
+            return np.asarray(mask1, dtype=bool) & np.asarray(mask2, dtype=bool)
+        return [a and b for a, b in zip(mask1, mask2)]
+    return and_batch
+
+
+# single_expr with an explicit_context_expr
+@compiles_batch("context")
+def _context(context, expr):
+    batch = compile_batch_expr(expr)
+
+    def contextual_batch(values, rows, colmap):
+        return batch(_column(context, values, rows, colmap), rows, colmap)
+    return contextual_batch
+
+
+# if_expr
+@compiles_batch("if")
+def _if(condition, then_expr, else_expr=None):
+    condition = compile_batch_expr(condition)
+    then_batch = compile_batch_expr(then_expr)
+    else_batch = compile_batch_expr(else_expr) if else_expr is not None else None
+
+    def if_batch(values, rows, colmap):
+        conditions = condition(values, rows, colmap)
+        then_mask = then_batch(values, rows, colmap)
+        if else_batch is None:
+            else_mask = [True] * len(values)
+        else:
+            else_mask = else_batch(values, rows, colmap)
+        if _is_array(values):
+            return np.where(np.asarray(conditions, dtype=bool), then_mask, else_mask)
+        return [t if c else e for c, t, e in zip(conditions, then_mask, else_mask)]
+    return if_batch
+
+
+# is_expr
+@compiles_batch("is")
+def _is(string_provider):
+    def is_batch(values, rows, colmap):
+        target = _column(string_provider, values, rows, colmap)
+        if _is_array(values):
+            return values == target
+        if isinstance(target, str):
+            return [value == target for value in values]
+        return [value == t for value, t in zip(values, target)]
+    return is_batch
+
+
+# any_expr
+@compiles_batch("any")
+def _any(*providers):
+    values, rest = any_values(providers)
+    if rest:
+        return _per_cell(compile_expr(Expr("any", *providers)))
+
+    def any_batch(column, _rows, _colmap):
+        return [value in values for value in _as_list(column)]
+    return any_batch
+
+
+# not_expr
+@compiles_batch("not")
+def _not(string_provider):
+    def not_batch(values, rows, colmap):
+        target = _column(string_provider, values, rows, colmap)
+        if _is_array(values):
+            return values != target
+        if isinstance(target, str):
+            return [value != target for value in values]
+        return [value != t for value, t in zip(values, target)]
+    return not_batch
+
+
+# in_expr
+@compiles_batch("in")
+def _in(string_provider):
+    def in_batch(values, rows, colmap):
+        target = _column(string_provider, values, rows, colmap)
+        values = _as_list(values)
+        if isinstance(target, str):
+            return [value in target for value in values]
+        return [value in t for value, t in zip(values, _as_list(target))]
+    return in_batch
+
+
+# starts_with_expr
+@compiles_batch("starts")
+def _starts(string_provider):
+    def starts_batch(values, rows, colmap):
+        target = _column(string_provider, values, rows, colmap)
+        if _is_array(values):
+            return np.char.startswith(values, target)
+        if isinstance(target, str):
+            return [value.startswith(target) for value in values]
+        return [value.startswith(t) for value, t in zip(values, target)]
+    return starts_batch
+
+
+# ends_with_expr, the value is stripped first like the cell validator
+@compiles_batch("ends")
+def _ends(string_provider):
+    def ends(value, target):
+        # value[-0:] is the whole value, so an empty target only matches
+        # an empty value
+        return value.endswith(target) if target else not value
+
+    def ends_batch(values, rows, colmap):
+        target = _column(string_provider, values, rows, colmap)
+        if _is_array(values) and isinstance(target, str) and target:
+            return np.char.endswith(np.char.strip(values), target)
+        if isinstance(target, str):
+            return [ends(value.strip(), target) for value in values]
+        return [ends(value.strip(), t) for value, t in zip(values, target)]
+    return ends_batch
+
+
+# reg_exp_expr
+@compiles_batch("regex")
+def _regex(regex):
+    # Shares the compiled pattern with the cell validator
+    match = compile_pattern(regex.resolve()).fullmatch
+
+    def regex_batch(values, rows, colmap):
+        return [match(value) is not None for value in _as_list(values)]
+    return regex_batch
+
+
+# range_expr
+@compiles_batch("range")
+def _range(min_val, max_val):
+    def range_batch(values, rows, colmap):
+        if _is_array(values):
+            try:
+                numbers = values.astype(float)
+            except ValueError:
+                numbers = np.array([_to_float(value) for value in values.tolist()])
+            return (min_val <= numbers) & (numbers <= max_val)
+        # NaN compares False, like the ValueError in the cell validator
+        return [min_val <= _to_float(value) <= max_val for value in values]
+    return range_batch
+
+
+# length_expr, None is "*"
+@compiles_batch("length")
+def _length(min_len, max_len):
+    low = 0 if min_len is None else min_len
+    high = float("inf") if max_len is None else max_len
+
+    def length_batch(values, rows, colmap):
+        if _is_array(values):
+            lengths = np.char.str_len(values)
+            return (low <= lengths) & (lengths <= high)
+        return [low <= len(value) <= high for value in values]
+    return length_batch
+
+
+# empty_expr
+@compiles_batch("empty")
+def _empty():
+    def empty_batch(values, rows, colmap):
+        if _is_array(values):
+            return np.char.str_len(values) == 0
+        return [not value for value in values]
+    return empty_batch
+
+
+# not_empty_expr
+@compiles_batch("notEmpty")
+def _not_empty():
+    def not_empty_batch(values, rows, colmap):
+        if _is_array(values):
+            return np.char.str_len(values) > 0
+        return [bool(value) for value in values]
+    return not_empty_batch
+
+
+# positive_integer_expr
+@compiles_batch("positiveInteger")
+def _positive_integer():
+    def positive_integer(value):
+        try:
+            return float(value) == int(value) and int(value) > 0
+        except ValueError:
+            return False
+
+    def positive_integer_batch(values, rows, colmap):
+        return [positive_integer(value) for value in _as_list(values)]
+    return positive_integer_batch
+
+
+def first_invalid(mask, match_is_false=False):
+    # Index of the first failing value in a mask, or None
+    if _is_array(mask):
+        failed = mask if match_is_false else ~mask
+        indexes = np.flatnonzero(failed)
+        return int(indexes[0]) if len(indexes) else None
+    for index, passed in enumerate(mask):
+        if passed == match_is_false:
+            return index
+    return None
@@ -0,0 +1,74 @@
+import pytest
+from batch_validators import compile_batch_expr, first_invalid, np
+from csv_validator import CSV_Validator
+from csvs_compiler import compile_expr, load_rules
+from csvs_parser import ColumnReference, Expr, StringLiteral
+
+VALUES = ["", " ", "m", "f", "x", "0", "1", "41", "-3", "120", "121", "6.4", "1.0", "abc",
+          "ABZ", "AB12Z", " AB12Z ", "CD1Z", "PMO/1520", "PMO/", "four years"]
+
+EXPRS = [
+    Expr("range", 0.0, 120.0),
+    Expr("length", 2, 4),
+    Expr("length", None, 2),
+    Expr("length", 3, 3),
+    Expr("positiveInteger"),
+    Expr("empty"),
+    Expr("notEmpty"),
+    Expr("is", StringLiteral("m")),
+    Expr("not", StringLiteral("m")),
+    Expr("in", StringLiteral("mfx")),
+    Expr("any", StringLiteral("m"), StringLiteral("f"), StringLiteral("")),
+    Expr("any", StringLiteral("x"), ColumnReference("other"), StringLiteral("m")),
+    Expr("starts", StringLiteral("AB")),
+    Expr("ends", StringLiteral("Z")),
+    Expr("ends", StringLiteral("")),
+    Expr("regex", StringLiteral("[A-Z]{3}/[0-9]+")),
+    Expr("uuid4"),
+    Expr("or", Expr("is", StringLiteral("m")), Expr("is", StringLiteral("f"))),
+    Expr("and", Expr("starts", StringLiteral("AB")), Expr("ends", StringLiteral("Z"))),
+    Expr("if", Expr("is", StringLiteral("m")), Expr("notEmpty"), Expr("length", 2, 2)),
+    Expr("if", Expr("empty"), Expr("empty")),
+    Expr("is", ColumnReference("other")),
+    Expr("starts", ColumnReference("other")),
+    Expr("context", ColumnReference("other"), Expr("is", StringLiteral("x"))),
+]
+
+
+@pytest.mark.parametrize("expr", EXPRS, ids=str)
+def test_batch_matches_cell_validator(expr):
+    rows = [[value, other] for value, other in zip(VALUES, reversed(VALUES))]
+    colmap = {"value": 0, "other": 1}
+    validator = compile_expr(expr)
+    expected = [bool(validator(row[0], row, colmap)) for row in rows]
+    batch = compile_batch_expr(expr)
+    assert list(batch(VALUES, rows, colmap)) == expected
+    if np is not None:
+        assert [bool(x) for x in batch(np.array(VALUES), rows, colmap)] == expected
+
+
+def test_first_invalid():
+    assert first_invalid([True, True]) is None
+    assert first_invalid([True, False, False]) == 1
+    assert first_invalid([False, True], match_is_false=True) == 1
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_block_mode_reports_same_error(tmp_path, use_numpy):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text('version 1.0\nname: notEmpty\nage: range(0, 120)\ngender: is("m") or is("f")\n')
+    rules = load_rules(schema_file, cache_dir=None)
+    rows = [f"name{i},{i % 100},{'mf'[i % 2]}" for i in range(50)]
+    rows[31] = "x,20,t"
+    rows[33] = ",20,m"
+    rows[40] = "y,200,m"
+    csv_text = "name,age,gender\n" + "\n".join(rows) + "\n"
+
+    row_validator = CSV_Validator(csv_text, rules)
+    assert not row_validator.check()
+    for block_size in (1, 7, 32, 100):
+        block_validator = CSV_Validator(csv_text, rules, block_size=block_size, use_numpy=use_numpy)
+        assert not block_validator.check()
+        assert block_validator.errors == row_validator.errors == [(31, 2, "t")]
+    assert CSV_Validator(csv_text.replace("x,20,t", "x,20,f").replace(",20,m", "z,20,m")
+                         .replace("y,200,m", "y,20,m"), rules, block_size=8).check()
@@ -0,0 +1,3 @@
+# Benchmarks, run from the repository root with python -m, e.g.
+#
+#   python -m benchmarks.run --rows 100000 --output results.json
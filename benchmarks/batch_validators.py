@@ -0,0 +1,62 @@
+# Cells per second checking columns a cell at a time against the batch
+# validators, with lists and (when installed) NumPy arrays.
+#
+#   python -m benchmarks.batch_validators --rows 100000
+
+import argparse
+import random
+import time
+from batch_validators import compile_batch_expr, np
+from csvs_compiler import compile_expr
+from csvs_parser import Expr, StringLiteral
+
+COLUMNS = {
+    "range": (Expr("range", 0.0, 120.0), lambda: str(random.randint(-5, 130))),
+    "length": (Expr("length", 1, 20), lambda: "x" * random.randint(0, 25)),
+    "positiveInteger": (Expr("positiveInteger"), lambda: str(random.randint(-5, 1000))),
+    "notEmpty": (Expr("notEmpty"), lambda: random.choice(["", "value"])),
+    "is_or": (Expr("or", Expr("is", StringLiteral("m")), Expr("is", StringLiteral("f"))),
+              lambda: random.choice("mfx")),
+    "starts_and_ends": (Expr("and", Expr("starts", StringLiteral("AB")), Expr("ends", StringLiteral("Z"))),
+                        lambda: random.choice(["AB12Z", "AB12", "CD12Z"])),
+    "regex": (Expr("regex", StringLiteral("[A-Z]{2,4}/[0-9]+")), lambda: random.choice(["PMO/1", "x/1"])),
+}
+
+
+def per_second(function, cells):
+    start = time.perf_counter()
+    function()
+    return cells / (time.perf_counter() - start)
+
+
+def run(rows):
+    random.seed(1)
+    results = {}
+    for name, (expr, make_value) in COLUMNS.items():
+        values = [make_value() for _ in range(rows)]
+        block = [[value] for value in values]
+        validator = compile_expr(expr)
+        batch = compile_batch_expr(expr)
+        expected = [bool(validator(value, row, {})) for value, row in zip(values, block)]
+        assert list(batch(values, block, {})) == expected, name
+
+        result = {
+            "cell": per_second(lambda: [validator(value, row, {}) for value, row in zip(values, block)], rows),
+            "batch": per_second(lambda: batch(values, block, {}), rows),
+        }
+        if np is not None:
+            array = np.array(values)
+            assert list(batch(array, block, {})) == expected, name
+            result["numpy"] = per_second(lambda: batch(array, block, {}), rows)
+        results[name] = result
+    return results
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark the batch validators.")
+    arg_parser.add_argument('--rows', type=int, default=100000)
+    args = arg_parser.parse_args()
+
+    for name, result in run(args.rows).items():
+        speeds = "  ".join(f"{mode} {speed:12,.0f}" for mode, speed in result.items())
+        print(f"{name:16} {speeds} cells/s")
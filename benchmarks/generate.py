@@ -0,0 +1,143 @@
+# Synthetic CSV files and matching schemas for the benchmarks. Columns
+# cycle through the implemented validators, and invalid_rate of the cells
+# are given a value that fails their rule.
+#
+#   python -m benchmarks.generate out_dir --rows 100000 --columns 20
+
+import argparse
+import csv
+import hashlib
+import random
+import uuid
+from pathlib import Path
+
+# Files referenced by the fileExists and checksum columns
+FILE_COUNT = 100
+
+
+def _uuid4(rng, _n):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+# (rule, valid value, invalid value) for each kind of column. Values are
+# made from a random.Random and the row number, rules can use {files} for
+# the uri of the files directory and {file_column} for the fileExists
+# column.
+COLUMN_KINDS = {
+    "notEmpty": ('notEmpty length(1, 20)',
+                 lambda rng, n: f"name{n}", lambda rng, n: ""),
+    "range": ('range(0, 120)',
+              lambda rng, n: str(rng.randint(0, 120)), lambda rng, n: str(rng.randint(121, 500))),
+    "is_or": ('is("m") or is("f") or is("t") or is("n")',
+              lambda rng, n: rng.choice("mftn"), lambda rng, n: "x"),
+    "not": ('not("unknown")', lambda rng, n: "known", lambda rng, n: "unknown"),
+    "in": ('in("abcdefghij")', lambda rng, n: rng.choice(["abc", "def", "j"]), lambda rng, n: "xyz"),
+    "starts_ends": ('starts("AB") and ends("Z")',
+                    lambda rng, n: f"AB{n}Z", lambda rng, n: f"CD{n}Z"),
+    "regex": ('regex("[A-Z]{2,4}/[0-9]+(/[0-9]+)*")',
+              lambda rng, n: f"PMO/{n}/{rng.randint(1, 9)}", lambda rng, n: f"pmo-{n}"),
+    "uuid4": ('uuid4', _uuid4, lambda rng, n: f"not-a-uuid-{n}"),
+    "uri": ('uri', lambda rng, n: f"http://example.com/item/{n}?page={rng.randint(1, 9)}",
+            lambda rng, n: "not a uri"),
+    "positiveInteger": ('positiveInteger', lambda rng, n: str(n + 1), lambda rng, n: "-1"),
+    "empty_or_length": ('empty or length(3, 3)',
+                        lambda rng, n: rng.choice(["", "abc"]), lambda rng, n: "ab"),
+    "if_context": ('if($c0/starts("name"), positiveInteger, empty)',
+                   lambda rng, n: str(n + 1), lambda rng, n: "0"),
+    "unique": ('unique', lambda rng, n: f"id-{n}", lambda rng, n: "id-0"),
+    "fileExists": ('fileExists("{files}/")',
+                   lambda rng, n: f"f{n % FILE_COUNT}.dat", lambda rng, n: "missing.dat"),
+    "checksum": ('checksum(file("{files}/", ${file_column}), "MD5")',
+                 lambda rng, n: _file_md5(n % FILE_COUNT), lambda rng, n: "0" * 32),
+}
+
+# Kinds used by default, the file based ones need --files
+DEFAULT_KINDS = [kind for kind in COLUMN_KINDS if kind not in ("fileExists", "checksum")]
+
+
+def _file_data(n):
+    return f"file {n}\n".encode() * 64
+
+
+def _file_md5(n):
+    return hashlib.md5(_file_data(n)).hexdigest()
+
+
+def column_kinds(columns, kinds=None):
+    # Kind of each of the columns, cycling through kinds. Column 0 is
+    # always notEmpty since if_context refers to it, and fileExists comes
+    # before checksum which refers to it.
+    kinds = list(kinds or DEFAULT_KINDS)
+    kinds = ["notEmpty"] + [kind for kind in kinds if kind != "notEmpty"]
+    if "checksum" in kinds and "fileExists" not in kinds:
+        kinds.insert(1, "fileExists")
+    return [kinds[i % len(kinds)] for i in range(columns)]
+
+
+def make_schema(kinds, files_uri=""):
+    file_column = f"c{kinds.index('fileExists')}" if "fileExists" in kinds else ""
+    lines = ["version 1.0", f"@totalColumns {len(kinds)}"]
+    for i, kind in enumerate(kinds):
+        # Not str.format, regexes have braces of their own
+        rule = COLUMN_KINDS[kind][0].replace("{files}", files_uri).replace("{file_column}", file_column)
+        lines.append(f"c{i}: {rule}")
+    return "\n".join(lines) + "\n"
+
+
+def make_rows(kinds, rows, invalid_rate=0.0, seed=1):
+    # Yields the header then each row. The same seed gives the same rows.
+    rng = random.Random(seed)
+    yield [f"c{i}" for i in range(len(kinds))]
+    makers = [COLUMN_KINDS[kind][1:] for kind in kinds]
+    for n in range(rows):
+        row = []
+        for valid, invalid in makers:
+            if invalid_rate and rng.random() < invalid_rate:
+                row.append(invalid(rng, n))
+            else:
+                row.append(valid(rng, n))
+        yield row
+
+
+def write_files(out_dir):
+    files_dir = Path(out_dir) / "files"
+    files_dir.mkdir(parents=True, exist_ok=True)
+    for n in range(FILE_COUNT):
+        (files_dir / f"f{n}.dat").write_bytes(_file_data(n))
+    return files_dir
+
+
+def generate(out_dir, rows, columns, kinds=None, invalid_rate=0.0, seed=1):
+    # Writes data.csv and schema.csvs to out_dir and returns their paths
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    kinds = column_kinds(columns, kinds)
+    files_uri = ""
+    if "fileExists" in kinds:
+        files_uri = write_files(out_dir).resolve().as_uri()
+    schema_file = out_dir / "schema.csvs"
+    schema_file.write_text(make_schema(kinds, files_uri))
+    csv_file = out_dir / "data.csv"
+    with open(csv_file, "w", newline="") as f:
+        csv.writer(f).writerows(make_rows(kinds, rows, invalid_rate, seed))
+    return csv_file, schema_file
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Write a synthetic CSV file and schema.")
+    arg_parser.add_argument('out_dir')
+    arg_parser.add_argument('--rows', type=int, default=100000)
+    arg_parser.add_argument('--columns', type=int, default=len(DEFAULT_KINDS))
+    arg_parser.add_argument('--kinds', nargs='+', choices=list(COLUMN_KINDS),
+                            help="Kinds of column to use, all but the file based ones by default.")
+    arg_parser.add_argument('--files', action='store_true',
+                            help="Add fileExists and checksum columns.")
+    arg_parser.add_argument('--invalid-rate', type=float, default=0.0)
+    arg_parser.add_argument('--seed', type=int, default=1)
+    args = arg_parser.parse_args()
+
+    kinds = args.kinds or DEFAULT_KINDS + (["fileExists", "checksum"] if args.files else [])
+    csv_file, schema_file = generate(args.out_dir, args.rows, args.columns, kinds,
+                                     args.invalid_rate, args.seed)
+    print(csv_file)
+    print(schema_file)
@@ -0,0 +1,76 @@
+# Schema parse time for a wide schema, Earley (the old parser) against
+# LALR with and without the on-disk table cache.
+#
+#   python -m benchmarks.parse_schema --columns 1000
+
+import argparse
+import tempfile
+import time
+from lark import Lark
+import csvs_parser
+from csvs_parser import GRAMMAR_DIR, get_lark_parser
+
+COLUMN_RULES = [
+    'notEmpty length(1, 20)',
+    'range(0, 120)',
+    'is("m") or is("f") or is("t") or is("n")',
+    'regex("[a-z]+[0-9]*")',
+    'starts("AB") and ends("Z")',
+    'if($col0/is("x"),notEmpty,empty)',
+    'uuid4 @optional',
+    'positiveInteger',
+]
+
+
+def make_schema(columns):
+    lines = ["version 1.0", f"@totalColumns {columns}"]
+    for i in range(columns):
+        lines.append(f"col{i}: {COLUMN_RULES[i % len(COLUMN_RULES)]}")
+    return "\n".join(lines) + "\n"
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def run(columns, repeat):
+    schema = make_schema(columns)
+    with open(GRAMMAR_DIR / "csvs_1.0.lark") as lark_file:
+        lark_text = lark_file.read()
+    results = {}
+
+    def earley():
+        Lark(lark_text, start="start", lexer="dynamic").parse(schema)
+
+    def lalr_cold():
+        Lark(lark_text, start="start", parser="lalr").parse(schema)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Fill the disk cache once
+        get_lark_parser("1.0", "lalr", cache_dir)
+
+        def lalr_disk_cache():
+            csvs_parser._lark_parsers.clear()
+            get_lark_parser("1.0", "lalr", cache_dir).parse(schema)
+
+        def lalr_in_process():
+            get_lark_parser("1.0", "lalr", cache_dir).parse(schema)
+
+        for name, function in [("earley", earley), ("lalr_cold", lalr_cold),
+                               ("lalr_disk_cache", lalr_disk_cache),
+                               ("lalr_in_process", lalr_in_process)]:
+            results[name] = min(timed(function) for _ in range(repeat))
+    csvs_parser._lark_parsers.clear()
+    return results
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark schema parsing.")
+    arg_parser.add_argument('--columns', type=int, default=1000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    for name, seconds in run(args.columns, args.repeat).items():
+        print(f"{name:16} {seconds * 1000:10.1f} ms")
@@ -0,0 +1,79 @@
+# Cells per second for the pattern based validators, comparing the old
+# per-cell implementations with the compiled ones in csvs_compiler.
+#
+#   python -m benchmarks.regex_validators
+
+import argparse
+import re
+import time
+from csvs_compiler import compile_expr
+from csvs_parser import Expr, StringLiteral
+
+REGEX = r"[A-Z]{2,4}/[0-9]+(/[0-9]+)*"
+
+
+def old_regex_validator(value, _row, _colmap):
+    match_re = re.compile(r"^" + REGEX + "$")
+    if re.match(match_re, value):
+        return True
+    else:
+        return False
+
+
+def old_uuid4_validator(value, _row, _colmap):
+    regex = re.compile(
+        r"^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab]"
+        r"[a-f0-9]{3}-?[a-f0-9]{12}$", re.I
+    )
+    match = regex.match(value.strip())
+    return bool(match)
+
+
+def old_uri_validator(value, _row, _colmap):
+    from rfc3986_validator import validate_rfc3986
+    return validate_rfc3986(value)
+
+
+CASES = {
+    "regex": (old_regex_validator, Expr("regex", StringLiteral(REGEX)),
+              ["PMO/1520", "CAB/1101/2", "pmo/1", "ADM/", "WO/95/3771"]),
+    "uuid4": (old_uuid4_validator, Expr("uuid4"),
+              ["1b4e28ba-2fa1-41d2-883f-0016d3cca427", "1B4E28BA2FA141D2883F0016D3CCA427",
+               "not a uuid", "1b4e28ba-2fa1-11d2-883f-0016d3cca427"]),
+    "uri": (old_uri_validator, Expr("uri"),
+            ["http://data.gov.uk/some_asset", "file:///T/TEST/content/file%20name.txt",
+             "C:\\Users\\file name.txt", "http://data.gov.uk/spaces should be escaped", ""]),
+}
+
+
+def cells_per_second(validator, values, cells):
+    repeat = max(1, cells // len(values))
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for value in values:
+            validator(value, [], {})
+    return repeat * len(values) / (time.perf_counter() - start)
+
+
+def run(cells):
+    results = {}
+    for name, (old_validator, expr, values) in CASES.items():
+        new_validator = compile_expr(expr)
+        # Both versions must agree before comparing speed
+        for value in values:
+            assert bool(old_validator(value, [], {})) == new_validator(value, [], {}), (name, value)
+        results[name] = {
+            "before": cells_per_second(old_validator, values, cells),
+            "after": cells_per_second(new_validator, values, cells),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark pattern based validators.")
+    arg_parser.add_argument('--cells', type=int, default=200000)
+    args = arg_parser.parse_args()
+
+    for name, result in run(args.cells).items():
+        before, after = result["before"], result["after"]
+        print(f"{name:6} before {before:12,.0f} cells/s  after {after:12,.0f} cells/s  x{after / before:.1f}")
@@ -0,0 +1,189 @@
+# Repeatable end to end benchmarks on a generated CSV and schema: schema
+# parse time, then rows/s, cells/s and peak memory for each way of
+# validating. Results are saved as JSON, and --compare reports the
+# changes from an earlier run, failing on regressions.
+#
+#   python -m benchmarks.run --rows 100000 --output before.json
+#   python -m benchmarks.run --rows 100000 --compare before.json
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+import csvs_parser
+from batch_validators import np
+from csv_validator import CSV_Stream_Validator, CSV_Threaded_Validator
+from csvs_compiler import compile_rules, load_schema
+from benchmarks.generate import DEFAULT_KINDS, generate
+
+# Relative slowdown, or growth in peak memory, counted as a regression
+THRESHOLD = 0.10
+
+MODES = {
+    "stream": lambda csv_file, rules: CSV_Stream_Validator(csv_file, rules, max_errors=None),
+    "block": lambda csv_file, rules: CSV_Stream_Validator(csv_file, rules, block_size=1024,
+                                                          max_errors=None),
+    "threads": lambda csv_file, rules: CSV_Threaded_Validator(csv_file, rules, workers=4,
+                                                              max_errors=None),
+}
+if np is not None:
+    MODES["block_numpy"] = lambda csv_file, rules: CSV_Stream_Validator(
+        csv_file, rules, block_size=1024, use_numpy=True, max_errors=None)
+
+
+def timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def peak_memory(function):
+    # Peak of Python allocations while function runs
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def parse_times(schema_file, repeat):
+    with tempfile.TemporaryDirectory() as cache_dir:
+        def cold():
+            csvs_parser._lark_parsers.clear()
+            load_schema(schema_file, cache_dir=None)
+
+        def cached():
+            load_schema(schema_file, cache_dir=cache_dir)
+
+        # Fill the cache once
+        cached()
+        results = {
+            "parse_cold_s": min(timed(cold) for _ in range(repeat)),
+            "parse_cached_s": min(timed(cached) for _ in range(repeat)),
+        }
+    csvs_parser._lark_parsers.clear()
+    return results
+
+
+def run(rows, columns, kinds=None, repeat=3, modes=None, invalid_rate=0.0, seed=1):
+    with tempfile.TemporaryDirectory() as out_dir:
+        csv_file, schema_file = generate(out_dir, rows, columns, kinds, invalid_rate, seed)
+        results = {"schema": parse_times(schema_file, repeat), "modes": {}}
+        rules = compile_rules(load_schema(schema_file, cache_dir=None))
+        for mode in modes or MODES:
+            make_validator = MODES[mode]
+
+            def validate():
+                validator = make_validator(csv_file, rules)
+                validator.check()
+                return validator
+
+            errors = validate().error_count
+            seconds = min(timed(validate) for _ in range(repeat))
+            results["modes"][mode] = {
+                "seconds": seconds,
+                "rows_per_s": rows / seconds,
+                "cells_per_s": rows * columns / seconds,
+                "peak_memory_bytes": peak_memory(validate),
+                "errors": errors,
+            }
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "numpy": np.__version__ if np is not None else None,
+        "commit": commit,
+    }
+
+
+def _measurements(report):
+    # (group, name) -> (value, whether higher is better)
+    results = report["results"]
+    measurements = {("schema", name): (value, False) for name, value in results["schema"].items()}
+    for mode, result in results["modes"].items():
+        measurements[(mode, "rows_per_s")] = (result["rows_per_s"], True)
+        measurements[(mode, "peak_memory_bytes")] = (result["peak_memory_bytes"], False)
+    return measurements
+
+
+def compare(old, new, threshold=THRESHOLD):
+    # Lines describing the change in each measurement and whether any got
+    # worse by more than threshold
+    lines = []
+    regressed = False
+    old_measurements = _measurements(old)
+    for (group, name), (after, higher_is_better) in _measurements(new).items():
+        if (group, name) not in old_measurements:
+            continue
+        before = old_measurements[(group, name)][0]
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        lines.append(f"{group:12} {name:18} {before:14,.4g} -> {after:14,.4g} {change:+8.1%}{flag}")
+    return lines, regressed
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark validation of a synthetic CSV.")
+    arg_parser.add_argument('--rows', type=int, default=100000)
+    arg_parser.add_argument('--columns', type=int, default=len(DEFAULT_KINDS))
+    arg_parser.add_argument('--kinds', nargs='+', help="Kinds of column from benchmarks.generate.")
+    arg_parser.add_argument('--modes', nargs='+', choices=list(MODES))
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--invalid-rate', type=float, default=0.0)
+    arg_parser.add_argument('--seed', type=int, default=1)
+    arg_parser.add_argument('--output', help="Save the results to this JSON file.")
+    arg_parser.add_argument('--compare', help="Earlier results to compare with.")
+    arg_parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                            help="Relative change counted as a regression.")
+    args = arg_parser.parse_args()
+
+    params = {
+        "rows": args.rows, "columns": args.columns, "kinds": args.kinds or DEFAULT_KINDS,
+        "repeat": args.repeat, "invalid_rate": args.invalid_rate, "seed": args.seed,
+    }
+    report = {
+        "params": params,
+        "environment": environment(),
+        "results": run(args.rows, args.columns, args.kinds, args.repeat, args.modes,
+                       args.invalid_rate, args.seed),
+    }
+
+    for name, seconds in report["results"]["schema"].items():
+        print(f"{name:18} {seconds * 1000:10.1f} ms")
+    for mode, result in report["results"]["modes"].items():
+        print(f"{mode:18} {result['rows_per_s']:12,.0f} rows/s {result['cells_per_s']:14,.0f} cells/s "
+              f"{result['peak_memory_bytes'] / 1024 / 1024:8.1f} MiB peak")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if old["params"] != params:
+            print("Warning: the earlier run used different parameters.")
+        lines, regressed = compare(old, report, args.threshold)
+        print("\n".join(lines))
+        if regressed:
+            raise SystemExit(1)
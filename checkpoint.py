@@ -0,0 +1,272 @@
+import csv
+import hashlib
+import io
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from compressed_input import detect_compression
+from csv_validator import CSV_Stream_Validator
+from parallel_validator import BLOCK_SIZE, read_header
+
+logger = logging.getLogger(__name__)
+
+# Bump when the checkpoint contents change so old ones are ignored
+CHECKPOINT_VERSION = 2
+# Bytes hashed from each end of the validated part of the file. Hashing
+# all of it would cost a read of the whole file every run, this catches a
+# file that was replaced, truncated or rewritten at either end.
+FINGERPRINT_SAMPLE = 1024 * 1024
+
+
+def fingerprint(csv_file, offset):
+    # Digest of the first offset bytes of the file, sampled at both ends
+    digest = hashlib.blake2b(offset.to_bytes(8, "big"), digest_size=16)
+    with open(csv_file, "rb") as f:
+        if offset <= 2 * FINGERPRINT_SAMPLE:
+            digest.update(f.read(offset))
+        else:
+            digest.update(f.read(FINGERPRINT_SAMPLE))
+            f.seek(offset - FINGERPRINT_SAMPLE)
+            digest.update(f.read(FINGERPRINT_SAMPLE))
+    return digest.hexdigest()
+
+
+def record_end(csv_file, start, block_size=BLOCK_SIZE):
+    # Offset just after the last complete record from start, which has to
+    # be on a record boundary. As in find_chunks a newline only ends a
+    # record with an even number of quotes before it. The quote parity at
+    # the start of each block is found going forwards, then the newlines
+    # are tried from the end of the file backwards.
+    blocks = []
+    parity = 0
+    with open(csv_file, "rb") as f:
+        f.seek(start)
+        offset = start
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            blocks.append((offset, parity))
+            parity ^= block.count(b'"') & 1
+            offset += len(block)
+        for block_start, block_parity in reversed(blocks):
+            f.seek(block_start)
+            block = f.read(block_size)
+            end = len(block)
+            while True:
+                end = block.rfind(b"\n", 0, end)
+                if end == -1:
+                    break
+                if not block_parity ^ (block.count(b'"', 0, end) & 1):
+                    return block_start + end + 1
+    return start
+
+
+def rules_digest(rules):
+    # Changes whenever anything in the schema that affects the result does
+    parts = [repr(sorted(rules["@global_directives"].items()))]
+    for key, rule in rules.items():
+        if key != "@global_directives":
+            exprs = rule["exprs"] + rule.get("aggregate_exprs", [])
+            parts.append(repr((rule["name"], sorted(rule["directives"].items()), list(map(str, exprs)))))
+    return hashlib.blake2b("\n".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def snapshot_dir(checkpoint_file):
+    # Where rules like unique keep their state between runs, next to the
+    # checkpoint rather than in it so it never has to fit in memory
+    checkpoint_file = Path(checkpoint_file).resolve()
+    return checkpoint_file.with_name(checkpoint_file.name + ".d")
+
+
+def load_checkpoint(checkpoint_file):
+    try:
+        with open(checkpoint_file, "rb") as f:
+            checkpoint = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if not isinstance(checkpoint, dict) or checkpoint.get("version") != CHECKPOINT_VERSION:
+        return None
+    return checkpoint
+
+
+def save_checkpoint(checkpoint_file, checkpoint):
+    checkpoint_dir = Path(checkpoint_file).resolve().parent
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    # Write then rename so an interrupted run leaves the old checkpoint
+    fd, tmp_name = tempfile.mkstemp(dir=checkpoint_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(dict(checkpoint, version=CHECKPOINT_VERSION), f)
+        os.replace(tmp_name, checkpoint_file)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+class CSV_Checkpoint_Validator(CSV_Stream_Validator):
+    # Validates a file that is only ever appended to, carrying on from
+    # where the last run stopped. checkpoint_file keeps the byte offset and
+    # row number after the last record checked, a fingerprint of the file
+    # up to there, the error and warning counts so far and the state of
+    # rules like unique. The checkpoint only covers complete records, so a
+    # last record without a line ending is checked again by the next run.
+    # The checkpoint is only moved on when a run gets to the end without
+    # being stopped by max_errors.
+    def __init__(self, csv_file, rules, checkpoint_file, encoding="utf-8", block_size=0,
+                 use_numpy=False, max_errors=1, issue_writer=None):
+        if not isinstance(csv_file, (str, os.PathLike)):
+            raise ValueError("Checkpoints need a CSV file path")
+        if detect_compression(csv_file):
+            raise ValueError("Checkpoints need an uncompressed CSV file")
+        super().__init__(csv_file, rules, encoding, block_size, use_numpy, max_errors,
+                         issue_writer)
+        self.checkpoint_file = checkpoint_file
+        # Byte range of the records checked by this run
+        self.start_offset = 0
+        self.end_offset = 0
+        self._checkpoint = None
+        self._rows_read = 0
+        # Whether every complete record was checked
+        self._finished = False
+
+    def _resume(self, checkpoint, data_start):
+        # Reason the checkpoint can't be used, or None
+        if checkpoint is None:
+            return "no checkpoint"
+        if checkpoint["csv_file"] != os.path.abspath(self.csv_file):
+            return "checkpoint is for another file"
+        if checkpoint["rules"] != rules_digest(self.rules):
+            return "schema has changed"
+        if checkpoint["offset"] < data_start or checkpoint["offset"] > os.path.getsize(self.csv_file):
+            return "file is shorter than the checkpoint"
+        if checkpoint["fingerprint"] != fingerprint(self.csv_file, checkpoint["offset"]):
+            return "file has changed before the checkpoint"
+        for name, size in checkpoint["files"].items():
+            path = snapshot_dir(self.checkpoint_file) / name
+            if not path.is_file() or path.stat().st_size != size:
+                return f"{path} is missing or has changed"
+        return None
+
+    def check(self):
+        data_start = 0
+        if self.rules["@global_directives"]["header"]:
+            _record, data_start = read_header(self.csv_file)
+        checkpoint = load_checkpoint(self.checkpoint_file)
+        reason = self._resume(checkpoint, data_start)
+        if reason is None:
+            logger.info("Carrying on from row %d, byte %d", checkpoint["rows"], checkpoint["offset"])
+            self._checkpoint = checkpoint
+            self.start_offset = checkpoint["offset"]
+            self.first_row = checkpoint["rows"]
+            self.error_count = checkpoint["error_count"]
+            self.warning_count = checkpoint["warning_count"]
+        else:
+            logger.info("Checking from the start, %s", reason)
+            self._checkpoint = None
+            self.start_offset = data_start
+            self.first_row = 0
+        self.end_offset = record_end(self.csv_file, self.start_offset)
+        self._rows_read = 0
+        self._finished = False
+        super().check()
+        if self._finished and os.path.getsize(self.csv_file) > self.end_offset:
+            self._check_last_record()
+        return not self.error_count
+
+    def _check_last_record(self):
+        # A last record without a line ending may still be being written,
+        # so the checkpoint stops before it. It's checked against its
+        # column's rules all the same, but only goes into the checkpoint
+        # and rules like unique once it's complete.
+        logger.warning("The last record has no line ending, it's checked but left for the next "
+                       "run's checkpoint and cross-row rules")
+        delimiter = self.rules['@global_directives']['separator']
+        with open(self.csv_file, "rb") as f:
+            f.seek(self.end_offset)
+            text = f.read().decode(self.encoding)
+        row_num = self.first_row + self._rows_read
+        for row in csv.reader(io.StringIO(text, newline=""), delimiter=delimiter):
+            for error in self._row_errors(row):
+                if not self._report(row_num, *error):
+                    return
+            row_num += 1
+
+    def _rows(self):
+        delimiter = self.rules['@global_directives']['separator']
+        with open(self.csv_file, "rb") as f:
+            if self.rules["@global_directives"]["header"]:
+                record, _data_start = read_header(self.csv_file)
+                yield from csv.reader([record.decode(self.encoding)], delimiter=delimiter)
+            f.seek(self.start_offset)
+            for row in csv.reader(self._lines(f), delimiter=delimiter):
+                self._rows_read += 1
+                yield row
+
+    def _lines(self, f):
+        # Lines of the byte range being checked
+        position = self.start_offset
+        for line in f:
+            position += len(line)
+            if position > self.end_offset:
+                return
+            yield line.decode(self.encoding)
+
+    def _start_aggregates(self):
+        super()._start_aggregates()
+        if self._checkpoint is None:
+            return
+        snapshots = self._checkpoint["aggregates"]
+        for index, state, rule, _severity in self._aggregates:
+            state.restore(snapshots[(index, rule)])
+
+    def _finish_aggregates(self):
+        # Every row has been checked, so this is where the next run
+        # carries on from. Issues found at the end, like orphaned files,
+        # are found again by every run.
+        files = self._save()
+        self._finished = True
+        try:
+            return super()._finish_aggregates()
+        finally:
+            if files is not None:
+                self._remove_old_snapshots(files)
+
+    def _save(self):
+        # Names of the files in snapshot_dir the new checkpoint uses, or
+        # None if it couldn't be saved
+        directory = snapshot_dir(self.checkpoint_file)
+        directory.mkdir(parents=True, exist_ok=True)
+        before = set(os.listdir(directory))
+        aggregates = {}
+        for index, state, rule, _severity in self._aggregates:
+            if not hasattr(state, "snapshot"):
+                logger.warning("%s can't be saved in a checkpoint", rule)
+                return None
+            aggregates[(index, rule)] = state.snapshot(directory)
+        files = {name: os.path.getsize(directory / name)
+                 for name in set(os.listdir(directory)) - before}
+        save_checkpoint(self.checkpoint_file, {
+            "csv_file": os.path.abspath(self.csv_file),
+            "rules": rules_digest(self.rules),
+            "offset": self.end_offset,
+            "rows": self.first_row + self._rows_read,
+            "fingerprint": fingerprint(self.csv_file, self.end_offset),
+            "error_count": self.error_count,
+            "warning_count": self.warning_count,
+            "aggregates": aggregates,
+            "files": files,
+        })
+        return files
+
+    def _remove_old_snapshots(self, files):
+        # Once the old checkpoint's state has been read, only the files
+        # of the new one are kept
+        directory = snapshot_dir(self.checkpoint_file)
+        for name in set(os.listdir(directory)) - set(files):
+            try:
+                os.unlink(directory / name)
+            except OSError:
+                pass
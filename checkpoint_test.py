@@ -0,0 +1,133 @@
+import pytest
+import checkpoint
+from checkpoint import CSV_Checkpoint_Validator, fingerprint, record_end, snapshot_dir
+from csv_validator import CSV_Stream_Validator
+from csvs_compiler import load_rules
+from unique_index import ENTRY_SIZE, RECORD
+
+SCHEMA = """version 1.0
+@totalColumns 2
+id: unique
+note: notEmpty
+"""
+
+
+@pytest.fixture
+def rules(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(SCHEMA)
+    return load_rules(schema_file, cache_dir=None)
+
+
+def _check(csv_file, rules, checkpoint_file):
+    validator = CSV_Checkpoint_Validator(csv_file, rules, checkpoint_file, max_errors=None)
+    valid = validator.check()
+    return valid, validator
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 1024])
+def test_record_end(tmp_path, block_size):
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_bytes(b'a,b\n1,"x\ny"\n2,"z\n')
+    # The last newline is inside an unfinished quoted field
+    assert record_end(csv_file, 0, block_size) == 12
+    assert record_end(csv_file, 12, block_size) == 12
+    csv_file.write_bytes(b'a,b\n1,2')
+    assert record_end(csv_file, 0, block_size) == 4
+
+
+def test_fingerprint_samples_ends(tmp_path, monkeypatch):
+    monkeypatch.setattr(checkpoint, "FINGERPRINT_SAMPLE", 4)
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_bytes(b"0123456789abcdef")
+    before = fingerprint(csv_file, 12)
+    csv_file.write_bytes(b"0123XXXX89abcdef")
+    # Only the first and last 4 bytes are read
+    assert fingerprint(csv_file, 12) == before
+    csv_file.write_bytes(b"0123456789aXcdef")
+    assert fingerprint(csv_file, 12) != before
+    assert fingerprint(csv_file, 16) != fingerprint(csv_file, 12)
+
+
+def test_resume(tmp_path, rules, monkeypatch):
+    csv_file = tmp_path / "data.csv"
+    checkpoint_file = tmp_path / "data.checkpoint"
+    csv_file.write_text("id,note\n1,a\n2,b\n3,")
+    valid, validator = _check(csv_file, rules, checkpoint_file)
+    # The last record has no line ending yet, so it's checked but the
+    # checkpoint waits for it in the next run
+    assert not valid and validator.end_offset == len("id,note\n1,a\n2,b\n")
+    assert [(issue.row, issue.column) for issue in validator.issues] == [(2, 1)]
+    assert checkpoint.load_checkpoint(checkpoint_file)["error_count"] == 0
+
+    # Only the new rows are read, and unique remembers the old ones
+    with open(csv_file, "a") as f:
+        f.write("c\n4,d\n1,e\n")
+    valid, validator = _check(csv_file, rules, checkpoint_file)
+    assert not valid
+    assert validator.first_row == 2
+    assert [(issue.row, issue.message) for issue in validator.issues] == [(4, "Duplicate of row 0!")]
+
+    # Earlier errors still make the file invalid
+    with open(csv_file, "a") as f:
+        f.write("5,f\n")
+    valid, validator = _check(csv_file, rules, checkpoint_file)
+    assert not valid and validator.issues == [] and validator.error_count == 1
+
+    # Every issue matches a check of the whole file
+    full = CSV_Stream_Validator(csv_file, rules, max_errors=None)
+    full.check()
+    assert [(issue.row, issue.message) for issue in full.issues] == [(4, "Duplicate of row 0!")]
+
+
+def test_changed_file_starts_again(tmp_path, rules):
+    csv_file = tmp_path / "data.csv"
+    checkpoint_file = tmp_path / "data.checkpoint"
+    csv_file.write_text("id,note\n1,a\n2,b\n")
+    assert _check(csv_file, rules, checkpoint_file)[0]
+    csv_file.write_text("id,note\n1,a\n1,b\n3,c\n")
+    valid, validator = _check(csv_file, rules, checkpoint_file)
+    assert validator.first_row == 0 and not valid
+
+    # A different schema doesn't use the checkpoint either
+    assert _check(csv_file, rules, checkpoint_file)[1].first_row == 3
+    rules[1]["directives"]["warning"] = True
+    assert _check(csv_file, rules, checkpoint_file)[1].first_row == 0
+
+
+def test_stopped_run_keeps_checkpoint(tmp_path, rules):
+    csv_file = tmp_path / "data.csv"
+    checkpoint_file = tmp_path / "data.checkpoint"
+    csv_file.write_text("id,note\n1,a\n")
+    assert _check(csv_file, rules, checkpoint_file)[0]
+    with open(csv_file, "a") as f:
+        f.write("2,\n3,\n")
+    validator = CSV_Checkpoint_Validator(csv_file, rules, checkpoint_file, max_errors=1)
+    assert not validator.check()
+    assert _check(csv_file, rules, checkpoint_file)[1].first_row == 1
+
+
+def test_unique_state_beside_checkpoint(tmp_path, rules):
+    rules[0]["aggregates"][0].memory_budget = ENTRY_SIZE * 8
+    csv_file = tmp_path / "data.csv"
+    checkpoint_file = tmp_path / "data.checkpoint"
+    csv_file.write_text("id,note\n" + "".join(f"{n},a\n" for n in range(100)))
+    assert _check(csv_file, rules, checkpoint_file)[0]
+    # The digests are in a run file, not the checkpoint
+    (run,) = snapshot_dir(checkpoint_file).iterdir()
+    assert run.stat().st_size == 100 * RECORD.size
+    assert checkpoint_file.stat().st_size < run.stat().st_size
+
+    with open(csv_file, "a") as f:
+        f.write("100,a\n42,a\n")
+    valid, validator = _check(csv_file, rules, checkpoint_file)
+    assert not valid and validator.first_row == 100
+    assert [(issue.row, issue.message) for issue in validator.issues] == [(101, "Duplicate of row 42!")]
+    # The old run is replaced by one with the new first rows, the reported
+    # repeat is left out
+    (new_run,) = snapshot_dir(checkpoint_file).iterdir()
+    assert new_run != run and new_run.stat().st_size == 101 * RECORD.size
+
+    # Without its run the checkpoint can't be used
+    new_run.unlink()
+    assert _check(csv_file, rules, checkpoint_file)[1].first_row == 0
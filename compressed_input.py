@@ -0,0 +1,111 @@
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import threading
+import zlib
+
+# Magic bytes at the start of each supported format, and how to open it.
+# Files are recognised by their contents whatever they're called.
+COMPRESSIONS = {
+    "gzip": (b"\x1f\x8b", gzip.open),
+    "bz2": (b"BZh", bz2.open),
+    "xz": (b"\xfd7zXZ\x00", lzma.open),
+}
+# Decompressed bytes in each piece handed from the read ahead thread, and
+# the number of pieces it can get ahead by. Memory stays under their
+# product whatever the size of the file.
+READ_AHEAD_SIZE = 1024 * 1024
+READ_AHEAD_PIECES = 8
+# Raised by the decompressors for a truncated or corrupt file. bz2 and
+# gzip raise OSError for some of these already.
+DECOMPRESSION_ERRORS = (EOFError, lzma.LZMAError, zlib.error)
+
+
+def detect_compression(csv_file):
+    # Name of the compression used by csv_file, or None
+    try:
+        with open(csv_file, "rb") as f:
+            head = f.read(max(len(magic) for magic, _open in COMPRESSIONS.values()))
+    except OSError:
+        return None
+    for name, (magic, _open) in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+class ReadAheadReader(io.RawIOBase):
+    # Reads source on its own thread so decompressing the next pieces of
+    # the file overlaps with validating the rows already read. The
+    # decompressors release the GIL while they work.
+    def __init__(self, source, piece_size=READ_AHEAD_SIZE, pieces=READ_AHEAD_PIECES):
+        self._source = source
+        self._pieces = queue.Queue(pieces)
+        self._stop = threading.Event()
+        self._piece = memoryview(b"")
+        self._done = False
+        self._thread = threading.Thread(target=self._read_ahead, args=(piece_size,), daemon=True)
+        self._thread.start()
+
+    def _read_ahead(self, piece_size):
+        try:
+            while not self._stop.is_set():
+                piece = self._source.read(piece_size)
+                self._put(piece)
+                if not piece:
+                    return
+        except DECOMPRESSION_ERRORS as e:
+            # A truncated or corrupt file, raised as an OSError like any
+            # other file that can't be read
+            error = OSError(f"Can't decompress the file: {e}")
+            error.__cause__ = e
+            self._put(error)
+        except Exception as e:
+            # Raised again on the reading thread
+            self._put(e)
+
+    def _put(self, item):
+        # Waits for room, unless the reader has been closed
+        while not self._stop.is_set():
+            try:
+                self._pieces.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._piece:
+            if self._done:
+                return 0
+            item = self._pieces.get()
+            if isinstance(item, Exception):
+                self._done = True
+                raise item
+            if not item:
+                self._done = True
+                return 0
+            self._piece = memoryview(item)
+        size = min(len(buffer), len(self._piece))
+        buffer[:size] = self._piece[:size]
+        self._piece = self._piece[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            # The validator can stop early, e.g. at max_errors
+            self._stop.set()
+            self._thread.join()
+            self._source.close()
+        super().close()
+
+
+def open_decompressed(csv_file, compression=None, piece_size=READ_AHEAD_SIZE,
+                      pieces=READ_AHEAD_PIECES):
+    # Binary file of the decompressed contents of csv_file
+    _magic, open_compressed = COMPRESSIONS[compression or detect_compression(csv_file)]
+    return io.BufferedReader(ReadAheadReader(open_compressed(csv_file, "rb"), piece_size, pieces))
@@ -0,0 +1,99 @@
+import bz2
+import gzip
+import io
+import lzma
+import pytest
+from batch_validator import CSV_Batch_Validator
+from compressed_input import ReadAheadReader, detect_compression, open_decompressed
+from csv_validator import CSV_Stream_Validator
+from csvs_compiler import load_rules
+from parallel_validator import CSV_Parallel_Validator
+
+SCHEMA = """version 1.0
+@totalColumns 2
+id: range(0, 1000000)
+note: notEmpty
+"""
+
+COMPRESS = {"gzip": gzip.compress, "bz2": bz2.compress, "xz": lzma.compress}
+
+
+def _csv(rows):
+    lines = ["id,note"] + [f"{i},{'' if i % 1000 == 7 else 'x'}" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+@pytest.fixture
+def schema_file(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(SCHEMA)
+    return schema_file
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESS))
+def test_detect_compression(tmp_path, compression):
+    # The name doesn't matter, only the contents
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_bytes(COMPRESS[compression](b"id,note\n"))
+    assert detect_compression(csv_file) == compression
+    csv_file.write_bytes(b"id,note\n")
+    assert detect_compression(csv_file) is None
+    assert detect_compression(tmp_path / "missing.csv") is None
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESS))
+def test_stream_compressed(tmp_path, schema_file, compression):
+    csv_file = tmp_path / "data.csv.z"
+    csv_file.write_bytes(COMPRESS[compression](_csv(5000)))
+    validator = CSV_Stream_Validator(csv_file, load_rules(schema_file, cache_dir=None),
+                                     max_errors=None)
+    assert not validator.check()
+    assert [issue.row for issue in validator.issues] == [7, 1007, 2007, 3007, 4007]
+
+
+def test_read_ahead_pieces():
+    data = bytes(range(256)) * 100
+    reader = io.BufferedReader(ReadAheadReader(io.BytesIO(data), piece_size=1000, pieces=2), 333)
+    assert reader.read() == data
+    reader.close()
+
+
+def test_read_ahead_stops_when_closed():
+    # Closing part way through doesn't wait for the rest of the file
+    reader = ReadAheadReader(io.BytesIO(b"x" * 10 ** 6), piece_size=10, pieces=1)
+    assert reader.read(5) == b"xxxxx"
+    reader.close()
+    assert not reader._thread.is_alive()
+
+
+@pytest.mark.parametrize("compression", sorted(COMPRESS))
+@pytest.mark.parametrize("damage", ["truncated", "corrupt"])
+def test_damaged_file(tmp_path, compression, damage):
+    data = COMPRESS[compression](_csv(1000))
+    if damage == "truncated":
+        data = data[:-20]
+    else:
+        data = data[:len(data) // 2] + bytes(64) + data[len(data) // 2 + 64:]
+    csv_file = tmp_path / "data.csv.z"
+    csv_file.write_bytes(data)
+    with open_decompressed(csv_file) as f:
+        with pytest.raises(OSError):
+            f.read()
+
+
+def test_damaged_file_in_batch(tmp_path, schema_file):
+    (tmp_path / "bad.csv.xz").write_bytes(lzma.compress(_csv(1000))[:100] + bytes(100))
+    (tmp_path / "good.csv.gz").write_bytes(gzip.compress(_csv(5)))
+    csv_files = [str(tmp_path / name) for name in ("bad.csv.xz", "good.csv.gz")]
+    validator = CSV_Batch_Validator(csv_files, schema_file, workers=1)
+    assert not validator.check()
+    assert [result["valid"] for result in validator.results] == [False, True]
+    assert validator.results[0]["error"].startswith("OSError: Can't decompress")
+
+
+def test_parallel_checks_compressed_in_one_process(tmp_path, schema_file):
+    csv_file = tmp_path / "data.csv.gz"
+    csv_file.write_bytes(gzip.compress(_csv(2000)))
+    validator = CSV_Parallel_Validator(csv_file, schema_file, workers=2, max_errors=None)
+    assert not validator.check()
+    assert [issue.row for issue in validator.issues] == [7, 1007]
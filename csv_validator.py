@@ -1,110 +1,526 @@
 #! /usr/bin/env python
 
-from csvs_parser import CSVS_Parser, CSVS_Transformer
-import csv
+from compressed_input import detect_compression, open_decompressed
+from csvs_codegen import compile_row_validator
+from csvs_compiler import MEMO_SIZE, column_memo, compile_rules, load_schema
+from batch_validators import compile_batch_expr, first_invalid, np
+from external_validators import clear_prefetched_checksums, configure_checksums, configure_file_index
+from rule_profiler import RuleProfiler
+from validation_results import ERROR, WARNING, ValidationIssue, open_issue_writer
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import argparse
-from pprint import pprint
+import csv
+import heapq
+import io
+import itertools
+import logging
+import os
+import sys
+from pprint import pformat
+
+logger = logging.getLogger(__name__)
+
+# Rows read ahead of the one being validated so rules like checksum can
+# start their slow work early
+PREFETCH_ROWS = 256
+# Row after which each column's memo is kept only if at least
+# MEMO_MIN_HIT_RATE of its lookups were hits, as a miss costs more than
+# not having a memo
+MEMO_REVIEW_ROW = 1024
+MEMO_MIN_HIT_RATE = 0.5
+
+
+def _finish_stream(state, index, rule, severity):
+    # A cross-row check's issues from finish(), as arguments to _report
+    try:
+        for row_num, value, message in state.finish():
+            yield row_num, index, value, message, rule, severity
+    finally:
+        state.close()
 
 
 class CSV_Validator:
-    def __init__(self, csv_file, rules):
+    # Values kept by each memoized column, 0 to turn memos off
+    memo_size = MEMO_SIZE
+
+    # With block_size set, rows are read in blocks of that many and each
+    # column of the block is checked at once by the batch validators.
+    # use_numpy hands them the columns as NumPy arrays.
+    # Checking stops after max_errors errors, None for no limit. Issues
+    # are kept in self.issues, or written to issue_writer if there is one.
+    # With a RuleProfiler every validator is timed and counted by it.
+    def __init__(self, csv_file, rules, block_size=0, use_numpy=False, max_errors=1,
+                 issue_writer=None, profiler=None):
         self.csv_file = csv_file
+        self.profiler = profiler
+        if profiler is not None:
+            rules = profiler.profile_rules(rules)
         self.rules = rules
+        self.block_size = block_size
+        self.use_numpy = use_numpy and np is not None
+        self.max_errors = max_errors
+        self.issue_writer = issue_writer
         self.column_index = {}
         self.column_map = {}
         self.column_name_map = {}
+        # Number of the first row checked, past 0 when carrying on from
+        # an earlier run
+        self.first_row = 0
+        self.issues = []
+        self.error_count = 0
+        self.warning_count = 0
+        # (column number, state, rule, severity) of the rules checked
+        # across rows
+        self._aggregates = []
+        # Checks a row once the header is read, a function generated for
+        # the schema when there is one
+        self._row_errors = self._interpret_row
+        # Memo of each column whose result only depends on its value, all
+        # of this run's and the ones still in use
+        self._memos = {}
+        self._active_memos = {}
+        self._memo_review_row = MEMO_REVIEW_ROW
 
     def __repr__(self):
         return self.csv_file
 
-    def check(self):
+    @property
+    def errors(self):
+        # (row number, column number, value) of each error
+        return [(issue.row, issue.column, issue.value) for issue in self.issues
+                if issue.severity == ERROR]
+
+    def _rows(self):
+        # csv_file is the whole CSV as a string
         delimiter = self.rules['@global_directives']['separator']
-        csv_file = csv.reader(
-            self.csv_file.splitlines(),
-            delimiter=delimiter)
-        csv_list = []
-        for row in csv_file:
-            csv_list.append(row)
+        return csv.reader(io.StringIO(self.csv_file, newline=""), delimiter=delimiter)
+
+    def check(self):
+        rows = iter(self._rows())
+        if not self._read_header(rows):
+            return False
+        self._compile_row_errors()
+        self._start_aggregates()
+        rows = self._prefetch(rows)
+        try:
+            if self.block_size:
+                finished = self._check_blocks(rows)
+            else:
+                finished = self._check_rows(rows)
+            if finished:
+                self._finish_aggregates()
+        finally:
+            for _index, state, _rule, _severity in self._aggregates:
+                state.close()
+            clear_prefetched_checksums()
+        return not self.error_count
+
+    def _read_header(self, rows):
         # Check the header if needed
         if self.rules["@global_directives"]["header"]:
-            # Is there a total columns directive?
-            if self.rules["@global_directives"].get("total_columns", 0):
-                if len(csv_list[0]) != self.rules["@global_directives"]["total_columns"]:
-                    print("Wrong number of columns in the header.")
-                    found = len(csv_list[0])
-                    expected = self.rules["@global_directives"]["total_columns"]
-                    print(f"Found {found} expected {expected}.")
-                    return False
-            # TODO: Allow optional columns
-            col_names = csv_list[0].copy()
-            col_num = 0
-            cur_col = col_names.pop(0)
-            for key in self.rules:
-                if key != "@global_directives":
-                    csvs_name = self.rules[key]["name"]
-                    if len(col_names) >= 0:
-                        # Optional Columns
-                        if self.rules[key]["directives"]["optional"]:
-                            # Optional column found
-                            if cur_col == csvs_name:
-                                print(f"Optional key \"{csvs_name}\" found, adding at column {col_num}.")
-                                self.column_index[csvs_name] = col_num
-                                self.column_map[col_num] = key
-                                if col_names:
-                                    cur_col = col_names.pop(0)
-                                else:  # Empty list
-                                    continue
-                                col_num += 1
-                            # Optional column not found, continue
-                            else:
-                                print(f"Optional key \"{csvs_name}\" not found, continuing.")
+            header = next(rows, None)
+            if header is None:
+                self._header_error("No header found.")
+                return False
+            return self._check_header(header)
+        self._map_columns()
+        return True
+
+    def _check_rows(self, rows):
+        # Evaluate each row, False if checking stopped early
+        for row_num, row in enumerate(rows, self.first_row):
+            if not self._check_row(row_num, row):
+                return False
+        return True
+
+    def _map_columns(self):
+        # No header, so the columns are in schema order
+        col_num = 0
+        for key in self.rules:
+            if key != "@global_directives":
+                csvs_name = self.rules[key]["name"]
+                self.column_index[csvs_name] = col_num
+                self.column_map[col_num] = key
+                self.column_name_map[csvs_name] = col_num
+                col_num += 1
+
+    def _check_header(self, header):
+        # Is there a total columns directive?
+        if self.rules["@global_directives"].get("total_columns", 0):
+            if len(header) != self.rules["@global_directives"]["total_columns"]:
+                found = len(header)
+                expected = self.rules["@global_directives"]["total_columns"]
+                self._header_error(f"Wrong number of columns in the header. "
+                                   f"Found {found} expected {expected}.")
+                return False
+        # A blank first line is read as a header with no columns
+        if not header:
+            self._header_error("Empty header.")
+            return False
+        # TODO: Allow optional columns
+        col_names = header.copy()
+        col_num = 0
+        cur_col = col_names.pop(0)
+        for key in self.rules:
+            if key != "@global_directives":
+                csvs_name = self.rules[key]["name"]
+                if len(col_names) >= 0:
+                    # Optional Columns
+                    if self.rules[key]["directives"]["optional"]:
+                        # Optional column found
+                        if cur_col == csvs_name:
+                            logger.info("Optional key \"%s\" found, adding at column %d.", csvs_name, col_num)
+                            self.column_index[csvs_name] = col_num
+                            self.column_map[col_num] = key
+                            if col_names:
+                                cur_col = col_names.pop(0)
+                            else:  # Empty list
                                 continue
-                        # Non-optional Columns
+                            col_num += 1
+                        # Optional column not found, continue
                         else:
-                            # Non-optional column found
-                            if cur_col == csvs_name:
-                                print(f"Key \"{csvs_name}\" found, adding at column {col_num}")
-                                self.column_index[csvs_name] = col_num
-                                self.column_map[col_num] = key
-                                self.column_name_map[cur_col] = col_num
-                                if col_names:
-                                    cur_col = col_names.pop(0)
-                                else:  # Empty list
-                                    continue
-                                col_num += 1
-                            # Non-optional column not found
-                            else:
-                                print(f"Key \"{csvs_name}\" not found. Failed!")
-                                return False
-            # print(self.column_index)
-            # Pop the header off the front
-            csv_list = csv_list[1:]
-        # Evaluate each row
-        for row_num, row in enumerate(csv_list):
-            for index, value in enumerate(row):
-                # Key in the rules for the column
-                key = self.column_map[index]
-                directives = self.rules[key]["directives"]
-                functions = self.rules[key]["functions"]
-                for function in functions:
-                    print("FUNCTION", function)
-                    if type(function) is tuple:
-                        print("CONTEXT: ")
-                        for i in function:
-                            print("\t", i)
+                            logger.info("Optional key \"%s\" not found, continuing.", csvs_name)
+                            continue
+                    # Non-optional Columns
                     else:
-                        if directives["matchIsFalse"]:
-                            if function(value, row, self.column_name_map):
-                                print("Invalid element!")
-                                print(f"[{row_num}, {index}]: \"{value}\"")
-                                return False
+                        # Non-optional column found
+                        if cur_col == csvs_name:
+                            logger.info("Key \"%s\" found, adding at column %d", csvs_name, col_num)
+                            self.column_index[csvs_name] = col_num
+                            self.column_map[col_num] = key
+                            self.column_name_map[cur_col] = col_num
+                            if col_names:
+                                cur_col = col_names.pop(0)
+                            else:  # Empty list
+                                continue
+                            col_num += 1
+                        # Non-optional column not found
                         else:
-                            if not function(value, row, self.column_name_map):
-                                print("Invalid element!")
-                                print(f"[{row_num}, {index}]: \"{value}\"")
-                                return False
+                            self._header_error(f"Key \"{csvs_name}\" not found.", cur_col)
+                            return False
+        return True
+
+    def _header_error(self, message, value=None):
+        self._add_issue(ValidationIssue(None, None, None, "header", value, ERROR, message))
+
+    def _prefetch(self, rows):
+        prefetchers = [
+            (index, prefetcher)
+            for index, key in sorted(self.column_map.items())
+            for prefetcher in self.rules[key].get("prefetch", ())
+        ]
+        if not prefetchers:
+            return rows
+        return self._prefetch_rows(rows, prefetchers)
+
+    def _prefetch_rows(self, rows, prefetchers):
+        # Yields the rows as they are, but starts each row's prefetchers
+        # PREFETCH_ROWS rows before it's validated
+        ahead = deque()
+        for row in rows:
+            for index, prefetcher in prefetchers:
+                if index < len(row):
+                    try:
+                        prefetcher(row[index], row, self.column_name_map)
+                    except Exception:
+                        # Left for the validator to report
+                        pass
+            ahead.append(row)
+            if len(ahead) > PREFETCH_ROWS:
+                yield ahead.popleft()
+        yield from ahead
+
+    def _start_aggregates(self):
+        # New state for each run, the compiled rules stay untouched
+        self._aggregates = []
+        for index, key in sorted(self.column_map.items()):
+            rule = self.rules[key]
+            severity = WARNING if rule["directives"]["warning"] else ERROR
+            for aggregate, expr in zip(rule.get("aggregates", ()), rule.get("aggregate_exprs", ())):
+                state = aggregate.start()
+                if self.profiler is not None:
+                    state = self.profiler.wrap_aggregate(rule["name"], str(expr), state)
+                self._aggregates.append((index, state, str(expr), severity))
+
+    def _aggregate_row(self, row_num, row):
+        # Add a row to the cross-row checks, False to stop checking
+        for index, state, rule, severity in self._aggregates:
+            if index < len(row):
+                message = state.add(row_num, row[index], row, self.column_name_map)
+                if message is not None:
+                    if not self._report(row_num, index, row[index], message, rule, severity):
+                        return False
         return True
 
+    def _finish_aggregates(self):
+        # Problems that could only be found once all the rows were seen,
+        # row_num is None for ones that aren't in any row. Each state's
+        # finish() gives them in row order, those without a row last, so
+        # they're merged as they're taken rather than gathered up first.
+        streams = [
+            _finish_stream(state, index, rule, severity)
+            for index, state, rule, severity in self._aggregates
+        ]
+        try:
+            for issue in heapq.merge(*streams, key=lambda issue: (issue[0] is None, issue[0] or 0, issue[1])):
+                if not self._report(*issue):
+                    return False
+            return True
+        finally:
+            for stream in streams:
+                stream.close()
+
+    def _check_row(self, row_num, row):
+        # False to stop checking
+        if row_num == self._memo_review_row and self._active_memos:
+            self._review_memos()
+        return self._report_row(row_num, row, self._row_errors(row))
+
+    def _report_row(self, row_num, row, errors):
+        # Reports a row's errors from _row_errors, then adds it to the
+        # cross-row checks, which need the rows in order. False to stop.
+        for error in errors:
+            if not self._report(row_num, *error):
+                return False
+        return self._aggregate_row(row_num, row)
+
+    def _compile_row_errors(self):
+        # The profiler needs each validator called on its own
+        self._memos = {}
+        if self.profiler is None and self.memo_size:
+            self._memos = {
+                index: column_memo(self.rules[key], self.memo_size)
+                for index, key in self.column_map.items() if self.rules[key].get("memoize")
+            }
+        self._active_memos = dict(self._memos)
+        self._memo_review_row = self.first_row + MEMO_REVIEW_ROW
+        self._generate_row_errors()
+
+    def _generate_row_errors(self):
+        self._row_errors = self._interpret_row
+        if self.profiler is None:
+            row_validator = compile_row_validator(self.rules, self.column_map, self.column_name_map,
+                                                  self._interpret_row, self._active_memos)
+            if row_validator is not None:
+                self._row_errors = row_validator
+
+    def _review_memos(self):
+        # Stop using memos that mostly miss, e.g. on a column of ids
+        for index, memo in list(self._active_memos.items()):
+            info = memo.cache_info()
+            if info.hits < MEMO_MIN_HIT_RATE * (info.hits + info.misses):
+                logger.info("Memo of column %d dropped, %d hits and %d misses", index,
+                            info.hits, info.misses)
+                del self._active_memos[index]
+        if len(self._active_memos) < len(self._memos):
+            self._generate_row_errors()
+
+    def memo_stats(self):
+        # (hits, misses) of each memoized column by name
+        stats = {}
+        for index, memo in self._memos.items():
+            info = memo.cache_info()
+            stats[self._column_name(index)] = (info.hits, info.misses)
+        return stats
+
+    def _interpret_row(self, row):
+        # (column number, value, message, rule, severity) of each invalid
+        # element in the row. Only reads the validator's state, so threads
+        # can check rows at the same time.
+        errors = []
+        column_name_map = self.column_name_map
+        memos = self._active_memos
+        for index, value in enumerate(row):
+            # Key in the rules for the column
+            key = self.column_map.get(index)
+            if key is None:
+                errors.append((index, value, "Unexpected column!", None, ERROR))
+                continue
+            rule = self.rules[key]
+            memo = memos.get(index)
+            if memo is not None:
+                rule_num = memo(value)
+                if rule_num is not None:
+                    severity = WARNING if rule["directives"]["warning"] else ERROR
+                    errors.append((index, value, "Invalid element!", str(rule["exprs"][rule_num]),
+                                   severity))
+                continue
+            match_is_false = rule["directives"]["matchIsFalse"]
+            for rule_num, function in enumerate(rule["functions"]):
+                if bool(function(value, row, column_name_map)) == match_is_false:
+                    severity = WARNING if rule["directives"]["warning"] else ERROR
+                    errors.append((index, value, "Invalid element!", str(rule["exprs"][rule_num]),
+                                   severity))
+                    break
+        return errors
+
+    def _check_blocks(self, rows):
+        batch_functions = {
+            key: [compile_batch_expr(expr) for expr in self.rules[key]["ordered_exprs"]]
+            for key in self.column_map.values()
+        }
+        if self.profiler is not None:
+            for key, functions in batch_functions.items():
+                rule = self.rules[key]
+                functions[:] = [
+                    self.profiler.wrap_batch(rule["name"], str(expr), function,
+                                             rule["directives"]["matchIsFalse"])
+                    for function, expr in zip(functions, rule["exprs"])
+                ]
+        row_num = self.first_row
+        while True:
+            block = list(itertools.islice(rows, self.block_size))
+            if not block:
+                return True
+            if not self._check_block(row_num, block, batch_functions):
+                return False
+            row_num += len(block)
+
+    def _check_block(self, first_row, block, batch_functions):
+        width = len(self.column_map)
+        # Ragged rows can't be turned into columns
+        if all(len(row) == width for row in block) and self._block_valid(block, batch_functions):
+            for row_num, row in enumerate(block, first_row):
+                if not self._aggregate_row(row_num, row):
+                    return False
+            return True
+        # Check row by row for the same reports as without blocks
+        for row_num, row in enumerate(block, first_row):
+            if not self._check_row(row_num, row):
+                return False
+        return True
+
+    def _block_valid(self, block, batch_functions):
+        for index, values in enumerate(zip(*block)):
+            key = self.column_map[index]
+            if self.use_numpy:
+                values = np.array(values)
+            match_is_false = self.rules[key]["directives"]["matchIsFalse"]
+            for batch_function in batch_functions[key]:
+                mask = batch_function(values, block, self.column_name_map)
+                if first_invalid(mask, match_is_false) is not None:
+                    return False
+        return True
+
+    def _column_name(self, index):
+        key = self.column_map.get(index)
+        return None if key is None else self.rules[key]["name"]
+
+    def _report(self, row_num, index, value, message, rule=None, severity=ERROR):
+        # False once max_errors errors have been found
+        issue = ValidationIssue(row_num, index, self._column_name(index), rule, value, severity, message)
+        return self._add_issue(issue)
+
+    def _add_issue(self, issue):
+        logger.debug("[%s, %s]: %s %r", issue.row, issue.column, issue.message, issue.value)
+        if issue.severity == ERROR:
+            self.error_count += 1
+        else:
+            self.warning_count += 1
+        if self.issue_writer is not None:
+            self.issue_writer.write(issue)
+        else:
+            self.issues.append(issue)
+        return not self.max_errors or self.error_count < self.max_errors
+
+
+class CSV_Stream_Validator(CSV_Validator):
+    # Validates one row at a time so memory stays flat whatever the file
+    # size. csv_file can be a path, a binary or text file handle, or an
+    # iterator of already split rows. A path to a gzip, bz2 or xz file is
+    # decompressed as it's read.
+    def __init__(self, csv_file, rules, encoding="utf-8", block_size=0, use_numpy=False,
+                 max_errors=1, issue_writer=None, profiler=None):
+        super().__init__(csv_file, rules, block_size, use_numpy, max_errors, issue_writer,
+                         profiler)
+        self.encoding = encoding
+
+    def __repr__(self):
+        if isinstance(self.csv_file, (str, os.PathLike)):
+            return str(self.csv_file)
+        return f"<{type(self).__name__} {self.csv_file!r}>"
+
+    def _rows(self):
+        delimiter = self.rules['@global_directives']['separator']
+        source = self.csv_file
+        if isinstance(source, (str, os.PathLike)):
+            compression = detect_compression(source)
+            if compression:
+                csv_file = io.TextIOWrapper(open_decompressed(source, compression),
+                                            encoding=self.encoding, newline="")
+            else:
+                csv_file = open(source, newline="", encoding=self.encoding)
+            with csv_file:
+                yield from csv.reader(csv_file, delimiter=delimiter)
+        elif hasattr(source, "read"):
+            if isinstance(source.read(0), bytes):
+                text = io.TextIOWrapper(source, encoding=self.encoding, newline="")
+                try:
+                    yield from csv.reader(text, delimiter=delimiter)
+                finally:
+                    # Don't close the caller's handle with the wrapper
+                    text.detach()
+            else:
+                yield from csv.reader(source, delimiter=delimiter)
+        else:
+            yield from source
+
+
+class CSV_Threaded_Validator(CSV_Stream_Validator):
+    # Rows are read on the calling thread and checked in batches of
+    # rows_per_task by a pool of threads sharing the one set of compiled
+    # rules. Worth it for I/O bound rules like checksum and fileExists, or
+    # on a free-threaded Python. At most workers * 2 batches are in flight
+    # so memory stays bounded.
+    def __init__(self, csv_file, rules, encoding="utf-8", workers=None, rows_per_task=256,
+                 max_errors=1, issue_writer=None, profiler=None):
+        super().__init__(csv_file, rules, encoding, max_errors=max_errors,
+                         issue_writer=issue_writer, profiler=profiler)
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+        self.rows_per_task = rows_per_task
+
+    def _check_task(self, rows):
+        # Errors of each row in the batch
+        return [self._row_errors(row) for row in rows]
+
+    def _check_rows(self, rows):
+        pending = deque()
+        row_num = self.first_row
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                while True:
+                    batch = list(itertools.islice(rows, self.rows_per_task))
+                    if batch:
+                        future = executor.submit(self._check_task, batch)
+                        pending.append((future, row_num, batch))
+                        row_num += len(batch)
+                    # Results are taken in order, so issues are reported in
+                    # file order like the single threaded check
+                    while pending and (len(pending) >= self.workers * 2 or not batch):
+                        future, first_row, done = pending.popleft()
+                        review_row = self._memo_review_row
+                        if first_row <= review_row < first_row + len(done) and self._active_memos:
+                            self._review_memos()
+                        for done_row, (row, errors) in enumerate(zip(done, future.result()), first_row):
+                            # Cross-row checks need the rows in order, so
+                            # they're done here rather than in the threads
+                            if not self._report_row(done_row, row, errors):
+                                return False
+                    if not batch:
+                        return True
+            finally:
+                for future, _first_row, _batch in pending:
+                    future.cancel()
+
+
+def memo_summary(stats):
+    # One line of memo_stats() for the run summary, n/a for None
+    if stats is None:
+        return "n/a"
+    return "; ".join(f"{column} {hits} hits, {misses} misses"
+                     for column, (hits, misses) in stats.items()) or "none"
+
 
 if __name__ == "__main__":
 
@@ -113,30 +529,160 @@ if __name__ == "__main__":
 
     # Required schema file
     arg_parser.add_argument('schema_file', help="CSV Schema file.")
-    # Required csv file
-    arg_parser.add_argument('csv_file', help="CSV file to be validated.")
+    # Required csv file, or several files, directories or globs
+    arg_parser.add_argument('csv_file', nargs='+',
+                            help="CSV file to be validated. Several files, directories or globs "
+                                 "are validated in batch mode.")
+    # Optional parallel validation
+    arg_parser.add_argument('--workers', type=int, default=0,
+                            help="Validate chunks of the CSV file in this many processes, "
+                                 "or this many files at once in batch mode.")
+    arg_parser.add_argument('--chunk-size', type=int, default=16 * 1024 * 1024,
+                            help="Size in bytes of the chunks used with --workers.")
+    # Optional threaded validation
+    arg_parser.add_argument('--threads', type=int, default=0,
+                            help="Check rows in this many threads sharing one compiled schema.")
+    # Optional column batched validation
+    arg_parser.add_argument('--block-size', type=int, default=0,
+                            help="Check the CSV in blocks of this many rows, a column at a time.")
+    arg_parser.add_argument('--numpy', action='store_true',
+                            help="Use NumPy arrays for the columns with --block-size.")
+    # Optional byte level reader
+    arg_parser.add_argument('--mmap-csv', action='store_true',
+                            help="Read the CSV file through mmap, only decoding the fields "
+                                 "that rules read.")
+    # checksum options
+    arg_parser.add_argument('--checksum-workers', type=int, default=0,
+                            help="Threads used to hash files for checksum rules.")
+    arg_parser.add_argument('--read-size', type=int, default=0,
+                            help="Size in bytes of each read when hashing a file.")
+    arg_parser.add_argument('--mmap', action='store_true',
+                            help="Hash files through mmap instead of reads.")
+    arg_parser.add_argument('--no-checksum-cache', action='store_true',
+                            help="Don't use or update the cache of file digests.")
+    # fileExists and fileCount options
+    arg_parser.add_argument('--stat-files', action='store_true',
+                            help="Check fileExists and fileCount with a stat call per row "
+                                 "instead of listing each directory once.")
+    # Batch mode output
+    arg_parser.add_argument('--summary', default='-',
+                            help="Where batch mode writes its JSON summary, stdout by default.")
+    # Results
+    arg_parser.add_argument('--max-errors', type=int, default=0,
+                            help="Stop after this many errors, 0 for no limit.")
+    arg_parser.add_argument('--fail-fast', action='store_true',
+                            help="Stop at the first error, the same as --max-errors 1.")
+    arg_parser.add_argument('--output',
+                            help="Write each error and warning to this file, - for stdout.")
+    arg_parser.add_argument('--output-format', choices=['jsonl', 'csv'],
+                            help="Format of --output, from its extension by default "
+                                 "and JSON Lines otherwise.")
+    arg_parser.add_argument('--adaptive', action='store_true',
+                            help="Keep reordering the operands of and/or rules to suit the "
+                                 "values being checked.")
+    arg_parser.add_argument('--checkpoint',
+                            help="Carry on from the end of the last run saved in this file, for "
+                                 "CSV files that are only appended to.")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="Time each column's rules and print the slowest to stderr.")
+    arg_parser.add_argument('-v', '--verbose', action='count', default=0,
+                            help="Log progress, twice to log each issue and the parsed schema.")
 
     args = arg_parser.parse_args()
 
-    parser = CSVS_Parser(args.schema_file)
-    transformer = CSVS_Transformer()
-
-    print("--------- PARSED ---------")
-    transformer.transform(parser.tree)
-    pprint(transformer.rules)
-    # print(transformer.rules['name']("something"))  # True
-    # print(transformer.rules['name'](""))  # False
-    # print(transformer.rules['age']("23"))  # True
-    # print(transformer.rules['age']("ds"))  # False
-    # print(transformer.rules['age']("123"))  # False
-    # print(transformer.rules['gender']('m'))  # True
-    # print(transformer.rules['gender']('?'))  # False
-
-    with open(args.csv_file) as csv_file:
-        csvfile = csv_file.read()
-    c = CSV_Validator(csvfile, transformer.rules)
-    pprint(c)
-    if c.check():
-        print("VALID")
-    else:
-        print("INVALID")
+    logging.basicConfig(level=logging.WARNING - 10 * min(args.verbose, 2),
+                        format="%(levelname)s: %(message)s")
+    max_errors = 1 if args.fail_fast else args.max_errors or None
+
+    checksum_options = {"use_mmap": args.mmap}
+    if args.checksum_workers:
+        checksum_options["workers"] = args.checksum_workers
+    if args.read_size:
+        checksum_options["read_size"] = args.read_size
+    if args.no_checksum_cache:
+        checksum_options["cache_file"] = None
+    configure_checksums(**checksum_options)
+    configure_file_index(stat_per_row=args.stat_files)
+
+    # Anything other than a single file is batch mode
+    if len(args.csv_file) > 1 or not os.path.isfile(args.csv_file[0]):
+        if args.profile:
+            logger.warning("--profile is ignored in batch mode.")
+        if args.checkpoint:
+            logger.warning("--checkpoint is ignored in batch mode.")
+        from batch_validator import CSV_Batch_Validator, expand_csv_files
+        try:
+            csv_files = expand_csv_files(args.csv_file)
+        except FileNotFoundError as e:
+            arg_parser.error(str(e))
+        c = CSV_Batch_Validator(csv_files, args.schema_file,
+                                workers=args.workers or None, max_errors=max_errors,
+                                adaptive=args.adaptive)
+        valid = c.check()
+        c.write_summary(args.summary)
+        raise SystemExit(0 if valid else 1)
+    args.csv_file = args.csv_file[0]
+
+    # Parsed rules are cached, so this only runs Lark for a new schema
+    schema = load_schema(args.schema_file)
+    logger.debug("Parsed schema:\n%s", pformat(schema))
+    rules = compile_rules(schema, adaptive=args.adaptive)
+
+    profiler = None
+    if args.profile:
+        if args.workers:
+            logger.warning("--profile is ignored with --workers.")
+        else:
+            profiler = RuleProfiler()
+
+    issue_writer = None
+    if args.output:
+        issue_writer = open_issue_writer(args.output, args.output_format)
+    # Compressed files can only be read from the start
+    if args.checkpoint and detect_compression(args.csv_file):
+        logger.warning("--checkpoint is ignored for a compressed CSV file.")
+        args.checkpoint = None
+    try:
+        if args.checkpoint:
+            from checkpoint import CSV_Checkpoint_Validator
+            if args.workers or args.threads or args.profile:
+                logger.warning("--workers, --threads and --profile are ignored with --checkpoint.")
+            c = CSV_Checkpoint_Validator(args.csv_file, rules, args.checkpoint,
+                                         block_size=args.block_size, use_numpy=args.numpy,
+                                         max_errors=max_errors, issue_writer=issue_writer)
+        elif args.workers:
+            from parallel_validator import CSV_Parallel_Validator
+            c = CSV_Parallel_Validator(args.csv_file, args.schema_file,
+                                       workers=args.workers, chunk_size=args.chunk_size,
+                                       max_errors=max_errors, issue_writer=issue_writer,
+                                       adaptive=args.adaptive)
+        elif args.threads:
+            c = CSV_Threaded_Validator(args.csv_file, rules, workers=args.threads,
+                                       max_errors=max_errors, issue_writer=issue_writer,
+                                       profiler=profiler)
+        elif args.mmap_csv:
+            from mmap_reader import CSV_Mmap_Validator
+            c = CSV_Mmap_Validator(args.csv_file, rules, block_size=args.block_size,
+                                   use_numpy=args.numpy, max_errors=max_errors,
+                                   issue_writer=issue_writer, profiler=profiler)
+        else:
+            c = CSV_Stream_Validator(args.csv_file, rules, block_size=args.block_size,
+                                     use_numpy=args.numpy, max_errors=max_errors,
+                                     issue_writer=issue_writer, profiler=profiler)
+        logger.info("Validating %r", c)
+        valid = c.check()
+        # The workers' memos are in their own processes
+        memo_stats = None if args.workers and not args.checkpoint else c.memo_stats()
+    finally:
+        if issue_writer is not None:
+            issue_writer.close()
+    # Without --output the issues go to stderr so stdout is just the verdict
+    if issue_writer is None:
+        for issue in c.issues:
+            print(f"{issue.severity}: [{issue.row}, {issue.column}] {issue.message} "
+                  f"{issue.rule or ''} {issue.value!r}", file=sys.stderr)
+    if profiler is not None:
+        print(profiler.report(), file=sys.stderr)
+    print(f"{'VALID' if valid else 'INVALID'}: {c.error_count} errors, {c.warning_count} warnings")
+    print(f"Memos: {memo_summary(memo_stats)}")
+    raise SystemExit(0 if valid else 1)
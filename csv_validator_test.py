@@ -0,0 +1,244 @@
+import io
+import os
+import random
+import subprocess
+import sys
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+import csv_validator
+from csv_validator import CSV_Validator, CSV_Stream_Validator, CSV_Threaded_Validator
+import csvs_compiler
+from csvs_compiler import compile_expr, compile_rules, load_rules, load_schema, reorder_expr, row_independent
+from csvs_parser import ColumnReference, Expr, StringLiteral
+
+SCHEMA = """version 1.0
+@totalColumns 3
+name: notEmpty length(1, 20)
+age: range(0, 120)
+gender: is("m") or is("f")
+"""
+
+VALID_CSV = "name,age,gender\njames,21,m\nlauren,19,f\n"
+INVALID_CSV = "name,age,gender\njames,4 years,m\nlauren,19,f\n"
+
+
+@pytest.fixture
+def rules(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(SCHEMA)
+    return load_rules(schema_file, cache_dir=None)
+
+
+def test_check_string(rules):
+    assert CSV_Validator(VALID_CSV, rules).check()
+    assert not CSV_Validator(INVALID_CSV, rules).check()
+
+
+def test_stream_path(rules, tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text(VALID_CSV)
+    assert CSV_Stream_Validator(csv_file, rules).check()
+    assert CSV_Stream_Validator(str(csv_file), rules).check()
+    csv_file.write_text(INVALID_CSV)
+    assert not CSV_Stream_Validator(csv_file, rules).check()
+
+
+def test_stream_binary_handle(rules):
+    handle = io.BytesIO(VALID_CSV.encode("utf-8"))
+    assert CSV_Stream_Validator(handle, rules).check()
+    # The caller's handle is left open
+    assert not handle.closed
+
+
+def test_stream_rows(rules):
+    rows = iter([["name", "age", "gender"], ["james", "21", "m"], ["simon", "57", "male"]])
+    assert not CSV_Stream_Validator(rows, rules).check()
+
+
+def test_stream_is_lazy(rules):
+    def rows():
+        yield ["name", "age", "gender"]
+        yield ["james", "4 years", "m"]
+        raise AssertionError("Read past the first invalid row")
+    assert not CSV_Stream_Validator(rows(), rules).check()
+
+
+def test_no_header(rules):
+    rules["@global_directives"]["header"] = False
+    assert CSV_Validator("james,21,m\nlauren,19,f\n", rules).check()
+    assert not CSV_Validator("james,21,x\n", rules).check()
+
+
+def test_threaded(rules):
+    rows = [["name", "age", "gender"]] + [["james", "21", "m"]] * 500
+    assert CSV_Threaded_Validator(iter(rows), rules, workers=4, rows_per_task=7).check()
+    rows[300] = ["simon", "57", "male"]
+    rows[400] = ["simon", "old", "m"]
+    validator = CSV_Threaded_Validator(iter(rows), rules, workers=4, rows_per_task=7)
+    assert not validator.check()
+    # The first error in the file, not the first one found
+    assert validator.errors == [(299, 2, "male")]
+
+
+def test_shared_validator_across_threads():
+    # Column references used to store the row on the shared Expr, so
+    # threads saw each other's rows
+    validator = compile_expr(Expr("is", ColumnReference("b")))
+    colmap = {"a": 0, "b": 1}
+
+    def check(n):
+        row = [str(n), str(n)]
+        bad = [str(n), str(n + 1)]
+        return all(validator(row[0], row, colmap) and not validator(bad[0], bad, colmap)
+                   for _ in range(2000))
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert all(executor.map(check, range(64)))
+
+
+MEMO_SCHEMA = """version 1.0
+@totalColumns 4
+status: is("open") or is("closed") or is("held")
+code: regex("[A-Z]{2}/[0-9]+") @warning
+name: notEmpty
+ref: is($name) or regex("x+")
+"""
+
+
+def test_row_independent():
+    assert row_independent(Expr("or", Expr("is", StringLiteral("a")), Expr("range", 0.0, 1.0)))
+    assert not row_independent(Expr("or", Expr("is", StringLiteral("a")), Expr("is", ColumnReference("b"))))
+    assert not row_independent(Expr("context", ColumnReference("b"), Expr("notEmpty")))
+    assert not row_independent(Expr("fileExists"))
+
+
+@pytest.mark.parametrize("validator_class", [CSV_Stream_Validator, CSV_Threaded_Validator])
+def test_memos(tmp_path, monkeypatch, validator_class):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(MEMO_SCHEMA)
+    rules = load_rules(schema_file, cache_dir=None)
+    # Cheap rules and ones using other columns aren't memoized
+    assert [rules[i]["memoize"] for i in range(4)] == [True, True, False, False]
+    monkeypatch.setattr(csv_validator, "MEMO_REVIEW_ROW", 100)
+    rows = [["status", "code", "name", "ref"]]
+    for n in range(1000):
+        # Only 4 codes, but every row has its own status until row 300
+        status = ["open", "closed", "held", "lost"][n % 4] + (str(n) if n < 300 else "")
+        rows.append([status, ["AB/1", "CD/2", "EF/3", "bad"][n % 4], "x", "x"])
+
+    validator = validator_class(iter(rows), rules, max_errors=None)
+    assert not validator.check()
+    stats = validator.memo_stats()
+    assert stats["code"] == (996, 4)
+    if validator_class is CSV_Stream_Validator:
+        # The status memo was dropped after mostly missing, threads may
+        # have found hits in rows checked ahead of the review
+        assert stats["status"][1] == 100
+        assert list(validator._active_memos) == [1]
+
+    validator_class.memo_size = 0
+    try:
+        without = validator_class(iter(rows), rules, max_errors=None)
+        assert not without.check()
+    finally:
+        del validator_class.memo_size
+    assert without.memo_stats() == {}
+    assert without.issues == validator.issues
+
+
+def test_reorder_expr():
+    regex = Expr("regex", StringLiteral("[a-z]+"))
+    not_empty = Expr("notEmpty")
+    is_b = Expr("is", ColumnReference("b"))
+    checksum = Expr("checksum", Expr("file", StringLiteral("x")), StringLiteral("MD5"))
+    assert reorder_expr(Expr("and", regex, not_empty)) == Expr("and", not_empty, regex)
+    # Repeats are left out, and checksum goes last
+    assert reorder_expr(Expr("or", checksum, Expr("or", not_empty, not_empty))) == Expr("or", not_empty, checksum)
+    # Operands reading other columns stay put, the runs between them are sorted
+    uuid = Expr("uuid4")
+    assert reorder_expr(Expr("and", regex, Expr("and", not_empty, Expr("and", is_b, Expr("and", regex, uuid))))) == (
+        Expr("and", not_empty, Expr("and", regex, Expr("and", is_b, uuid))))
+    assert reorder_expr(Expr("if", Expr("or", regex, not_empty), not_empty)) == (
+        Expr("if", Expr("or", not_empty, regex), not_empty))
+
+
+def test_is_chain_made_into_any():
+    def is_(value):
+        return Expr("is", StringLiteral(value))
+    is_b = Expr("is", ColumnReference("b"))
+    chain = Expr("or", is_("x"), Expr("or", Expr("regex", StringLiteral("y+")), Expr("or", is_("z"), Expr(
+        "or", Expr("any", StringLiteral("x"), StringLiteral("w")), Expr("or", is_b, is_("v"))))))
+    assert reorder_expr(chain) == Expr("or", Expr("any", *map(StringLiteral, "xzw")), Expr(
+        "or", Expr("regex", StringLiteral("y+")), Expr("or", is_b, is_("v"))))
+    # Not in an and, or alone
+    assert reorder_expr(Expr("and", is_("x"), is_("z"))) == Expr("and", is_("x"), is_("z"))
+    assert reorder_expr(Expr("or", is_("x"), is_b)) == Expr("or", is_("x"), is_b)
+
+
+def test_repeated_rule_kept(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text('version 1.0\n@totalColumns 1\na: length(2) notEmpty length(2)\n')
+    rules = load_rules(schema_file, cache_dir=None)
+    # Kept as written, sharing one validator
+    assert [str(expr) for expr in rules[0]["exprs"]] == ["length(2, 2)", "notEmpty", "length(2, 2)"]
+    assert rules[0]["functions"][0] is rules[0]["functions"][2]
+    validator = CSV_Validator("a\nx\n", rules, max_errors=None)
+    assert not validator.check()
+    assert [issue.rule for issue in validator.issues] == ["length(2, 2)"]
+
+
+REORDER_SCHEMA = """version 1.0
+@totalColumns 4
+a: regex("[a-c]+") and length(1, 2) and notEmpty and length(1, 2)
+b: uuid4 or starts("x") or is($a) or empty or regex("y.*")
+c: positiveInteger and range(1, 50) or is("zz") or is("7") or is("ab") @matchIsFalse
+d: if(regex("[0-9]+") and length(2, 3), range(10, 99), not($a) and notEmpty) regex(".*")
+"""
+
+
+def _outcomes(validator, rows):
+    # Errors for each row, or the exception checking it raised
+    outcomes = []
+    for row in rows:
+        try:
+            outcomes.append(validator._row_errors(row))
+        except LookupError as e:
+            outcomes.append(type(e))
+    return outcomes
+
+
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_reordering_keeps_results(tmp_path, monkeypatch, adaptive):
+    monkeypatch.setattr(csvs_compiler, "ADAPT_INTERVAL", 7)
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(REORDER_SCHEMA)
+    schema = load_schema(schema_file, cache_dir=None)
+    header = ["a", "b", "c", "d"]
+    rng = random.Random(3)
+    words = ["", "a", "ab", "abc", "x1", "y", "zz", "7", "12", "70", "123", "-1"]
+    rows = [[rng.choice(words) for _ in range(rng.choice([4, 4, 4, 3, 1]))] for _ in range(3000)]
+
+    def outcomes(rules):
+        validator = CSV_Stream_Validator(iter([header]), rules, max_errors=None)
+        validator._read_header(iter([header]))
+        validator._compile_row_errors()
+        return _outcomes(validator, rows), [validator._interpret_row(row) for row in rows if len(row) == 4]
+
+    rules = compile_rules(schema, adaptive=adaptive)
+    assert rules[0]["ordered_exprs"] != rules[0]["exprs"]
+    if adaptive:
+        assert rules[1]["functions"][0].interval == 7
+    assert outcomes(rules) == outcomes(compile_rules(schema, reorder=False))
+
+
+@pytest.mark.parametrize("options, memos", [([], "age 2 hits, 2 misses"), (["--workers", "2"], "n/a")])
+def test_cli_reports_memos(tmp_path, options, memos):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(SCHEMA)
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_text(VALID_CSV + "al,21,m\nbo,19,f\n")
+    result = subprocess.run(
+        [sys.executable, os.path.join(os.path.dirname(__file__), "csv_validator.py"), *options,
+         str(schema_file), str(csv_file)],
+        capture_output=True, text=True, env=dict(os.environ, CSV_VALIDATOR_CACHE=str(tmp_path / "cache")))
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.splitlines() == ["VALID: 0 errors, 0 warnings", f"Memos: {memos}"]
@@ -0,0 +1,201 @@
+from csvs_compiler import any_values, compile_expr
+from csvs_parser import ColumnReference, StringLiteral
+from csvs_patterns import compile_pattern
+from validation_results import ERROR, WARNING
+
+# Source generator for each Expr op. Each takes a Row_Codegen, the Python
+# expression for the value being checked, and the Expr's args, and
+# returns a Python expression that is truthy when the value is valid.
+# Ops without one call their compiled validator from the generated code.
+_generators = {}
+
+
+def generates(op):
+    def register(function):
+        _generators[op] = function
+        return function
+    return register
+
+
+class Row_Codegen:
+    # Writes the source of one function checking a whole row, for a
+    # schema whose columns have been matched to the header. Column
+    # indices, literals and directives are written into the source, so a
+    # row is checked without looking anything up in the rules.
+    def __init__(self, rules, column_map, column_name_map, memos=None):
+        self.rules = rules
+        self.column_map = column_map
+        self.column_name_map = column_name_map
+        # Function from value to first failing rule for memoized columns
+        self.memos = memos or {}
+        # Objects the generated code refers to by name
+        self.namespace = {"_colmap": column_name_map}
+
+    def bind(self, obj):
+        name = f"_b{len(self.namespace)}"
+        self.namespace[name] = obj
+        return name
+
+    def provider(self, provider):
+        # Python expression for a string provider's value
+        if isinstance(provider, StringLiteral):
+            return repr(provider.resolve())
+        if isinstance(provider, ColumnReference):
+            index = self.column_name_map.get(provider.column_name)
+            if index is None:
+                # Raises KeyError when run, like ColumnReference.resolve
+                return f"row[_colmap[{provider.column_name!r}]]"
+            return f"row[{index}]"
+        return f"{self.bind(provider)}.resolve(row, _colmap)"
+
+    def expr(self, expr, value):
+        generator = _generators.get(expr.op)
+        if generator is not None:
+            source = generator(self, value, *expr.args)
+            if source is not None:
+                return source
+        # No source for it, call the compiled validator instead
+        return f"{self.bind(compile_expr(expr))}({value}, row, _colmap)"
+
+    def source(self, name="row_errors"):
+        lines = [
+            f"def {name}(row):",
+            f"    if len(row) != {len(self.column_map)}:",
+            "        return _interpret_row(row)",
+            "    errors = []",
+        ]
+        for index in range(len(self.column_map)):
+            rule = self.rules[self.column_map[index]]
+            match_is_false = rule["directives"]["matchIsFalse"]
+            severity = WARNING if rule["directives"]["warning"] else ERROR
+            if index in self.memos:
+                memo = self.bind(self.memos[index])
+                rule_texts = self.bind(tuple(map(str, rule["exprs"])))
+                lines.append(f"    rule_num = {memo}(row[{index}])")
+                lines.append("    if rule_num is not None:")
+                lines.append(f"        errors.append(({index}, row[{index}], 'Invalid element!', "
+                             f"{rule_texts}[rule_num], {severity!r}))")
+                continue
+            keyword = "if"
+            for expr, function, text in zip(rule["ordered_exprs"], rule["functions"], rule["exprs"]):
+                if rule["adaptive"]:
+                    # Its operands are reordered as it runs
+                    check = f"{self.bind(function)}(row[{index}], row, _colmap)"
+                else:
+                    check = self.expr(expr, f"row[{index}]")
+                # An invalid element fails the check, or passes it with
+                # matchIsFalse
+                lines.append(f"    {keyword} {'' if match_is_false else 'not '}({check}):")
+                lines.append(f"        errors.append(({index}, row[{index}], 'Invalid element!', "
+                             f"{str(text)!r}, {severity!r}))")
+                keyword = "elif"
+        lines.append("    return errors")
+        return "\n".join(lines) + "\n"
+
+
+def compile_row_validator(rules, column_map, column_name_map, interpret_row, memos=None):
+    # Function taking a row and returning the same errors as
+    # CSV_Validator._interpret_row, or None if the columns found in the
+    # header don't allow one. Rows of any other length are handed to
+    # interpret_row.
+    if sorted(column_map) != list(range(len(column_map))):
+        return None
+    codegen = Row_Codegen(rules, column_map, column_name_map, memos)
+    source = codegen.source()
+    namespace = dict(codegen.namespace, _interpret_row=interpret_row)
+    exec(compile(source, "<csvs row validator>", "exec"), namespace)
+    row_errors = namespace["row_errors"]
+    row_errors.source = source
+    return row_errors
+
+
+@generates("or")
+def _or(codegen, value, left, right):
+    return f"({codegen.expr(left, value)} or {codegen.expr(right, value)})"
+
+
+@generates("and")
+def _and(codegen, value, left, right):
+    return f"({codegen.expr(left, value)} and {codegen.expr(right, value)})"
+
+
+@generates("if")
+def _if(codegen, value, condition, then_expr, else_expr=None):
+    else_source = "True" if else_expr is None else codegen.expr(else_expr, value)
+    return (f"({codegen.expr(then_expr, value)} if {codegen.expr(condition, value)} "
+            f"else {else_source})")
+
+
+@generates("context")
+def _context(codegen, _value, context, expr):
+    # The referenced column's value is checked instead
+    return codegen.expr(expr, codegen.provider(context))
+
+
+@generates("is")
+def _is(codegen, value, string_provider):
+    return f"({value} == {codegen.provider(string_provider)})"
+
+
+@generates("any")
+def _any(codegen, value, *providers):
+    values, rest = any_values(providers)
+    if rest:
+        return None
+    return f"({value} in {codegen.bind(values)})"
+
+
+@generates("not")
+def _not(codegen, value, string_provider):
+    return f"({value} != {codegen.provider(string_provider)})"
+
+
+@generates("in")
+def _in(codegen, value, string_provider):
+    # Only a literal is sure to be a string, anything else needs the
+    # validator's TypeError handling
+    if isinstance(string_provider, StringLiteral):
+        return f"({value} in {codegen.provider(string_provider)})"
+    return None
+
+
+@generates("starts")
+def _starts(codegen, value, string_provider):
+    return f"{value}.startswith({codegen.provider(string_provider)})"
+
+
+@generates("ends")
+def _ends(codegen, value, string_provider):
+    if isinstance(string_provider, StringLiteral):
+        target = string_provider.resolve()
+        return f"({value}.strip()[-{len(target)}:] == {target!r})"
+    return None
+
+
+@generates("regex")
+def _regex(codegen, value, regex):
+    fullmatch = codegen.bind(compile_pattern(regex.resolve()).fullmatch)
+    return f"({fullmatch}({value}) is not None)"
+
+
+@generates("length")
+def _length(_codegen, value, min_len, max_len):
+    if min_len is None and max_len is None:
+        return "True"
+    if min_len == max_len:
+        return f"(len({value}) == {min_len})"
+    if max_len is None:
+        return f"({min_len} <= len({value}))"
+    if min_len is None:
+        return f"(len({value}) <= {max_len})"
+    return f"({min_len} <= len({value}) <= {max_len})"
+
+
+@generates("empty")
+def _empty(_codegen, value):
+    return f"(not {value})"
+
+
+@generates("notEmpty")
+def _not_empty(_codegen, value):
+    return f"bool({value})"
@@ -0,0 +1,78 @@
+import random
+import pytest
+from benchmarks.generate import COLUMN_KINDS, column_kinds, make_rows, make_schema
+from csv_validator import CSV_Stream_Validator
+from csvs_codegen import compile_row_validator
+from csvs_compiler import load_rules
+
+SCHEMA = """version 1.0
+@totalColumns 6
+name: notEmpty length(1, 5) @warning
+code: starts("AB") and ends("Z") or is($name)
+kind: in("abc") @matchIsFalse
+age: if($kind/is("a"), range(0, 120), length(0, 3))
+ref: is($name) or not($code) @matchIsFalse
+tail: ends("") and regex("[a-z]*")
+"""
+
+
+def _validator(rules, rows):
+    validator = CSV_Stream_Validator(iter(rows), rules)
+    validator._read_header(iter(rows))
+    return validator
+
+
+def _random_rows(rng, count):
+    words = ["", "a", "b", "abc", "ABxZ", "AB Z ", "james", "toolong", "12", "121", " x"]
+    return [[rng.choice(words) for _ in range(6)] for _ in range(count)]
+
+
+@pytest.fixture
+def rules(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(SCHEMA)
+    return load_rules(schema_file, cache_dir=None)
+
+
+def test_same_errors_as_interpreter(rules):
+    header = ["name", "code", "kind", "age", "ref", "tail"]
+    validator = _validator(rules, [header])
+    row_validator = compile_row_validator(rules, validator.column_map, validator.column_name_map,
+                                          validator._interpret_row)
+    rng = random.Random(1)
+    rows = _random_rows(rng, 2000)
+    # Ragged rows go to the interpreter
+    rows += [row[:rng.randint(0, 5)] for row in rows[:50]] + [row + ["extra"] for row in rows[:50]]
+    for row in rows:
+        assert row_validator(row) == validator._interpret_row(row), row
+
+
+def test_same_errors_for_generated_schema(tmp_path):
+    kinds = column_kinds(len(COLUMN_KINDS) - 2)
+    (tmp_path / "schema.csvs").write_text(make_schema(kinds))
+    rules = load_rules(tmp_path / "schema.csvs", cache_dir=None)
+    header, *rows = make_rows(kinds, 2000, invalid_rate=0.05)
+    validator = _validator(rules, [header])
+    row_validator = compile_row_validator(rules, validator.column_map, validator.column_name_map,
+                                          validator._interpret_row)
+    assert any(validator._interpret_row(row) for row in rows)
+    for row in rows:
+        assert row_validator(row) == validator._interpret_row(row), row
+
+
+def test_check_uses_generated_function(rules):
+    rows = [["name", "code", "kind", "age", "ref", "tail"], ["a", "ABZ", "x", "toolong", "a", "q"]]
+    validator = CSV_Stream_Validator(iter(rows), rules, max_errors=None)
+    assert not validator.check()
+    assert hasattr(validator._row_errors, "source")
+    assert [(issue.column, issue.rule) for issue in validator.issues] == [
+        (3, 'if($kind/is("a"), range(0, 120), length(0, 3))'),
+        (4, 'is($name) or not($code)'),
+        # ends("") compares the whole value with ""
+        (5, 'ends("") and regex("[a-z]*")'),
+    ]
+
+
+def test_optional_gap_uses_interpreter():
+    # Columns that aren't numbered 0 to n - 1 aren't generated
+    assert compile_row_validator({}, {0: 0, 2: 1}, {}, None) is None
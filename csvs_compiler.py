@@ -0,0 +1,824 @@
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+from csvs_parser import (CACHE_DIR, GRAMMAR_DIR, ColumnReference, CSVS_Parser, CSVS_Transformer, Expr,
+                         SchemaError, StringLiteral)
+from csvs_dates import (date_parts_key, is_partial_date, is_partial_uk_date, uk_date_key,
+                        xsd_date_key, xsd_date_time_key, xsd_date_time_tz_key, xsd_time_key)
+from csvs_patterns import UUID4_PATTERN, compile_pattern, is_uri
+from external_validators import checksum_algorithm, checksum_pool, file_index, value_lists
+from integrity_check import IntegrityRule
+from unique_index import UniqueRule
+
+# Bump when Expr trees change shape so old cached schemas are ignored
+IR_VERSION = 3
+
+# Compiler function for each Expr op
+_compilers = {}
+
+# Compiler function for each op checked across rows rather than cell by
+# cell, these make objects with a start() method for each validation run
+_aggregate_compilers = {}
+
+# Compiler function for the ops that can start slow work, like hashing a
+# file, before their row is validated
+_prefetch_compilers = {}
+
+# Digest of each grammar file, read once per process
+_grammar_digests = {}
+
+# Ops whose result depends on more than the cell's value, like files on
+# disk, so they're never memoized
+_EXTERNAL_OPS = {"fileExists", "fileCount", "checksum", "file", "integrityCheck", "unique"}
+# Ops that wait on the filesystem
+_BLOCKING_OPS = {"fileExists", "fileCount", "checksum"}
+# Ops costing about as much as a memo lookup, each counts 1 towards
+# MEMO_MIN_COST and anything else counts MEMO_MIN_COST
+_CHEAP_OPS = {"or", "and", "if", "is", "any", "not", "in", "starts", "ends", "length", "empty", "notEmpty"}
+MEMO_MIN_COST = 5
+# Cost of an op that waits on the filesystem, next to one in _CHEAP_OPS
+BLOCKING_COST = 1000
+# Calls between each reordering of an adaptive and/or
+ADAPT_INTERVAL = 1024
+# Values whose result each column's memo keeps
+MEMO_SIZE = 1024
+
+
+def compiles(op):
+    # Register the function that turns an Expr with this op into a validator
+    def register(function):
+        _compilers[op] = function
+        return function
+    return register
+
+
+def compiles_aggregate(op):
+    def register(function):
+        _aggregate_compilers[op] = function
+        return function
+    return register
+
+
+def prefetches(op):
+    # Register the function that turns an Expr with this op into a
+    # prefetcher taking (value, row, colmap)
+    def register(function):
+        _prefetch_compilers[op] = function
+        return function
+    return register
+
+
+def compile_prefetch(expr):
+    # Prefetcher for an Expr, or None if it has nothing to start early
+    compiler = _prefetch_compilers.get(getattr(expr, "op", None))
+    return compiler(*expr.args) if compiler is not None else None
+
+
+def compile_expr(expr):
+    if not isinstance(expr, Expr):
+        # Transformer methods that don't exist yet leave Lark trees behind
+        name = getattr(expr, "data", expr)
+        raise SchemaError(f"Unsupported expression: {name}")
+    if expr.op in _aggregate_compilers:
+        raise SchemaError(f"{expr.op} can't be combined with other expressions")
+    try:
+        compiler = _compilers[expr.op]
+    except KeyError:
+        raise SchemaError(f"Unsupported expression: {expr.op}")
+    return compiler(*expr.args)
+
+
+def compile_rules(rules, reorder=True, adaptive=False):
+    # Turn the rules from CSVS_Transformer into the form CSV_Validator
+    # uses, where each column's "functions" are validators taking
+    # (value, row, colmap) and its "aggregates" are the rules checked
+    # across rows, like unique. With reorder the operands of and/or are
+    # checked cheapest first, and with adaptive the order of each rule's
+    # and/or operands keeps changing to suit the values being checked.
+    compiled = {}
+    for key, rule in rules.items():
+        if key == "@global_directives":
+            compiled[key] = dict(rule)
+        else:
+            exprs = []
+            aggregate_exprs = []
+            for expr in rule["functions"]:
+                if getattr(expr, "op", None) in _aggregate_compilers:
+                    aggregate_exprs.append(expr)
+                else:
+                    exprs.append(expr)
+            ordered_exprs = [reorder_expr(expr) for expr in exprs] if reorder else exprs
+            # A repeated rule still gives its own issue, but shares the
+            # first one's validator and prefetch
+            prefetchers = [compile_prefetch(expr) for expr in dict.fromkeys(exprs)]
+            memoize = (all(row_independent(expr) for expr in exprs)
+                       and sum(map(_cost, exprs)) >= MEMO_MIN_COST)
+            compile_function = compile_adaptive if adaptive else compile_expr
+            functions = {expr: compile_function(expr) for expr in ordered_exprs}
+            compiled[key] = {
+                "name": rule["name"],
+                "directives": dict(rule["directives"]),
+                "functions": [functions[expr] for expr in ordered_exprs],
+                "aggregates": [_aggregate_compilers[expr.op](*expr.args) for expr in aggregate_exprs],
+                "aggregate_exprs": aggregate_exprs,
+                "prefetch": [prefetcher for prefetcher in prefetchers if prefetcher is not None],
+                # Kept for anything that works from the rule trees, like
+                # the batch validators. Issues give the rule as written in
+                # exprs, anything checking values uses ordered_exprs.
+                "exprs": exprs,
+                "ordered_exprs": ordered_exprs,
+                # Whether the functions reorder themselves as they run, so
+                # mustn't be replaced by generated code
+                "adaptive": adaptive,
+                # Whether the column's result only depends on its value
+                # and is worth keeping for values seen again
+                "memoize": memoize,
+            }
+    return compiled
+
+
+def row_independent(expr):
+    # True if nothing in expr looks at other columns or outside the CSV
+    if isinstance(expr, ColumnReference):
+        return False
+    if isinstance(expr, Expr):
+        return expr.op not in _EXTERNAL_OPS and all(map(row_independent, expr.args))
+    return True
+
+
+def blocking(expr):
+    # True if expr waits on the filesystem, e.g. to hash a file
+    if isinstance(expr, Expr):
+        return expr.op in _BLOCKING_OPS or any(map(blocking, expr.args))
+    return False
+
+
+def column_references(expr):
+    # Names of the other columns read by expr
+    if isinstance(expr, ColumnReference):
+        return {expr.column_name}
+    if isinstance(expr, Expr):
+        return set().union(*map(column_references, expr.args))
+    return set()
+
+
+def _cost(expr):
+    # Rough cost of checking a value, in string comparisons
+    if not isinstance(expr, Expr):
+        return 0
+    if expr.op in _CHEAP_OPS:
+        own = 1
+    elif expr.op in _BLOCKING_OPS:
+        own = BLOCKING_COST
+    else:
+        own = MEMO_MIN_COST
+    return own + sum(map(_cost, expr.args))
+
+
+def _chain(op, expr):
+    # Operands of a run of the same and/or, a and (b and c) is [a, b, c]
+    if isinstance(expr, Expr) and expr.op == op:
+        return [operand for arg in expr.args for operand in _chain(op, arg)]
+    return [expr]
+
+
+def _segments(operands):
+    # Operands split into runs that can be put in any order. Ones reading
+    # other columns can raise on a short row, so they stay where they are
+    # and whether they're reached doesn't change.
+    segments = [[]]
+    for operand in operands:
+        if column_references(operand):
+            segments += [[operand], []]
+        else:
+            segments[-1].append(operand)
+    return [segment for segment in segments if segment]
+
+
+def _literals(operand):
+    # Strings an or operand allows if it's is or any with only literals
+    if (isinstance(operand, Expr) and operand.op in ("is", "any") and operand.args
+            and all(isinstance(arg, StringLiteral) for arg in operand.args)):
+        return [arg.resolve() for arg in operand.args]
+    return None
+
+
+def _merge_literals(segment):
+    # A run of or operands with the ones like is("a") or any("b", "c")
+    # made into one any, a hash lookup rather than a comparison for each
+    merged = []
+    # Used as an ordered set
+    literals = {}
+    for operand in segment:
+        values = _literals(operand)
+        if values is None:
+            merged.append(operand)
+            continue
+        if not literals:
+            merged.append(None)
+        literals.update(dict.fromkeys(values))
+    if len(literals) > 1:
+        return [Expr("any", *map(StringLiteral, literals)) if operand is None else operand
+                for operand in merged]
+    return segment
+
+
+def reorder_expr(expr):
+    # expr with each and/or's operands cheapest first and repeats left
+    # out. and/or results are only used for their truth, so the result is
+    # the same for every value.
+    if not isinstance(expr, Expr):
+        return expr
+    if expr.op not in ("and", "or"):
+        return Expr(expr.op, *map(reorder_expr, expr.args))
+    operands = []
+    for operand in map(reorder_expr, _chain(expr.op, expr)):
+        if operand not in operands:
+            operands.append(operand)
+    segments = _segments(operands)
+    if expr.op == "or":
+        segments = map(_merge_literals, segments)
+    operands = [operand for segment in segments for operand in sorted(segment, key=_cost)]
+    reordered = operands.pop()
+    for operand in reversed(operands):
+        reordered = Expr(expr.op, operand, reordered)
+    return reordered
+
+
+def compile_adaptive(expr):
+    # Validator for expr that reorders its and/or operands as it runs
+    if isinstance(expr, Expr) and expr.op in ("and", "or"):
+        return AdaptiveChain(expr.op, _chain(expr.op, expr))
+    return compile_expr(expr)
+
+
+class AdaptiveChain:
+    # An and/or as a validator which counts how often each operand
+    # settles the result, by failing an and or passing an or. Every
+    # interval calls the operands in each of _segments are put in order
+    # of their cost over that rate, so the one most likely to settle it
+    # cheaply goes first. Counts from several threads can be lost, which
+    # only changes the order.
+    def __init__(self, op, operands, interval=None):
+        self.settles = op == "or"
+        self.interval = interval or ADAPT_INTERVAL
+        self.costs = [_cost(operand) for operand in operands]
+        self.segments = []
+        position = 0
+        for segment in _segments(operands):
+            self.segments.append(list(range(position, position + len(segment))))
+            position += len(segment)
+        self.validators = [compile_expr(operand) for operand in operands]
+        self.tried = [0] * len(operands)
+        self.settled = [0] * len(operands)
+        self.calls = 0
+        self.order = [(index, validator) for index, validator in enumerate(self.validators)]
+
+    def __call__(self, value, row, colmap):
+        self.calls += 1
+        if self.calls % self.interval == 0:
+            self.reorder()
+        settles = self.settles
+        for index, validator in self.order:
+            self.tried[index] += 1
+            if bool(validator(value, row, colmap)) == settles:
+                self.settled[index] += 1
+                return settles
+        return not settles
+
+    def reorder(self):
+        def rank(index):
+            # Cost over the rate, smoothed so unseen operands get a turn
+            return self.costs[index] * (self.tried[index] + 2) / (self.settled[index] + 1)
+        self.order = [(index, self.validators[index]) for segment in self.segments
+                      for index in sorted(segment, key=rank)]
+
+
+def column_memo(rule, size=MEMO_SIZE):
+    # For a column with "memoize", a function from a value to the number of
+    # the first rule it fails, or None if it's valid. Results are kept for
+    # the last size values, its cache_info() counts hits and misses.
+    functions = rule["functions"]
+    match_is_false = rule["directives"]["matchIsFalse"]
+
+    @lru_cache(maxsize=size)
+    def first_invalid_rule(value):
+        for rule_num, function in enumerate(functions):
+            if bool(function(value, None, None)) == match_is_false:
+                return rule_num
+        return None
+    return first_invalid_rule
+
+
+def _grammar_digest(version):
+    if version not in _grammar_digests:
+        with open(GRAMMAR_DIR / f"csvs_{version}.lark", "rb") as lark_file:
+            _grammar_digests[version] = hashlib.sha256(lark_file.read()).hexdigest()[:16]
+    return _grammar_digests[version]
+
+
+def load_schema(csvs_file, cache_dir=CACHE_DIR):
+    # Parse and transform a schema file into rules, reusing the pickled
+    # rules from an earlier run when the schema text, its folder and the
+    # grammar match. Relative value list paths are resolved against the
+    # schema's folder, so the rules depend on where the schema is.
+    parser = CSVS_Parser(csvs_file, cache_dir=cache_dir)
+    schema_dir = os.path.dirname(os.path.abspath(csvs_file))
+    cache_file = None
+    if cache_dir is not None:
+        schema_digest = hashlib.sha256(
+            f"{schema_dir}\0{parser.schema_text}".encode("utf-8", "surrogatepass")).hexdigest()
+        grammar_digest = _grammar_digest(parser.version)
+        cache_file = Path(cache_dir) / f"schema-{IR_VERSION}-{grammar_digest}-{schema_digest}.pickle"
+        try:
+            with open(cache_file, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            pass
+
+    transformer = CSVS_Transformer()
+    transformer.transform(parser.tree)
+    rules = transformer.rules
+    for key, rule in rules.items():
+        if key != "@global_directives":
+            rule["functions"] = [_resolve_value_lists(expr, schema_dir) for expr in rule["functions"]]
+
+    if cache_file is not None:
+        try:
+            Path(cache_dir).mkdir(parents=True, exist_ok=True)
+            # Write then rename so other processes never see half a file
+            fd, tmp_name = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(rules, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_name, cache_file)
+        except OSError:
+            pass
+    return rules
+
+
+def _resolve_value_lists(expr, schema_dir):
+    # expr with the path of each any(file(...)) that's relative made
+    # relative to schema_dir instead of the working directory
+    if not isinstance(expr, Expr):
+        return expr
+    args = tuple(_resolve_value_lists(arg, schema_dir) for arg in expr.args)
+    if (expr.op == "any" and len(args) == 1 and isinstance(args[0], Expr) and args[0].op == "file"
+            and all(isinstance(provider, StringLiteral) for provider in args[0].args)):
+        path = _uri_path("".join(provider.resolve() for provider in args[0].args))
+        if not os.path.isabs(path):
+            args = (Expr("file", StringLiteral(os.path.join(schema_dir, path))),)
+    return Expr(expr.op, *args)
+
+
+def load_rules(csvs_file, cache_dir=CACHE_DIR, adaptive=False):
+    # Schema file to validators ready for CSV_Validator
+    return compile_rules(load_schema(csvs_file, cache_dir), adaptive=adaptive)
+
+
+# or_expr
+@compiles("or")
+def _or(left, right):
+    or1 = compile_expr(left)
+    or2 = compile_expr(right)
+
+    def or_validator(value, row, colmap):
+        return or1(value, row, colmap) or or2(value, row, colmap)
+    return or_validator
+
+
+# and_expr
+@compiles("and")
+def _and(left, right):
+    and1 = compile_expr(left)
+    and2 = compile_expr(right)
+
+    def and_validator(value, row, colmap):
+        return and1(value, row, colmap) and and2(value, row, colmap)
+    return and_validator
+
+
+# single_expr with an explicit_context_expr
+@compiles("context")
+def _context(context, expr):
+    validator = compile_expr(expr)
+
+    def contextual_validator(value, row, colmap):
+        # Validate the referenced column's value instead
+        return validator(context.resolve(row, colmap), row, colmap)
+    return contextual_validator
+
+
+# is_expr
+@compiles("is")
+def _is(string_provider):
+    def is_validator(value, row, colmap):
+        return value == string_provider.resolve(row, colmap)
+    return is_validator
+
+
+def any_values(providers):
+    # For any(...)'s args, the strings it allows as a frozenset, built
+    # here so each value is one hash lookup however many there are, and
+    # the providers left to compare one by one. Literals after a column
+    # reference are compared in order with it, so a short row fails where
+    # it would with is(...) or is(...).
+    if len(providers) == 1 and isinstance(providers[0], Expr):
+        (file_expr,) = providers
+        if not all(isinstance(provider, StringLiteral) for provider in file_expr.args):
+            raise SchemaError(f"The value list in any({file_expr}) must be a literal path")
+        path = _uri_path("".join(provider.resolve() for provider in file_expr.args))
+        try:
+            return value_lists().get(path), ()
+        except (OSError, UnicodeDecodeError) as e:
+            raise SchemaError(f"Can't read the value list {path}: {e}")
+    leading = []
+    for position, provider in enumerate(providers):
+        if not isinstance(provider, StringLiteral):
+            return frozenset(leading), providers[position:]
+        leading.append(provider.resolve())
+    return frozenset(leading), ()
+
+
+# any_expr
+@compiles("any")
+def _any(*providers):
+    values, rest = any_values(providers)
+    if not rest:
+
+        def any_validator(value, _row, _colmap):
+            return value in values
+    else:
+
+        def any_validator(value, row, colmap):
+            if value in values:
+                return True
+            return any(value == provider.resolve(row, colmap) for provider in rest)
+    return any_validator
+
+
+# not_expr
+@compiles("not")
+def _not(string_provider):
+    def not_validator(value, row, colmap):
+        return value != string_provider.resolve(row, colmap)
+    return not_validator
+
+
+# in_expr
+@compiles("in")
+def _in(string_provider):
+    def in_validator(value, row, colmap):
+        try:
+            return value in string_provider.resolve(row, colmap)
+        except TypeError:
+            return False
+    return in_validator
+
+
+# starts_with_expr
+@compiles("starts")
+def _starts(string_provider):
+    def starts_with_validator(value, row, colmap):
+        target = string_provider.resolve(row, colmap)
+        return value.startswith(target)
+    return starts_with_validator
+
+
+# ends_with_expr
+@compiles("ends")
+def _ends(string_provider):
+    def ends_with_validator(value, row, colmap):
+        ends_with_value = string_provider.resolve(row, colmap)
+        # Strip the white space if there is any
+        value = value.strip()
+        return ends_with_value == value[-len(ends_with_value):]
+    return ends_with_validator
+
+
+# reg_exp_expr
+@compiles("regex")
+def _regex(regex):
+    # Compiled here rather than per cell, fullmatch means the pattern has
+    # to match the whole value
+    try:
+        match_re = compile_pattern(regex.resolve())
+    except re.error as e:
+        raise SchemaError(f"Invalid regex {regex}: {e}")
+
+    def regex_validator(value, _row, _colmap):
+        return match_re.fullmatch(value) is not None
+    return regex_validator
+
+
+# range_expr
+@compiles("range")
+def _range(min_val, max_val):
+    def range_validator(value, _row, _colmap):
+        try:
+            x = float(value)
+        except ValueError:
+            return False
+        return min_val <= x <= max_val
+    return range_validator
+
+
+# length_expr, None is "*"
+@compiles("length")
+def _length(min_len, max_len):
+    if min_len is None and max_len is None:
+        def length_validator(_value, _row, _colmap):
+            return True
+    elif min_len == max_len:
+        def length_validator(value, _row, _colmap):
+            return len(value) == min_len
+    elif max_len is None:
+        def length_validator(value, _row, _colmap):
+            return min_len <= len(value)
+    elif min_len is None:
+        def length_validator(value, _row, _colmap):
+            return len(value) <= max_len
+    else:
+        def length_validator(value, _row, _colmap):
+            return min_len <= len(value) <= max_len
+    return length_validator
+
+
+# empty_expr
+@compiles("empty")
+def _empty():
+    return lambda x, _y, _z: not bool(x)
+
+
+# not_empty_expr
+@compiles("notEmpty")
+def _not_empty():
+    return lambda x, _y, _z: bool(x)
+
+
+# uri_expr
+@compiles("uri")
+def _uri():
+    def uri_validator(value, _row, _colmap):
+        return is_uri(value)
+    return uri_validator
+
+
+# uuid4_expr
+@compiles("uuid4")
+def _uuid4():
+    def uuid4_validator(value, _row, _colmap):
+        return UUID4_PATTERN.fullmatch(value.strip()) is not None
+    return uuid4_validator
+
+
+# positive_integer_expr
+@compiles("positiveInteger")
+def _positive_integer():
+    def positive_integer_validator(value, _row, _colmap):
+        try:
+            return float(value) == int(value) and int(value) > 0
+        except ValueError:
+            return False
+    return positive_integer_validator
+
+
+def _bounds(key, op, bounds):
+    # Bounds of a date rule as comparable integers, worked out once here
+    # rather than per cell
+    keys = [key(bound) for bound in bounds]
+    if None in keys:
+        raise SchemaError(f"Invalid bound for {op}: {', '.join(bounds)}")
+    return min(keys), max(keys)
+
+
+def _date_rule(op, key):
+    # Validator for one of the date rules taking an optional (from, to)
+    # for a value parsed by key
+    def compile_date(*bounds):
+        if not bounds:
+            def date_validator(value, _row, _colmap):
+                return key(value) is not None
+            return date_validator
+        low, high = _bounds(key, op, bounds)
+
+        def date_range_validator(value, _row, _colmap):
+            parsed = key(value)
+            return parsed is not None and low <= parsed <= high
+        return date_range_validator
+    return compiles(op)(compile_date)
+
+
+# xsd_date_time_expr, xsd_date_time_with_time_zone_expr, xsd_date_expr,
+# xsd_time_expr and uk_date_expr
+_date_rule("xDateTime", xsd_date_time_key)
+_date_rule("xDateTimeTz", xsd_date_time_tz_key)
+_date_rule("xDate", xsd_date_key)
+_date_rule("xTime", xsd_time_key)
+_date_rule("ukDate", uk_date_key)
+
+
+# date_expr
+@compiles("date")
+def _date(year, month, day, *bounds):
+    low = high = None
+    if bounds:
+        low, high = _bounds(xsd_date_key, "date", bounds)
+
+    def date_validator(_value, row, colmap):
+        parsed = date_parts_key(year.resolve(row, colmap), month.resolve(row, colmap),
+                                day.resolve(row, colmap))
+        if parsed is None:
+            return False
+        return low is None or low <= parsed <= high
+    return date_validator
+
+
+# partial_uk_date_expr
+@compiles("partUkDate")
+def _partial_uk_date():
+    def partial_uk_date_validator(value, _row, _colmap):
+        return is_partial_uk_date(value)
+    return partial_uk_date_validator
+
+
+# partial_date_expr
+@compiles("partDate")
+def _partial_date(year, month, day):
+    def partial_date_validator(_value, row, colmap):
+        return is_partial_date(year.resolve(row, colmap), month.resolve(row, colmap),
+                               day.resolve(row, colmap))
+    return partial_date_validator
+
+
+def _uri_path(path_str):
+    # Paths can be given as file:// uris
+    return unquote(urlparse(path_str).path)
+
+
+# file_exists_expr, looked up in the shared FileIndex
+@compiles("fileExists")
+def _file_exists(*base):
+    if not base:
+
+        def file_exists_validator(path_str, _row, _colmap):
+            return file_index().exists(_uri_path(path_str))
+    else:
+        base_provider, = base
+
+        def file_exists_validator(file_path, row, colmap):
+            base = base_provider.resolve(row, colmap)
+            return file_index().exists(_uri_path(str(base) + str(file_path)))
+    return file_exists_validator
+
+
+# file_count_expr, the value is the number of files matching the path,
+# which can have wildcards
+@compiles("fileCount")
+def _file_count(file_expr):
+    resolve_path = compile_expr(file_expr)
+
+    def file_count_validator(value, row, colmap):
+        try:
+            expected = int(value)
+        except ValueError:
+            return False
+        return file_index().count(str(resolve_path(value, row, colmap))) == expected
+    return file_count_validator
+
+
+# checksum_expr
+@compiles("checksum")
+def _checksum(file_expr, checksum_type):
+    try:
+        checksum_algorithm(checksum_type.resolve())
+    except ValueError as e:
+        raise SchemaError(str(e))
+    resolve_path = compile_expr(file_expr)
+
+    def checksum_validator(value, row, colmap):
+        checksum_lib = checksum_type.resolve(row, colmap)
+        # Waits for the digest if it was prefetched
+        try:
+            digest = checksum_pool().digest(resolve_path(value, row, colmap), checksum_lib)
+        except OSError:
+            # A missing or unreadable file is an invalid element
+            return False
+        return value == digest
+
+    return checksum_validator
+
+
+@prefetches("checksum")
+def _prefetch_checksum(file_expr, checksum_type):
+    resolve_path = compile_expr(file_expr)
+
+    def checksum_prefetcher(value, row, colmap):
+        checksum_pool().submit(resolve_path(value, row, colmap), checksum_type.resolve(row, colmap))
+    return checksum_prefetcher
+
+
+# Prefetch both sides of combined expressions, a few extra hashes are
+# cheaper than waiting on the ones that are needed
+def _prefetch_all(*exprs):
+    prefetchers = [compile_prefetch(expr) for expr in exprs if expr is not None]
+    prefetchers = [prefetcher for prefetcher in prefetchers if prefetcher is not None]
+    if not prefetchers:
+        return None
+
+    def prefetcher(value, row, colmap):
+        for prefetch in prefetchers:
+            prefetch(value, row, colmap)
+    return prefetcher
+
+
+prefetches("or")(_prefetch_all)
+prefetches("and")(_prefetch_all)
+prefetches("if")(_prefetch_all)
+
+
+@prefetches("context")
+def _prefetch_context(context, expr):
+    prefetch = compile_prefetch(expr)
+    if prefetch is None:
+        return None
+
+    def contextual_prefetcher(value, row, colmap):
+        prefetch(context.resolve(row, colmap), row, colmap)
+    return contextual_prefetcher
+
+
+# file_expr, returns the path rather than True/False
+@compiles("file")
+def _file(*providers):
+    if len(providers) == 1:
+        # Single argument form: file(path)
+        (path_provider,) = providers
+
+        def resolve_path(_value, row, colmap):
+            return Path(_uri_path(path_provider.resolve(row, colmap)))
+
+    else:
+        # 2 argument form: file(base, path)
+        base_provider, path_provider = providers
+
+        def resolve_path(_value, row, colmap):
+            base = base_provider.resolve(row, colmap)
+            file_path = path_provider.resolve(row, colmap)
+            return Path(_uri_path(str(base) + str(file_path)))
+
+    return resolve_path
+
+
+# unique_expr, the column's value or the values of the given columns
+# must not repeat in any other row
+@compiles_aggregate("unique")
+def _unique(*columns):
+    return UniqueRule(columns)
+
+
+# integrity_check_expr: integrityCheck([base,] [folder,] "includeFolder"),
+# base is added to each path like fileExists(base), and the folder under
+# base is walked for the files that should all be in the column
+@compiles_aggregate("integrityCheck")
+def _integrity_check(*args):
+    *providers, folder_option = args
+    base_provider = providers[0] if providers else StringLiteral("")
+    folder_provider = providers[1] if len(providers) > 1 else StringLiteral("")
+
+    def resolve_path(value, row, colmap):
+        return _uri_path(str(base_provider.resolve(row, colmap)) + value)
+
+    def resolve_root(row, colmap):
+        base = str(base_provider.resolve(row, colmap))
+        return _uri_path(base + str(folder_provider.resolve(row, colmap)))
+
+    include_folders = folder_option.resolve() == "includeFolder"
+    return IntegrityRule(resolve_path, resolve_root, include_folders)
+
+
+# if_expr
+@compiles("if")
+def _if(condition, then_expr, else_expr=None):
+    condition = compile_expr(condition)
+    then_validator = compile_expr(then_expr)
+
+    if else_expr is not None:
+        else_validator = compile_expr(else_expr)
+
+        def if_validator(value, row, colmap):
+            if condition(value, row, colmap):
+                return then_validator(value, row, colmap)
+            else:
+                return else_validator(value, row, colmap)
+    else:
+        def if_validator(value, row, colmap):
+            if condition(value, row, colmap):
+                return then_validator(value, row, colmap)
+            else:
+                return True
+    return if_validator
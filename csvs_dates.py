@@ -0,0 +1,197 @@
+from functools import lru_cache
+from csvs_patterns import compile_pattern
+
+# Parsed values kept by each of the parse functions. Date columns repeat
+# the same values a lot, so most cells are answered from the cache.
+DATE_CACHE_SIZE = 4096
+
+NS_PER_SECOND = 10 ** 9
+NS_PER_DAY = 86400 * NS_PER_SECOND
+
+MONTH_NAMES = ["January", "February", "March", "April", "May", "June", "July", "August",
+               "September", "October", "November", "December"]
+
+_DATE = r"(-?(?:[1-9][0-9]{4,}|[0-9]{4}))-([0-9]{2})-([0-9]{2})"
+_TIME = r"([0-9]{2}):([0-9]{2}):([0-9]{2})(?:\.([0-9]+))?"
+_TIMEZONE = r"(Z|[+-][0-9]{2}:[0-9]{2})"
+
+XSD_DATE_TIME_PATTERN = compile_pattern(f"{_DATE}T{_TIME}{_TIMEZONE}?")
+XSD_DATE_TIME_TZ_PATTERN = compile_pattern(f"{_DATE}T{_TIME}{_TIMEZONE}")
+XSD_DATE_PATTERN = compile_pattern(f"{_DATE}{_TIMEZONE}?")
+XSD_TIME_PATTERN = compile_pattern(f"{_TIME}{_TIMEZONE}?")
+UK_DATE_PATTERN = compile_pattern(r"([0-9]{2})/([0-9]{2})/([0-9]{4})")
+YEAR_PATTERN = compile_pattern(r"-?(?:[1-9][0-9]{4,}|[0-9]{4})")
+TWO_DIGITS_PATTERN = compile_pattern(r"[0-9]{2}")
+
+# Unknown parts of a partial date are ? for each unknown digit, or * for
+# the whole part
+_MONTHS = "|".join(MONTH_NAMES)
+PARTIAL_UK_DATE_PATTERN = compile_pattern(
+    r"(([0?][1-9?])|([1-2?][0-9?])|([3?][0-1?])|\*)/"
+    rf"({_MONTHS}|\?|\*)/"
+    r"([0-9?]{4}|\*)"
+)
+PARTIAL_DAY_PATTERN = compile_pattern(r"([0?][1-9?])|([1-2?][0-9?])|([3?][0-1?])|\*")
+PARTIAL_MONTH_PATTERN = compile_pattern(rf"(0[1-9]|1[0-2]|[0-1?][0-9?]|{_MONTHS}|\?|\*)")
+PARTIAL_YEAR_PATTERN = compile_pattern(r"[0-9?]{4}|\*")
+
+
+def _is_leap(year):
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def _month_days(year, month):
+    if month == 2:
+        return 29 if _is_leap(year) else 28
+    return 30 if month in (4, 6, 9, 11) else 31
+
+
+def day_number(year, month, day):
+    # Days since 1970-01-01 in the proleptic Gregorian calendar, any year
+    # including 0 and before, or None if there's no such day
+    if not 1 <= month <= 12 or not 1 <= day <= _month_days(year, month):
+        return None
+    year -= month <= 2
+    era = year // 400
+    year_of_era = year - era * 400
+    day_of_year = (153 * ((month + 9) % 12) + 2) // 5 + day - 1
+    day_of_era = year_of_era * 365 + year_of_era // 4 - year_of_era // 100 + day_of_year
+    return era * 146097 + day_of_era - 719468
+
+
+def _time_of_day(hour, minute, second, fraction):
+    # Nanoseconds since midnight, or None. 24:00:00 is the end of the day.
+    fraction = fraction or ""
+    if minute > 59 or second > 59:
+        return None
+    if hour == 24:
+        if minute or second or fraction.strip("0"):
+            return None
+    elif hour > 23:
+        return None
+    nanoseconds = int(fraction[:9].ljust(9, "0")) if fraction else 0
+    return (hour * 3600 + minute * 60 + second) * NS_PER_SECOND + nanoseconds
+
+
+def _offset(timezone):
+    # Nanoseconds to take away to get UTC, None if out of range
+    if not timezone or timezone == "Z":
+        return 0
+    hours, minutes = int(timezone[1:3]), int(timezone[4:6])
+    if minutes > 59 or hours * 60 + minutes > 14 * 60:
+        return None
+    offset = (hours * 3600 + minutes * 60) * NS_PER_SECOND
+    return -offset if timezone[0] == "-" else offset
+
+
+def _date_time_key(match):
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, fraction, timezone = match.groups()
+    days = day_number(int(year), int(month), int(day))
+    time = _time_of_day(int(hour), int(minute), int(second), fraction)
+    offset = _offset(timezone)
+    if days is None or time is None or offset is None:
+        return None
+    return days * NS_PER_DAY + time - offset
+
+
+# Each key function gives a comparable integer, or None for a value that
+# isn't valid. Values with a timezone are compared in UTC, ones without
+# are taken as UTC.
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def xsd_date_time_key(value):
+    # Nanoseconds since the epoch
+    return _date_time_key(XSD_DATE_TIME_PATTERN.fullmatch(value))
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def xsd_date_time_tz_key(value):
+    return _date_time_key(XSD_DATE_TIME_TZ_PATTERN.fullmatch(value))
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def xsd_date_key(value):
+    # Day number, the timezone has to be valid but doesn't move the day
+    match = XSD_DATE_PATTERN.fullmatch(value)
+    if match is None:
+        return None
+    year, month, day, timezone = match.groups()
+    if _offset(timezone) is None:
+        return None
+    return day_number(int(year), int(month), int(day))
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def xsd_time_key(value):
+    # Nanoseconds since midnight UTC, which can be outside 0 to 24 hours
+    match = XSD_TIME_PATTERN.fullmatch(value)
+    if match is None:
+        return None
+    hour, minute, second, fraction, timezone = match.groups()
+    time = _time_of_day(int(hour), int(minute), int(second), fraction)
+    offset = _offset(timezone)
+    if time is None or offset is None:
+        return None
+    return time - offset
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def uk_date_key(value):
+    # Day number of a dd/mm/yyyy date
+    match = UK_DATE_PATTERN.fullmatch(value)
+    if match is None:
+        return None
+    day, month, year = match.groups()
+    return day_number(int(year), int(month), int(day))
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def date_parts_key(year, month, day):
+    # Day number of a date given as separate year, month and day, which
+    # have to be written as in an xDate
+    if (YEAR_PATTERN.fullmatch(year) is None or TWO_DIGITS_PATTERN.fullmatch(month) is None
+            or TWO_DIGITS_PATTERN.fullmatch(day) is None):
+        return None
+    return day_number(int(year), int(month), int(day))
+
+
+def _partial_is_valid(year, month, day):
+    # Only a fully known date is checked against the calendar, otherwise
+    # the day has to fit the month if that's known, with 29 February
+    # allowed when the year isn't known
+    month_known = month.isdigit() or month in MONTH_NAMES
+    if not month_known or not day.isdigit():
+        return True
+    month = int(month) if month.isdigit() else MONTH_NAMES.index(month) + 1
+    year = int(year) if year.isdigit() else 2000
+    return day_number(year, month, int(day)) is not None
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def is_partial_uk_date(value):
+    # dd/Month/yyyy with unknown parts, e.g. ?1/*/19??
+    match = PARTIAL_UK_DATE_PATTERN.fullmatch(value)
+    if match is None:
+        return False
+    day, month, year = value.split("/")
+    return _partial_is_valid(year, month, day)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def is_partial_date(year, month, day):
+    if (PARTIAL_YEAR_PATTERN.fullmatch(year) is None
+            or PARTIAL_MONTH_PATTERN.fullmatch(month) is None
+            or PARTIAL_DAY_PATTERN.fullmatch(day) is None):
+        return False
+    return _partial_is_valid(year, month, day)
+
+
+def date_cache_info():
+    # Hits and misses of each parse function, for profiling
+    return {
+        function.__name__: function.cache_info()
+        for function in (xsd_date_time_key, xsd_date_time_tz_key, xsd_date_key, xsd_time_key,
+                         uk_date_key, date_parts_key, is_partial_uk_date, is_partial_date)
+    }
@@ -0,0 +1,106 @@
+import datetime
+import pytest
+import csvs_dates
+from csvs_compiler import compile_rules, load_schema
+from csvs_dates import (day_number, is_partial_date, is_partial_uk_date, uk_date_key,
+                        xsd_date_key, xsd_date_time_key, xsd_date_time_tz_key, xsd_time_key)
+from csvs_parser import SchemaError
+
+SCHEMA = """version 1.1
+@totalColumns 9
+a: xDateTime
+b: xDateTimeTz(2000-01-01T00:00:00Z, 2020-12-31T23:59:59+01:00)
+c: xDate(1990-01-01, 2000-12-31Z)
+d: xTime(09:00:00Z, 17:00:00.000Z)
+e: ukDate(01/01/1900, 31/12/1999)
+f: ukDate
+g: date($year, "02", "29", 1990-01-01, 2010-01-01)
+h: partUkDate
+year: partDate($year, "*", "31")
+"""
+
+
+@pytest.fixture
+def rules(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(SCHEMA)
+    return compile_rules(load_schema(schema_file, cache_dir=None))
+
+
+def _valid(rules, column, value, row=None):
+    function, = rules[column]["functions"]
+    colmap = {"year": 8}
+    return bool(function(value, row or [""] * 8 + [value], colmap))
+
+
+def test_day_number():
+    for date in (datetime.date(1, 1, 1), datetime.date(1970, 1, 1), datetime.date(2024, 2, 29),
+                 datetime.date(9999, 12, 31)):
+        assert day_number(date.year, date.month, date.day) == (date - datetime.date(1970, 1, 1)).days
+    assert day_number(2023, 2, 29) is None
+    assert day_number(2000, 4, 31) is None
+    assert day_number(0, 2, 29) == day_number(1, 1, 1) - 307
+    assert day_number(-1, 12, 31) < day_number(0, 1, 1)
+
+
+def test_xsd_keys():
+    assert xsd_date_time_key("2000-01-01T00:00:00") == 946684800 * 10 ** 9
+    assert xsd_date_time_key("2000-01-01T01:00:00+01:00") == xsd_date_time_key("2000-01-01T00:00:00Z")
+    assert xsd_date_time_key("2000-01-01T00:00:00.5") == xsd_date_time_key("2000-01-01T00:00:00") + 5 * 10 ** 8
+    assert xsd_date_time_key("2000-01-01T24:00:00") == xsd_date_time_key("2000-01-02T00:00:00")
+    for invalid in ("2000-01-01", "2000-01-01T24:00:01", "2001-02-29T00:00:00", "2000-01-01 00:00:00",
+                    "2000-01-01T00:00:00+15:00", "2000-1-01T00:00:00"):
+        assert xsd_date_time_key(invalid) is None, invalid
+    assert xsd_date_time_tz_key("2000-01-01T00:00:00") is None
+    assert xsd_date_time_tz_key("2000-01-01T00:00:00-05:30") is not None
+    assert xsd_date_key("-0044-03-15") < xsd_date_key("0001-01-01Z") < xsd_date_key("12000-01-01")
+    assert xsd_date_key("02000-01-01") is None
+    assert xsd_time_key("12:00:00+01:00") == xsd_time_key("11:00:00Z")
+    assert xsd_time_key("12:60:00") is None
+    assert uk_date_key("29/02/2024") == xsd_date_key("2024-02-29")
+    assert uk_date_key("29/02/2023") is None
+
+
+def test_partial_dates():
+    for valid in ("01/January/2000", "?1/*/19??", "*/*/*", "31/?/2000", "29/February/????"):
+        assert is_partial_uk_date(valid), valid
+    for invalid in ("31/April/2000", "29/February/2023", "01/Jan/2000", "1/January/2000", ""):
+        assert not is_partial_uk_date(invalid), invalid
+    assert is_partial_date("2000", "02", "29")
+    assert is_partial_date("19??", "*", "31")
+    assert is_partial_date("*", "February", "2?")
+    assert not is_partial_date("2023", "02", "29")
+    assert not is_partial_date("2000", "13", "01")
+
+
+def test_date_rules(rules):
+    assert _valid(rules, 0, "2010-06-01T12:30:00")
+    assert not _valid(rules, 0, "2010-06-01")
+    assert _valid(rules, 1, "2020-12-31T22:59:59Z")
+    assert not _valid(rules, 1, "2020-12-31T23:00:00Z")
+    assert not _valid(rules, 1, "2010-01-01T00:00:00")
+    assert _valid(rules, 2, "2000-12-31") and not _valid(rules, 2, "2001-01-01")
+    assert _valid(rules, 3, "10:00:00+01:00") and not _valid(rules, 3, "08:59:59Z")
+    assert _valid(rules, 4, "31/12/1999") and not _valid(rules, 4, "01/01/2000")
+    assert _valid(rules, 5, "01/01/2000") and not _valid(rules, 5, "2000-01-01")
+    # The year comes from the year column
+    assert _valid(rules, 6, "", [""] * 8 + ["2000"])
+    assert not _valid(rules, 6, "", [""] * 8 + ["2001"])
+    assert not _valid(rules, 6, "", [""] * 8 + ["2012"])
+    assert _valid(rules, 7, "?1/March/1900")
+    assert _valid(rules, 8, "19??") and not _valid(rules, 8, "20")
+
+
+def test_invalid_bound(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text("version 1.0\na: xDate(2023-02-29Z, 2024-01-01Z)\n")
+    with pytest.raises(SchemaError):
+        compile_rules(load_schema(schema_file, cache_dir=None))
+
+
+def test_parsed_values_are_cached():
+    csvs_dates.uk_date_key.cache_clear()
+    for _ in range(100):
+        uk_date_key("01/02/2003")
+    info = csvs_dates.date_cache_info()["uk_date_key"]
+    assert (info.hits, info.misses) == (99, 1)
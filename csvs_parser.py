@@ -1,87 +1,162 @@
+import logging
+import os
 import re
 from pathlib import Path
-from urllib.parse import unquote, urlparse
 from lark import Lark, Transformer
-from external_validators import file_checksum
+from lark.exceptions import UnexpectedInput
+
+logger = logging.getLogger(__name__)
 
 # This parser is for CSVS version 1.0
 VERSION = 1.0
 
+# Grammars are found next to this file, not in the working directory
+GRAMMAR_DIR = Path(__file__).resolve().parent / "data"
+
+# Built parser tables are cached here, one file per grammar version
+CACHE_DIR = Path(os.environ.get(
+    "CSV_VALIDATOR_CACHE",
+    Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "csv-validator"))
+
+# Lark parsers already built in this process, by (version, parser type)
+_lark_parsers = {}
+
 
 class StringLiteral:
     # Just so we can treat all string provider types the same
     def __init__(self, value):
         self._value = value
-        self.row = []
-        self.colmap = 0
 
     def __repr__(self):
         return self._value
 
-    def resolve(self):
+    def __str__(self):
+        return f"\"{self._value}\""
+
+    def __eq__(self, other):
+        return isinstance(other, StringLiteral) and self._value == other._value
+
+    def __hash__(self):
+        return hash(self._value)
+
+    def resolve(self, _row=None, _colmap=None):
         return self._value
 
 
 class ColumnReference:
+    # The row and column map are passed in for each call rather than
+    # stored, so one compiled schema can be shared between threads
     def __init__(self, column_name: str):
         self._column_name = column_name
-        self._row = []
-        self._colmap = 0
 
     def __repr__(self):
-        return f"${self._column_name} {self._row} {self._colmap}"
+        return f"ColumnReference({self._column_name!r})"
+
+    def __str__(self):
+        return f"${self._column_name}"
+
+    def __eq__(self, other):
+        return isinstance(other, ColumnReference) and self._column_name == other._column_name
+
+    def __hash__(self):
+        return hash(self._column_name)
 
     @property
     def column_name(self):
         return self._column_name
 
-    @property
-    def row(self):
-        return self._row
+    def resolve(self, row, colmap):
+        index = colmap[self._column_name]
+        return row[index]
 
-    @row.setter
-    def row(self, row_value: list):
-        self._row = row_value
 
-    @property
-    def colmap(self):
-        return self._colmap
+class Expr:
+    # One node of the compiled rule tree. op is the CSVS expression name,
+    # e.g. "is", "or" or "range", and args are other Exprs, string
+    # providers or plain values. Exprs are plain data so they can be
+    # pickled and cached, csvs_compiler turns them into validators.
+    def __init__(self, op, *args):
+        self.op = op
+        self.args = args
+
+    def __repr__(self):
+        return f"Expr({self.op!r}, {', '.join(map(repr, self.args))})"
+
+    def __str__(self):
+        # Written back out in CSVS syntax
+        if self.op in ("or", "and"):
+            return f"{self.args[0]} {self.op} {self.args[1]}"
+        if self.op == "context":
+            return f"{self.args[0]}/{self.args[1]}"
+        if not self.args:
+            return self.op
+        args = []
+        for arg in self.args:
+            if isinstance(arg, float):
+                args.append(f"{arg:g}")
+            elif arg is None:
+                args.append("*")
+            else:
+                args.append(str(arg))
+        return f"{self.op}({', '.join(args)})"
 
-    @colmap.setter
-    def colmap(self, colmap_value):
-        self._colmap = colmap_value
+    def __eq__(self, other):
+        return isinstance(other, Expr) and (self.op, self.args) == (other.op, other.args)
 
-    def resolve(self):
-        index = self._colmap[self._column_name]
-        return self._row[index]
+    def __hash__(self):
+        return hash((self.op, self.args))
 
 
 class SchemaError(Exception):
-    def __init__(self, message):
-        print(message)
+    pass
+
+
+def get_lark_parser(version, parser="lalr", cache_dir=CACHE_DIR):
+    # The LALR parser is deterministic and its tables can be cached on disk,
+    # so after the first run loading it only unpickles the tables. Lark
+    # checks the grammar hash stored in the cache file and rebuilds it if
+    # the grammar changed.
+    key = (version, parser)
+    if key not in _lark_parsers:
+        grammar_file = GRAMMAR_DIR / f"csvs_{version}.lark"
+        with open(grammar_file) as lark_file:
+            lark_text = lark_file.read()
+        if parser == "lalr":
+            cache = False
+            if cache_dir is not None:
+                try:
+                    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+                    cache = str(Path(cache_dir) / f"csvs_{version}.lark.cache")
+                except OSError:
+                    pass
+            _lark_parsers[key] = Lark(lark_text, start="start", parser="lalr", cache=cache)
+        else:
+            _lark_parsers[key] = Lark(lark_text, start="start", lexer="dynamic")
+    return _lark_parsers[key]
 
 
 class CSVS_Parser:
-    def __init__(self, csvs_file):
+    def __init__(self, csvs_file, cache_dir=CACHE_DIR):
         self._valid_version = ["1.0", "1.1", "1.2"]
         with open(csvs_file) as csvs_text:
             self._schema_text = self._strip_comments(csvs_text.read())
-        print(self._schema_text)
+        logger.debug("Schema:\n%s", self._schema_text)
         self._version = self._get_version()
-        print(f"CSVS version {self._version}")
-        lark_file_version = Path()
-        if self._version == "1.0":
-            lark_file_version = Path("data/csvs_1.0.lark")
-        elif self._version == "1.1":
-            lark_file_version = Path("data/csvs_1.1.lark")
-        elif self._version == "1.2":
-            lark_file_version = Path("data/csvs_1.2.lark")
-
-        with open(lark_file_version) as lark_file:
-            lark_text = lark_file.read()
-        self._csvs_parser = Lark(lark_text, start="start", lexer="dynamic")
-        # print(self._csvs_parser.parse(self._schema_text).pretty())
-        self._tree = self._csvs_parser.parse(self._schema_text)
+        logger.info("CSVS version %s", self._version)
+        self._cache_dir = cache_dir
+        # Parsed on first use, cached schemas never need the tree
+        self._tree = None
+
+    def _parse(self):
+        try:
+            self._csvs_parser = get_lark_parser(self._version, "lalr", self._cache_dir)
+            return self._csvs_parser.parse(self._schema_text)
+        except UnexpectedInput:
+            # The Earley parser's dynamic lexer copes with a few schemas the
+            # LALR lexer can't, e.g. a column named like a keyword ("uri:")
+            # after a column with no rules
+            self._csvs_parser = get_lark_parser(self._version, "earley")
+            return self._csvs_parser.parse(self._schema_text)
 
     def _strip_comments(self, schema):
         # Block comments, everything between "/*" and "*/"
@@ -106,8 +181,18 @@ class CSVS_Parser:
         else:
             return version[1]
 
+    @property
+    def schema_text(self):
+        return self._schema_text
+
+    @property
+    def version(self):
+        return self._version
+
     @property
     def tree(self):
+        if self._tree is None:
+            self._tree = self._parse()
         return self._tree
 
 
@@ -131,6 +216,10 @@ class CSVS_Transformer(Transformer):
 
     # version_decl: "version 1.0" // 3
     def version_decl(self, vd):
+        # From 1.1 the version is part of the "version 1.x" keyword so
+        # there is nothing left in the tree to check
+        if not vd:
+            return None
         (vd,) = vd
         if vd != 1.0:
             raise SchemaError("Incorrect version of CSVS.")
@@ -171,7 +260,6 @@ class CSVS_Transformer(Transformer):
     # positive_non_zero_integer_literal// 10
     def total_columns_directive(self, tree):
         (_, tree) = tree
-        print("Total Columns: ", tree)
         self._rules["@global_directives"]["total_columns"] = int(tree.value)
         return tree
 
@@ -195,7 +283,7 @@ class CSVS_Transformer(Transformer):
         col_num = self.column_counter
         self.column_counter += 1
         self._rules[col_num] = {
-            "name": column.value
+            "name": str(column)
         }
         self._rules[col_num]["directives"] = rules[-1]
         self._rules[col_num]["functions"] = rules[0:-1]
@@ -259,18 +347,12 @@ class CSVS_Transformer(Transformer):
     # or_expr: non_combinatorial_expr "or" column_validation_expr // 29
     def or_expr(self, tree):
         (or1, or2) = tree
-
-        def or_validator(value, row, colmap):
-            return or1(value, row, colmap) or or2(value, row, colmap)
-        return or_validator
+        return Expr("or", or1, or2)
 
     # and_expr: non_combinatorial_expr "and" column_validation_expr // 30
     def and_expr(self, tree):
         (and1, and2) = tree
-
-        def and_validator(value, row, colmap):
-            return and1(value, row, colmap) and and2(value, row, colmap)
-        return and_validator
+        return Expr("and", and1, and2)
 
     # non_combinatorial_expr: non_conditional_expr | conditional_expr // 31
     def non_combinatorial_expr(self, tree):
@@ -283,7 +365,6 @@ class CSVS_Transformer(Transformer):
     # external_single_expr | parenthesized_expr // 32
     def non_conditional_expr(self, tree):
         (tree, ) = tree
-        print(tree)
         return tree
 
     # single_expr: explicit_context_expr? ( is_expr | not_expr |
@@ -297,15 +378,9 @@ class CSVS_Transformer(Transformer):
             (expr, ) = tree
             return expr
         else:
+            # Validate the value of another column instead of this one
             (context, expr) = tree
-
-            def contextual_validator(value, row, colmap):
-                # Set the context for the column reference
-                context.row = row
-                context.colmap = colmap
-                context_value = context.resolve()
-                return expr(context_value, row, colmap)
-            return contextual_validator
+            return Expr("context", context, expr)
 
     # explicit_context_expr: column_ref "/" // 34
     def explicit_context_expr(self, tree):
@@ -315,111 +390,71 @@ class CSVS_Transformer(Transformer):
     # column_ref: "$" ( column_identifier | quoted_column_identifier ) // 35
     def column_ref(self, tree):
         (tree,) = tree
-        col_ref = ColumnReference(tree)
+        col_ref = ColumnReference(str(tree))
         return col_ref
 
+    # unique_expr: "unique" ("(" column_ref ("," column_ref)* ")")? // 47
+    def unique_expr(self, tree):
+        return Expr("unique", *tree)
+
     # is_expr: "is(" string_provider ")" // 36
     def is_expr(self, tree):
         (string_provider,) = tree
+        return Expr("is", string_provider)
 
-        def is_validator(value, row, colmap):
-            if isinstance(string_provider, ColumnReference):
-                string_provider.row = row
-                string_provider.colmap = colmap
-            return value == string_provider.resolve()
-        return is_validator
+    # any_expr: "any(" ( string_provider ("," string_provider)* |
+    # file_expr ) ")" // 38 (1.2)
+    def any_expr(self, tree):
+        # The strings given, or a file(...) of values one per line
+        return Expr("any", *tree)
 
     # not_expr: "not(" string_provider ")" // 37
     def not_expr(self, tree):
         (tree,) = tree
-
-        def not_validator(value, row, colmap):
-            tree.row = row
-            tree.colmap = colmap
-            return value != tree.resolve()
-        return not_validator
+        return Expr("not", tree)
 
     # in_expr: "in(" string_provider ")" // 38
     def in_expr(self, tree):
         (tree, ) = tree
-
-        def in_validator(value, row, colmap):
-            tree.row = row
-            tree.colmap = colmap
-            try:
-                return value in tree.resolve()
-            except TypeError:
-                return False
-        return in_validator
+        return Expr("in", tree)
 
     # starts_with_expr: "starts(" string_provider ")" // 39
     def starts_with_expr(self, tree):
         (string_provider, ) = tree
-
-        def starts_with_validator(value, row, colmap):
-            # Strip the white space if there is any
-            if isinstance(string_provider, ColumnReference):
-                string_provider.row = row
-                string_provider.colmap = colmap
-            target = string_provider.resolve()
-            return value.startswith(target)
-        return starts_with_validator
+        return Expr("starts", string_provider)
 
     # ends_with_expr: "ends(" string_provider ")" // 40
     def ends_with_expr(self, tree):
         (tree, ) = tree
-
-        def ends_with_validator(value, row, colmap):
-            tree.row = row
-            tree.colmap = colmap
-            ends_with_value = tree.resolve()
-            value = value.strip()
-            return ends_with_value == value[-len(ends_with_value):]
-        return ends_with_validator
+        return Expr("ends", tree)
 
     # reg_exp_expr: "regex(" string_literal ")" // 41
     def reg_exp_expr(self, tree):
         (regex, ) = tree
-
-        def regex_validator(value, _row, _colmap):
-            match_re = re.compile(r"^" + regex.resolve() + "$")
-            if re.match(match_re, value):
-                return True
-            else:
-                return False
-        return regex_validator
+        return Expr("regex", regex)
 
     # range_expr: "range(" numeric_literal "," numeric_literal ")" // 42
     def range_expr(self, tree):
         # Parser will only allow numbers
         min_val = min([float(tree[0]), float(tree[1])])
         max_val = max([float(tree[0]), float(tree[1])])
-
-        def range_validator(value, _row, _colmap):
-            try:
-                x = float(value)
-            except ValueError:
-                return False
-            return min_val <= x <= max_val
-        return range_validator
+        return Expr("range", min_val, max_val)
 
     # length_expr: "length(" ( positive_integer_or_any ",")?
     # positive_integer_or_any ")" // 43
     def length_expr(self, tree):
+        # Stored as (min, max), None where the schema has "*"
         if type(tree) is int:
-            def length_validator(value, _row, _colmap):
-                return len(value) == tree
-        else:
-            if tree[1] == '*':
-                def length_validator(value, _row, _colmap):
-                    return tree[0] <= len(value)
-            elif tree[0] == '*':
-                def length_validator(value, _row, _colmap):
-                    return len(value) <= tree[1]
-            else:
-                def length_validator(value, _row, _colmap):
-                    return tree[0] <= len(value) <= tree[1]
-        return length_validator
+            return Expr("length", tree, tree)
+        bounds = [None if bound == '*' else bound for bound in tree]
+        if len(bounds) == 1:
+            return Expr("length", bounds[0], bounds[0])
+        return Expr("length", *bounds)
+
+    # numeric_or_any: numeric_literal | wildcard_literal // 45 (1.1)
+    def numeric_or_any(self, tree):
+        (tree, ) = tree
+        return tree
 
     # positive_integer_or_any: positive_integer_literal |
     # wildcard_literal // 44
@@ -429,58 +464,65 @@ class CSVS_Transformer(Transformer):
 
     # empty_expr: "empty" // 45
     def empty_expr(self, _):
-        return lambda x, _y, _z: not bool(x)
+        return Expr("empty")
 
     # not_empty_expr: "notEmpty" // 46
     def not_empty_expr(self, _x):
-        return lambda x, _y, _z: bool(x)
-
-    # unique_expr: "unique" ("("
-    #   column_ref ("," column_ref)* ")")? // 47
+        return Expr("notEmpty")
 
     # uri_expr: "uri" // 48
     def uri_expr(self, _):
-        def uri_validator(value, _row, _colmap):
-            from rfc3986_validator import validate_rfc3986
-            return validate_rfc3986(value)
-        return uri_validator
+        return Expr("uri")
 
     # xsd_date_time_expr: "xDateTime" ("(" xsd_date_time_literal ","
     #   xsd_date_time_literal ")")? // 49
+    def xsd_date_time_expr(self, tree):
+        # Bounds are kept as the literal text
+        return Expr("xDateTime", *tree)
+
+    # xsd_date_time_with_time_zone_expr: "xDateTimeTz" ("("
+    #   xsd_date_time_with_time_zone_literal ","
+    #   xsd_date_time_with_time_zone_literal ")")? // 53 (1.1)
+    def xsd_date_time_with_time_zone_expr(self, tree):
+        return Expr("xDateTimeTz", *tree)
 
     # xsd_date_expr: "xDate" ("(" xsd_date_literal "," xsd_date_literal ")")?
     # // 50
+    def xsd_date_expr(self, tree):
+        return Expr("xDate", *tree)
 
     # xsd_time_expr: "xTime" ( "(" xsd_time_literal "," xsd_time_literal ")")?
     # // 51
+    def xsd_time_expr(self, tree):
+        return Expr("xTime", *tree)
 
-    # uk_date_expr: "ukDate" ("(" uk_date_literal "," uk_date_literal ")")
+    # uk_date_expr: "ukDate" ("(" uk_date_literal "," uk_date_literal ")")?
     # // 52
+    def uk_date_expr(self, tree):
+        return Expr("ukDate", *tree)
 
     # date_expr: "date(" string_provider "," string_provider ","
     # string_provider ("," xsd_date_literal "," xsd_date_literal)? ")" // 53
+    def date_expr(self, tree):
+        # year, month, day and the optional bounds
+        return Expr("date", *tree)
 
     # partial_uk_date_expr: "partUkDate" // 54
+    def partial_uk_date_expr(self, _):
+        return Expr("partUkDate")
 
     # partial_date_expr: "partDate("
     # string_provider "," string_provider "," string_provider ")" // 55
+    def partial_date_expr(self, tree):
+        return Expr("partDate", *tree)
 
     # uuid4_expr: "uuid4" // 56
     def uuid4_expr(self, _):
-        def uuid4_validator(value, _row, _colmap):
-            regex = re.compile(
-                r"^[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab]"
-                r"[a-f0-9]{3}-?[a-f0-9]{12}$", re.I
-            )
-            match = regex.match(value.strip())
-            return bool(match)
-        return uuid4_validator
+        return Expr("uuid4")
 
     # positive_integer_expr: "positiveInteger" // 57
     def positive_integer_expr(self, _):
-        def positive_integer_validator(value, _row, _colmap):
-            return float(value) == int(value) and int(value) > 0
-        return positive_integer_validator
+        return Expr("positiveInteger")
 
     # string_provider: column_ref | string_literal // 58
     def string_provider(self, sp):
@@ -490,104 +532,41 @@ class CSVS_Transformer(Transformer):
     # external_single_expr: explicit_context_expr? (file_exists_expr |
     # checksum_expr | file_count_expr) // 59
     def external_single_expr(self, tree):
-        (tree,) = tree
-        return tree
+        if len(tree) == 1:
+            (tree,) = tree
+            return tree
+        else:
+            (context, expr) = tree
+            return Expr("context", context, expr)
 
     # file_exists_expr: "fileExists" ("(" string_provider ")")? // 60
     def file_exists_expr(self, tree):
-        if len(tree) == 0:
-
-            def file_exists_validator(path_provider, row, colmap):
-                if isinstance(path_provider, ColumnReference):
-                    path_provider.row = row
-                    path_provider.colmap = colmap
-                    path_str = path_provider.resolve()
-                else:
-                    path_str = path_provider
-                # Decode it form a uri
-                path_str = unquote(urlparse(path_str).path)
-                return Path(path_str).exists()
-        else:
-            base_provider, = tree
-
-            def file_exists_validator(path_provider, row, colmap):
-                if isinstance(base_provider, ColumnReference):
-                    base_provider.row = row
-                    base_provider.colmap = colmap
-                    base = base_provider.resolve()
-                else:
-                    base = base_provider
-                if isinstance(path_provider, ColumnReference):
-                    path_provider.row = row
-                    path_provider.colmap = colmap
-                    file_path = path_provider.resolve()
-                else:
-                    file_path = path_provider
-                file_path = str(base) + str(file_path)
-                file_path = unquote(urlparse(file_path).path)
-
-                path_str = Path(file_path)
-                print("PATH EXISTS:", path_str)
-                return path_str.exists()
-        return file_exists_validator
+        return Expr("fileExists", *tree)
+
+    # integrity_check_expr: "integrityCheck" "(" (string_provider ",")?
+    # (string_provider ",")? integrity_check_folder ")" // 67
+    def integrity_check_expr(self, tree):
+        return Expr("integrityCheck", *tree)
+
+    # integrity_check_folder: "\"includeFolder\"" | "\"excludeFolder\"" // 67
+    def integrity_check_folder(self, tree):
+        (token,) = tree
+        return StringLiteral(str(token).strip('"'))
 
     # checksum_expr: "checksum(" file_expr "," string_literal ")" // 61
     def checksum_expr(self, tree):
         file_expr, checksum_type = tree
-
-        def checksum_validator(value, row, colmap):
-            if isinstance(checksum_type, ColumnReference):
-                checksum_type.row = row
-                checksum_type.colmap = colmap
-                checksum_lib = checksum_type.resolve()
-            elif isinstance(checksum_type, StringLiteral):
-                checksum_lib = checksum_type.resolve()
-            else:
-                checksum_lib = checksum_type
-
-            return value == file_checksum(file_expr(value, row, colmap), checksum_lib)
-
-        return checksum_validator
+        return Expr("checksum", file_expr, checksum_type)
 
     # file_expr: "file(" (string_provider "," )? string_provider ")" // 62
     def file_expr(self, tree):
-        if len(tree) == 1:
-            # Single argument form: file(path)
-            (path_provider,) = tree
-
-            def resolve_path(value, row, colmap):
-                if isinstance(path_provider, ColumnReference):
-                    path_provider.row = row
-                    path_provider.colmap = colmap
-                    path_str = path_provider.resolve()
-                else:
-                    path_str = path_provider
-                return Path(unquote(urlparse(path_str).path))
-
-        else:
-            # 2 argument form: file(base, path)
-            base_provider, path_provider = tree
-
-            def resolve_path(value, row, colmap):
-                if isinstance(base_provider, ColumnReference):
-                    base_provider.row = row
-                    base_provider.colmap = colmap
-                    base = base_provider.resolve()
-                else:
-                    base = base_provider
-                if isinstance(path_provider, ColumnReference):
-                    path_provider.row = row
-                    path_provider.colmap = colmap
-                    file_path = path_provider.resolve()
-                else:
-                    file_path = path_provider
-                file_path = str(base) + str(file_path)
-                file_path = unquote(urlparse(file_path).path)
-                return Path(file_path)
-
-        return resolve_path
+        # file(path) or file(base, path)
+        return Expr("file", *tree)
 
     # file_count_expr: "fileCount(" file_expr ")" // 63
+    def file_count_expr(self, tree):
+        (file_expr,) = tree
+        return Expr("fileCount", file_expr)
 
     # parenthesized_expr: "(" column_validation_expr+ ")" // 64
     def parenthesized_expr(self, tree):
@@ -602,56 +581,63 @@ class CSVS_Transformer(Transformer):
     # if_expr: "if(" ( combinatorial_expr | non_conditional_expr ) ","
     #    column_validation_expr+ ("," column_validation_expr+)? ")" // 66
     def if_expr(self, tree):
-
-        if len(tree) == 3:
-            def if_validator(value, row, colmap):
-                context = tree[0]
-                (comparator, condition) = context
-                comparator.row = row
-                comparator.colmap = colmap
-                comparator = comparator.resolve()
-                if condition(comparator, row, colmap):
-                    return tree[1](value, row, colmap)
-                else:
-                    return tree[2](value, row, colmap)
-        else:
-            def if_validator(value, row, colmap):
-                context = tree[0]
-                (comparator, condition) = context
-                comparator.row = row
-                comparator.colmap = colmap
-                comparator = comparator.resolve()
-                if condition(comparator, row, colmap):
-                    return tree[1](value, row, colmap)
-                else:
-                    return True
-        return if_validator
+        # if(condition, then) or if(condition, then, else)
+        return Expr("if", *tree)
 
     # xsd_date_time_literal: xsd_date_without_timezone_component "T"
     #     xsd_time_literal // 67
+    def xsd_date_time_literal(self, tree):
+        return "T".join(tree)
+
+    # xsd_date_time_with_time_zone_literal: xsd_date_without_timezone_component
+    #     "T" xsd_time_without_timezone_component xsd_timezone_component
+    #     // 80 (1.1)
+    def xsd_date_time_with_time_zone_literal(self, tree):
+        (date, time, timezone) = tree
+        return f"{date}T{time}{timezone}"
 
     # xsd_date_literal: xsd_date_without_timezone_component
     #    xsd_timezone_component // 68
+    def xsd_date_literal(self, tree):
+        return "".join(tree)
 
     # xsd_time_literal: xsd_time_without_timezone_component
     #    xsd_timezone_component // 69
+    def xsd_time_literal(self, tree):
+        return "".join(tree)
 
     # xsd_date_without_timezone_component:
     # /-?[0-9]{4}-(((0(1|3|5|7|8)|1(0|2))-(0[1-9]|(1|2)[0-9]|3[0-1]))|
     #    ((0(4|6|9)|11)-(0[1-9]|(1|2)[0-9]|30))|(02-(0[1-9]|(1|2)[0-9])))/
     # // 70
+    def xsd_date_without_timezone_component(self, tree):
+        (date, ) = tree
+        return str(date)
 
     # xsd_time_without_timezone_component:
     # /([0-1][0-9]|2[0-4]):(0[0-9]|[1-5][0-9]):(0[0-9]|
     #    [1-5][0-9])(\.[0-9]{3})?/ // 71
+    def xsd_time_without_timezone_component(self, tree):
+        (time, ) = tree
+        return str(time)
+
+    # xsd_optional_timezone_component: xsd_timezone_component? // 84 (1.1)
+    def xsd_optional_timezone_component(self, tree):
+        return "".join(tree)
 
     # xsd_timezone_component:
     # /((\+|-)(0[1-9]|1[0-9]|2[0-4]):(0[0-9]|[1-5][0-9])|Z)/ // 72
+    def xsd_timezone_component(self, tree):
+        (timezone, ) = tree
+        return str(timezone)
 
     # uk_date_literal:
     # /(((0[1-9]|(1|2)[0-9]|3[0-1])\/(0(1|3|5|7|8)|1(0|2)))|
     #    ((0[1-9]|(1|2)[0-9]|30)\/(0(4|6|9)|11))|
     #    ((0[1-9]|(1|2)[0-9])\/02))\/[0-9]{4}/ // 73
+    def uk_date_literal(self, tree):
+        (date, ) = tree
+        return str(date)
 
     # positive_non_zero_integer_literal: /[1-9][0-9]*/ // 74
     def positive_non_zero_integer_literal(self, pnz):
@@ -1,5 +1,11 @@
 import pytest
-from csvs_parser import CSVS_Transformer, StringLiteral
+from pathlib import Path
+import csvs_parser
+import csvs_patterns
+from rfc3986_validator import validate_rfc3986
+from csvs_compiler import compile_expr, compile_rules, load_schema
+from csvs_parser import (ColumnReference, CSVS_Parser, CSVS_Transformer, Expr, SchemaError, StringLiteral,
+                         get_lark_parser)
 
 
 # Define a fixture for the transformer instance
@@ -21,41 +27,35 @@ def test_wildcard_literal(transformer):
 
 
 def test_or_expr(transformer):
-    def validator1(x, _y, _z):
-        return x % 2 == 0
-
-    def validator2(x, _y, _z):
-        return x % 3 == 0
-
-    or_validator = transformer.or_expr((validator1, validator2))
+    is_a = Expr("is", StringLiteral("a"))
+    is_b = Expr("is", StringLiteral("b"))
+    or_expr = transformer.or_expr((is_a, is_b))
+    assert or_expr == Expr("or", is_a, is_b)
+    or_validator = compile_expr(or_expr)
 
     row = []
     colmap = {}
 
-    assert or_validator(2, row, colmap)
-    assert or_validator(3, row, colmap)
-    assert or_validator(6, row, colmap)
-    assert not or_validator(5, row, colmap)
+    assert or_validator("a", row, colmap)
+    assert or_validator("b", row, colmap)
+    assert not or_validator("c", row, colmap)
 
 
 def test_and_expr(transformer):
-    def validator1(x, _y, _z):
-        return x % 2 == 0
-
-    def validator2(x, _y, _z):
-        return x % 3 == 0
+    starts_a = Expr("starts", StringLiteral("a"))
+    ends_b = Expr("ends", StringLiteral("b"))
+    and_validator = compile_expr(transformer.and_expr((starts_a, ends_b)))
 
-    and_validator = transformer.and_expr((validator1, validator2))
-
-    assert and_validator(6, [], {})
-    assert not and_validator(2, [], {})
-    assert not and_validator(3, [], {})
-    assert not and_validator(5, [], {})
+    assert and_validator("ab", [], {})
+    assert and_validator("axb", [], {})
+    assert not and_validator("a", [], {})
+    assert not and_validator("b", [], {})
+    assert not and_validator("ba", [], {})
 
 
 def test_is_expr(transformer):
     comparison_value = (StringLiteral("test"),)
-    is_validator = transformer.is_expr(comparison_value)
+    is_validator = compile_expr(transformer.is_expr(comparison_value))
 
     assert is_validator("test", [], {})
     assert not is_validator(23, [], {})
@@ -63,24 +63,46 @@ def test_is_expr(transformer):
 
 def test_in_expr(transformer):
     comparison_value = (StringLiteral("this is a test string"),)
-    in_validator = transformer.in_expr(comparison_value)
+    in_validator = compile_expr(transformer.in_expr(comparison_value))
 
     assert in_validator("test", [], {})
     assert not in_validator(23, [], {})
     assert not in_validator("nothing to see here", [], {})
 
 
+def test_any_expr(transformer, tmp_path):
+    any_validator = compile_expr(transformer.any_expr((StringLiteral("a"), StringLiteral("b"))))
+    assert any_validator("b", [], {})
+    assert not any_validator("c", [], {})
+
+    (tmp_path / "codes.txt").write_text("x\ny\n")
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text('version 1.2\n@totalColumns 2\n'
+                           'code: any("a", $other, "b")\n'
+                           f'other: any(file("{tmp_path.as_uri()}/", "codes.txt"))\n')
+    rules = load_schema(schema_file, cache_dir=None)
+    assert rules[0]["functions"] == [
+        Expr("any", StringLiteral("a"), ColumnReference("other"), StringLiteral("b"))]
+    assert str(rules[1]["functions"][0]) == f'any(file("{tmp_path.as_uri()}/", "codes.txt"))'
+    compiled = compile_rules(rules)
+    code, other = (compiled[key]["functions"][0] for key in (0, 1))
+    colmap = {"code": 0, "other": 1}
+    assert code("b", ["b", "x"], colmap) and code("x", ["x", "x"], colmap)
+    assert not code("y", ["y", "x"], colmap)
+    assert other("y", [], {}) and not other("z", [], {})
+
+
 def test_not_expr(transformer):
     comparison_value = (StringLiteral("test"),)
-    not_validator = transformer.not_expr(comparison_value)
+    not_validator = compile_expr(transformer.not_expr(comparison_value))
 
     assert not_validator("Spain", [], {})
     assert not not_validator("test", [], {})
 
 
 def test_range_expr(transformer):
-    range_validator_1 = transformer.range_expr(("1", 7.0))
-    range_validator_2 = transformer.range_expr(("-1", "-32"))
+    range_validator_1 = compile_expr(transformer.range_expr(("1", 7.0)))
+    range_validator_2 = compile_expr(transformer.range_expr(("-1", "-32")))
 
     assert range_validator_1(3, [], {})
     assert range_validator_1("6.4", [], {})
@@ -92,10 +114,10 @@ def test_range_expr(transformer):
 
 
 def test_length_expr(transformer):
-    length_validator_1 = transformer.length_expr(5)
-    length_validator_2 = transformer.length_expr((2, 10))
-    length_validator_3 = transformer.length_expr((2, '*'))
-    length_validator_4 = transformer.length_expr(('*', 10))
+    length_validator_1 = compile_expr(transformer.length_expr(5))
+    length_validator_2 = compile_expr(transformer.length_expr((2, 10)))
+    length_validator_3 = compile_expr(transformer.length_expr((2, '*')))
+    length_validator_4 = compile_expr(transformer.length_expr(('*', 10)))
 
     assert length_validator_1("words", [], {})
     assert not length_validator_1("this is a test and is too long", [], {})
@@ -113,22 +135,134 @@ def test_length_expr(transformer):
     assert not length_validator_4("this is a test and is too long", [], {})
     assert length_validator_4("x", [], {})
 
+    # No bound either way
+    for tree in [('*',), ('*', '*')]:
+        assert transformer.length_expr(tree) == Expr("length", None, None)
+        assert compile_expr(transformer.length_expr(tree))("any length", [], {})
+
 
 def test_empty_expr(transformer):
-    empty_validator = transformer.empty_expr(())
+    empty_validator = compile_expr(transformer.empty_expr(()))
     assert empty_validator("", [], {})
     assert not empty_validator("X", [], {})
 
 
 def test_not_empty_expr(transformer):
-    not_empty_validator = transformer.not_empty_expr(())
+    not_empty_validator = compile_expr(transformer.not_empty_expr(()))
     assert not not_empty_validator("", [], {})
     assert not_empty_validator("X", [], {})
 
 
 def test_uri_expr(transformer):
-    uri_validator = transformer.uri_expr(())
+    uri_validator = compile_expr(transformer.uri_expr(()))
     assert uri_validator("http://data.gov.uk/some_asset", [], {})
     assert not uri_validator("http://data.gov.uk/spaces should be escaped", [], {})
 
 
+def test_parser_outside_repo(tmp_path, monkeypatch):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text("version 1.0\nname: notEmpty\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(csvs_parser, "_lark_parsers", {})
+    cache_dir = tmp_path / "cache"
+    assert CSVS_Parser(schema_file, cache_dir=cache_dir).tree
+    assert (cache_dir / "csvs_1.0.lark.cache").exists()
+
+
+EXAMPLE_SCHEMAS = sorted((Path(__file__).parent / "examples").glob("*.csvs"))
+
+
+def test_examples_found():
+    assert EXAMPLE_SCHEMAS
+
+
+@pytest.mark.parametrize("schema_file", EXAMPLE_SCHEMAS, ids=lambda path: path.name)
+def test_lalr_matches_earley(schema_file):
+    parser = CSVS_Parser(schema_file, cache_dir=None)
+    earley = get_lark_parser(parser._version, "earley")
+    assert parser.tree == earley.parse(parser._schema_text)
+
+
+def test_keyword_column_name_fallback(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text("version 1.0\na:\nuri: notEmpty\norder: is(\"x\") or(is(\"y\"))\n")
+    transformer = CSVS_Transformer()
+    transformer.transform(CSVS_Parser(schema_file, cache_dir=None).tree)
+    assert [transformer.rules[i]["name"] for i in range(3)] == ["a", "uri", "order"]
+
+
+def test_expr_str(transformer):
+    expr = transformer.or_expr((
+        transformer.is_expr((StringLiteral("m"),)),
+        transformer.range_expr((0.0, 120.5)),
+    ))
+    assert str(expr) == 'is("m") or range(0, 120.5)'
+    assert str(transformer.length_expr((2, "*"))) == "length(2, *)"
+
+
+def test_unsupported_expression(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text("version 1.1\nname: upperCase\n")
+    with pytest.raises(SchemaError):
+        compile_rules(load_schema(schema_file, cache_dir=None))
+
+
+def test_schema_cache(tmp_path, monkeypatch):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text('version 1.0\nname: notEmpty\ngender: is("m") or is("f")\n')
+    cache_dir = tmp_path / "cache"
+    rules = load_schema(schema_file, cache_dir=cache_dir)
+    assert len(list(cache_dir.glob("schema-*.pickle"))) == 1
+
+    # A cached schema is not parsed or transformed again
+    def fail(*args):
+        raise AssertionError("Schema parsed again")
+    monkeypatch.setattr(CSVS_Parser, "_parse", fail)
+    assert load_schema(schema_file, cache_dir=cache_dir) == rules
+    assert rules[1]["functions"] == [Expr("or", Expr("is", StringLiteral("m")), Expr("is", StringLiteral("f")))]
+
+    # Changing the schema text misses the cache
+    schema_file.write_text('version 1.0\nname: empty\n')
+    with pytest.raises(AssertionError):
+        load_schema(schema_file, cache_dir=cache_dir)
+
+
+def test_reg_exp_expr(transformer):
+    regex_validator = compile_expr(transformer.reg_exp_expr((StringLiteral("[a-z]+|[0-9]+"),)))
+    assert regex_validator("abc", [], {})
+    assert regex_validator("123", [], {})
+    # The whole value has to match, not just the start of it
+    assert not regex_validator("abc123", [], {})
+    assert not regex_validator("abc\n", [], {})
+    with pytest.raises(SchemaError):
+        compile_expr(transformer.reg_exp_expr((StringLiteral("[a-z"),)))
+
+
+def test_regex_shared_between_columns(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text('version 1.0\na: regex("[A-Z]{3}")\nb: regex("[A-Z]{3}")\n')
+    before = csvs_patterns.pattern_count()
+    compile_rules(load_schema(schema_file, cache_dir=None))
+    assert csvs_patterns.pattern_count() == before + 1
+
+
+def test_pattern_cache_bounded():
+    for n in range(csvs_patterns.PATTERN_CACHE_SIZE + 10):
+        csvs_patterns.compile_pattern(f"x{{{n}}}")
+    assert csvs_patterns.pattern_count() == csvs_patterns.PATTERN_CACHE_SIZE
+
+
+def test_uuid4_expr(transformer):
+    uuid4_validator = compile_expr(transformer.uuid4_expr(()))
+    assert uuid4_validator("1b4e28ba-2fa1-41d2-883f-0016d3cca427", [], {})
+    assert uuid4_validator(" 1B4E28BA2FA141D2883F0016D3CCA427 ", [], {})
+    assert not uuid4_validator("1b4e28ba-2fa1-11d2-883f-0016d3cca427", [], {})
+
+
+@pytest.mark.parametrize("value", [
+    "http://data.gov.uk/some_asset", "file:///T/TEST/content/a%20b.txt", "urn:isbn:0451450523",
+    "http://[::1]:8080/x?y=1#z", "mailto:someone@example.com", "x:", "http://a b", "1http://a",
+    "C:\\Users\\file.txt", "no scheme", "", "http://example.com/\u00e9", "http://a/%zz",
+])
+def test_uri_precheck_agrees(value):
+    assert csvs_patterns.is_uri(value) == bool(validate_rfc3986(value) and "\n" not in value)
@@ -0,0 +1,40 @@
+import functools
+import re
+from rfc3986_validator import URI_RE
+
+# Patterns kept compiled for schemas compiled later, the least recently
+# used are dropped past this many. A long-running process like the
+# validation server can see any number of schemas.
+PATTERN_CACHE_SIZE = 1024
+
+
+# Every pattern used by a schema is compiled once, when the schema is
+# compiled, and shared by all the columns that use the same pattern
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_pattern(pattern, flags=0):
+    return re.compile(pattern, flags)
+
+
+def pattern_count():
+    return compile_pattern.cache_info().currsize
+
+
+UUID4_PATTERN = compile_pattern(
+    r"[a-f0-9]{8}-?[a-f0-9]{4}-?4[a-f0-9]{3}-?[89ab]"
+    r"[a-f0-9]{3}-?[a-f0-9]{12}", re.I
+)
+
+# Full RFC 3986 URI, from rfc3986_validator
+URI_PATTERN = compile_pattern(URI_RE, re.VERBOSE)
+
+# Anything the RFC 3986 pattern accepts is a scheme, a colon and then only
+# these characters. This is much cheaper to run, so it's checked first to
+# throw out values like free text or Windows paths.
+URI_PRECHECK_PATTERN = compile_pattern(
+    r"[A-Za-z][A-Za-z0-9+.\-]*:[A-Za-z0-9\-._~:/?#\[\]@!$&'()*+,;=%]*"
+)
+
+
+def is_uri(value):
+    return (URI_PRECHECK_PATTERN.fullmatch(value) is not None
+            and URI_PATTERN.fullmatch(value) is not None)
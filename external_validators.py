@@ -1,29 +1,322 @@
+import atexit
+import fnmatch
+import glob
 import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+from pathlib import Path
+from csvs_parser import CACHE_DIR
 
+# Size of each read when hashing a file
+READ_SIZE = 1024 * 1024
+# Hashing threads, hashlib releases the GIL so these overlap with each
+# other and with reading the CSV
+CHECKSUM_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+# Digests written to the cache between commits
+CACHE_COMMIT_EVERY = 256
 
-# Checksum for all known algorithms
-def file_checksum(file_path, sum_type="MD5"):
-    # BUF_SIZE is totally arbitrary
-    BUF_SIZE = 65536
 
-    # Unknown hash algorithm, return prompt to user
-    sum_type = sum_type.lower()
-    if sum_type not in hashlib.algorithms_guaranteed:
-        raise ValueError
+def checksum_algorithm(sum_type):
+    # hashlib's name for a checksum type like "SHA-256", raises ValueError
+    # for one it doesn't have everywhere
+    algorithm = sum_type.lower().replace("-", "")
+    if algorithm not in hashlib.algorithms_guaranteed:
+        raise ValueError(f"Unknown checksum algorithm {sum_type}")
+    return algorithm
+
 
+# Checksum for all known algorithms
+def file_checksum(file_path, sum_type="MD5", read_size=READ_SIZE, use_mmap=False):
     # Use the specified algorithm
-    sum_type = sum_type.lower().replace("-", "")
-    h = hashlib.new(sum_type)
+    h = hashlib.new(checksum_algorithm(sum_type))
 
-    # Check the file exists
-    try:
-        with open(file_path, 'rb') as f:
+    # Raises FileNotFoundError if the file doesn't exist
+    with open(file_path, 'rb') as f:
+        if use_mmap and os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                h.update(data)
+        else:
             while True:
-                data = f.read(BUF_SIZE)
+                data = f.read(read_size)
                 if not data:
                     break
                 h.update(data)
-    except FileNotFoundError:
-        raise
 
     return h.hexdigest()
+
+
+class ChecksumCache:
+    # Digests of files from earlier runs, only used while the file's size
+    # and modification time are unchanged
+    def __init__(self, cache_file):
+        Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._db = sqlite3.connect(str(cache_file), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS checksums ("
+            "path TEXT, algorithm TEXT, size INTEGER, mtime_ns INTEGER, digest TEXT, "
+            "PRIMARY KEY (path, algorithm))"
+        )
+        self._db.commit()
+
+    def get(self, path, algorithm, stat):
+        with self._lock:
+            found = self._db.execute(
+                "SELECT digest FROM checksums WHERE path = ? AND algorithm = ? "
+                "AND size = ? AND mtime_ns = ?",
+                (path, algorithm, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        return found[0] if found else None
+
+    def put(self, path, algorithm, stat, digest):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checksums VALUES (?, ?, ?, ?, ?)",
+                (path, algorithm, stat.st_size, stat.st_mtime_ns, digest),
+            )
+            self._pending += 1
+            if self._pending >= CACHE_COMMIT_EVERY:
+                self._db.commit()
+                self._pending = 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+
+class ChecksumPool:
+    # Hashes files in a pool of threads. submit() starts hashing a file
+    # ahead of when it's needed, digest() waits for it. With a cache the
+    # digest is only worked out when the file has changed.
+    def __init__(self, workers=CHECKSUM_WORKERS, read_size=READ_SIZE, use_mmap=False,
+                 cache_file=None):
+        self.read_size = read_size
+        self.use_mmap = use_mmap
+        self.cache = ChecksumCache(cache_file) if cache_file is not None else None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="checksum")
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def _checksum(self, file_path, sum_type):
+        if self.cache is None:
+            return file_checksum(file_path, sum_type, self.read_size, self.use_mmap)
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        algorithm = checksum_algorithm(sum_type)
+        try:
+            digest = self.cache.get(path, algorithm, stat)
+        except sqlite3.Error:
+            # e.g. locked by another process sharing the cache
+            digest = None
+        if digest is None:
+            digest = file_checksum(path, sum_type, self.read_size, self.use_mmap)
+            try:
+                self.cache.put(path, algorithm, stat, digest)
+            except sqlite3.Error:
+                pass
+        return digest
+
+    def submit(self, file_path, sum_type="MD5"):
+        key = (str(file_path), sum_type)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                future = self._executor.submit(self._checksum, file_path, sum_type)
+                self._futures[key] = future
+        return future
+
+    def digest(self, file_path, sum_type="MD5"):
+        while True:
+            future = self.submit(file_path, sum_type)
+            try:
+                return future.result()
+            except CancelledError:
+                # Dropped by clear() from another thread, hash it again
+                continue
+            finally:
+                with self._lock:
+                    if self._futures.get((str(file_path), sum_type)) is future:
+                        del self._futures[(str(file_path), sum_type)]
+
+    def clear(self):
+        # Drops the digests submitted but never asked for, e.g. on rows
+        # where an or was settled before its checksum, so the next run
+        # hashes files that have changed since
+        with self._lock:
+            futures, self._futures = self._futures, {}
+        for future in futures.values():
+            future.cancel()
+
+    def close(self):
+        self._executor.shutdown()
+        if self.cache is not None:
+            self.cache.close()
+
+
+_checksum_pool = None
+_checksum_pool_lock = threading.Lock()
+_checksum_options = {
+    "workers": CHECKSUM_WORKERS,
+    "read_size": READ_SIZE,
+    "use_mmap": False,
+    "cache_file": CACHE_DIR / "checksums.sqlite3",
+}
+
+
+def configure_checksums(**options):
+    # Change the options of the shared ChecksumPool, e.g. workers,
+    # read_size, use_mmap or cache_file (None turns the cache off)
+    global _checksum_pool
+    with _checksum_pool_lock:
+        if _checksum_pool is not None:
+            _checksum_pool.close()
+            _checksum_pool = None
+        _checksum_options.update(options)
+
+
+def checksum_pool():
+    # ChecksumPool shared by every checksum validator in the process
+    global _checksum_pool
+    with _checksum_pool_lock:
+        if _checksum_pool is None:
+            try:
+                _checksum_pool = ChecksumPool(**_checksum_options)
+            except (OSError, sqlite3.Error):
+                # No usable cache, still hash in the background
+                _checksum_pool = ChecksumPool(**dict(_checksum_options, cache_file=None))
+        return _checksum_pool
+
+
+def clear_prefetched_checksums():
+    # At the end of each validation run, without starting a pool for
+    # schemas that have no checksum rules
+    with _checksum_pool_lock:
+        pool = _checksum_pool
+    if pool is not None:
+        pool.clear()
+
+
+def _has_wildcards(path):
+    return any(c in path for c in "*?[")
+
+
+class FileIndex:
+    # Answers fileExists and fileCount from a listing of each directory,
+    # made once with os.scandir, rather than a stat call for every row.
+    # With stat_per_row each lookup goes to the filesystem instead, for
+    # directories that change during a run. Listings are kept until
+    # clear() is called.
+    def __init__(self, stat_per_row=False):
+        self.stat_per_row = stat_per_row
+        self._lock = threading.Lock()
+        self._listings = {}
+
+    def _listing(self, directory):
+        # Names in a directory, empty if it doesn't exist, or None if it
+        # can't be listed
+        with self._lock:
+            if directory in self._listings:
+                return self._listings[directory]
+        try:
+            with os.scandir(directory or ".") as entries:
+                listing = frozenset(entry.name for entry in entries)
+        except (FileNotFoundError, NotADirectoryError):
+            listing = frozenset()
+        except OSError:
+            listing = None
+        with self._lock:
+            return self._listings.setdefault(directory, listing)
+
+    def exists(self, path):
+        path = os.path.normpath(path)
+        directory, name = os.path.split(path)
+        if self.stat_per_row or not name or name == "..":
+            return os.path.exists(path)
+        listing = self._listing(directory)
+        if listing is None:
+            return os.path.exists(path)
+        # Anything below a missing directory has an empty listing
+        return name in listing
+
+    def count(self, path):
+        # Number of files matching path, which can have wildcards in its
+        # last part
+        path = os.path.normpath(path)
+        directory, name = os.path.split(path)
+        if not _has_wildcards(path):
+            return int(self.exists(path))
+        listing = None if self.stat_per_row or _has_wildcards(directory) else self._listing(directory)
+        if listing is None:
+            return len(glob.glob(path))
+        return len(fnmatch.filter(listing, name))
+
+    def clear(self):
+        with self._lock:
+            self._listings = {}
+
+
+_file_index = FileIndex()
+
+
+def configure_file_index(stat_per_row=False):
+    # Replace the shared FileIndex, which also forgets its listings
+    global _file_index
+    _file_index = FileIndex(stat_per_row)
+
+
+def file_index():
+    # FileIndex shared by the fileExists and fileCount validators
+    return _file_index
+
+
+class ValueLists:
+    # The values of each value list file used by any(file(...)), one per
+    # line with blank lines left out, as a frozenset shared by every rule
+    # and schema using the file. A file is read again only when its size
+    # or modification time has changed, so a long running process like
+    # validation_server.py sees edits to it.
+    def __init__(self, encoding="utf-8-sig"):
+        self.encoding = encoding
+        self._lock = threading.Lock()
+        self._lists = {}
+
+    def get(self, path):
+        # Raises OSError if the file can't be read
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            found = self._lists.get(path)
+        if found is not None and found[0] == key:
+            return found[1]
+        with open(path, encoding=self.encoding, newline="") as f:
+            values = frozenset(line.rstrip("\r") for line in f.read().split("\n")) - {""}
+        with self._lock:
+            self._lists[path] = (key, values)
+        return values
+
+    def clear(self):
+        with self._lock:
+            self._lists = {}
+
+
+_value_lists = ValueLists()
+
+
+def value_lists():
+    # ValueLists shared by the any validators
+    return _value_lists
+
+
+@atexit.register
+def _close_checksum_pool():
+    # Commits the last digests to the cache
+    configure_checksums()
@@ -0,0 +1,231 @@
+import hashlib
+import os
+import sqlite3
+import pytest
+import external_validators
+from csv_validator import CSV_Stream_Validator
+from csvs_compiler import load_rules
+from csvs_parser import SchemaError
+from external_validators import ChecksumPool, FileIndex, ValueLists, configure_checksums, file_checksum
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    data_file = tmp_path / "data.bin"
+    data_file.write_bytes(os.urandom(300_000))
+    return data_file
+
+
+@pytest.mark.parametrize("options", [{}, {"read_size": 1000}, {"use_mmap": True}])
+def test_file_checksum(data_file, options):
+    expected = hashlib.sha256(data_file.read_bytes()).hexdigest()
+    assert file_checksum(data_file, "SHA-256", **options) == expected
+
+
+def test_file_checksum_empty(tmp_path):
+    (tmp_path / "empty").write_bytes(b"")
+    assert file_checksum(tmp_path / "empty", "MD5", use_mmap=True) == hashlib.md5().hexdigest()
+
+
+def test_file_checksum_unknown():
+    with pytest.raises(ValueError):
+        file_checksum(__file__, "not-a-hash")
+
+
+def test_checksum_cache(data_file, tmp_path, monkeypatch):
+    hashed = []
+
+    def counting_checksum(file_path, *args):
+        hashed.append(file_path)
+        return file_checksum(file_path, *args)
+    monkeypatch.setattr(external_validators, "file_checksum", counting_checksum)
+
+    expected = hashlib.md5(data_file.read_bytes()).hexdigest()
+    for _run in range(2):
+        pool = ChecksumPool(workers=2, cache_file=tmp_path / "cache.sqlite3")
+        assert pool.digest(data_file, "MD5") == expected
+        pool.close()
+    assert len(hashed) == 1
+
+    # A changed file is hashed again
+    data_file.write_bytes(b"changed")
+    pool = ChecksumPool(workers=2, cache_file=tmp_path / "cache.sqlite3")
+    assert pool.digest(data_file, "MD5") == hashlib.md5(b"changed").hexdigest()
+    pool.close()
+    assert len(hashed) == 2
+
+
+def test_checksum_rule_prefetch(tmp_path, monkeypatch):
+    # Don't touch the user's digest cache
+    monkeypatch.setitem(external_validators._checksum_options, "cache_file", None)
+    configure_checksums(workers=4)
+    monkeypatch.setattr("csv_validator.PREFETCH_ROWS", 4)
+    (tmp_path / "schema.csvs").write_text(
+        'version 1.0\n'
+        '@totalColumns 2\n'
+        'file_path: notEmpty\n'
+        f'fixity: checksum(file("{tmp_path.as_uri()}/", $file_path), "MD5")\n'
+    )
+    rules = load_rules(tmp_path / "schema.csvs", cache_dir=None)
+    assert rules[1]["prefetch"]
+    rows = [["file_path", "fixity"]]
+    for n in range(20):
+        data = f"file {n}".encode()
+        (tmp_path / f"{n}.txt").write_bytes(data)
+        rows.append([f"{n}.txt", hashlib.md5(data).hexdigest()])
+    assert CSV_Stream_Validator(iter(rows), rules).check()
+    rows[15][1] = "0" * 32
+    validator = CSV_Stream_Validator(iter(rows), rules)
+    assert not validator.check()
+    assert validator.errors == [(14, 1, "0" * 32)]
+
+    # A missing file is invalid rather than an exception
+    rows[15][1] = hashlib.md5(b"file 14").hexdigest()
+    rows[3][0] = "missing.txt"
+    validator = CSV_Stream_Validator(iter(rows), rules)
+    assert not validator.check()
+    assert validator.errors == [(2, 1, rows[3][1])]
+
+
+def test_checksum_prefetch_dropped_after_run(tmp_path, monkeypatch):
+    monkeypatch.setitem(external_validators._checksum_options, "cache_file", None)
+    configure_checksums(workers=2)
+    (tmp_path / "a.txt").write_bytes(b"old")
+    (tmp_path / "schema.csvs").write_text(
+        'version 1.0\n'
+        '@totalColumns 2\n'
+        'file_path: notEmpty\n'
+        f'fixity: is("skip") or checksum(file("{tmp_path.as_uri()}/", $file_path), "MD5")\n'
+    )
+    rules = load_rules(tmp_path / "schema.csvs", cache_dir=None)
+    rows = [["file_path", "fixity"], ["a.txt", "skip"]]
+    # Prefetched, but the or is settled before the checksum
+    assert CSV_Stream_Validator(iter(rows), rules).check()
+    assert not external_validators.checksum_pool()._futures
+    (tmp_path / "a.txt").write_bytes(b"new")
+    rows[1][1] = hashlib.md5(b"new").hexdigest()
+    assert CSV_Stream_Validator(iter(rows), rules).check()
+
+
+def test_checksum_cache_errors(data_file, tmp_path):
+    pool = ChecksumPool(workers=1, cache_file=tmp_path / "cache.sqlite3")
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+    pool.cache.get = pool.cache.put = locked
+    assert pool.digest(data_file, "MD5") == hashlib.md5(data_file.read_bytes()).hexdigest()
+    pool.close()
+
+
+def test_unknown_checksum_algorithm(tmp_path):
+    (tmp_path / "schema.csvs").write_text(
+        'version 1.0\n@totalColumns 1\nfixity: checksum(file("a.txt"), "MD6")\n')
+    with pytest.raises(SchemaError, match="MD6"):
+        load_rules(tmp_path / "schema.csvs", cache_dir=None)
+
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name in ("a.tif", "b.tif", "c.jpg", "sub/d.tif"):
+        (tmp_path / name).write_bytes(b"")
+    return tmp_path
+
+
+@pytest.mark.parametrize("stat_per_row", [False, True])
+def test_file_index(files, stat_per_row):
+    index = FileIndex(stat_per_row)
+    assert index.exists(files / "a.tif")
+    assert index.exists(str(files / "sub" / "d.tif"))
+    assert index.exists(files / "sub")
+    assert not index.exists(files / "missing.tif")
+    assert not index.exists(files / "missing" / "a.tif")
+    assert index.count(files / "*.tif") == 2
+    assert index.count(files / "?.*") == 3
+    assert index.count(files / "*" / "*.tif") == 1
+    assert index.count(files / "a.tif") == 1
+    assert index.count(files / "missing.tif") == 0
+
+
+def test_file_index_lists_once(files, monkeypatch):
+    listed = []
+    scandir = os.scandir
+
+    def counting_scandir(path):
+        listed.append(path)
+        return scandir(path)
+    monkeypatch.setattr(os, "scandir", counting_scandir)
+
+    index = FileIndex()
+    for name in ("a.tif", "b.tif", "missing.tif", "c.jpg") * 10:
+        index.exists(files / name)
+    assert listed == [str(files)]
+    # A file added after the listing isn't seen until clear()
+    (files / "new.tif").write_bytes(b"")
+    assert not index.exists(files / "new.tif")
+    index.clear()
+    assert index.exists(files / "new.tif")
+
+
+def test_file_rules(files, monkeypatch):
+    monkeypatch.setattr(external_validators, "_file_index", FileIndex())
+    (files / "schema.csvs").write_text(
+        'version 1.0\n'
+        '@totalColumns 3\n'
+        f'path: fileExists("{files.as_uri()}/")\n'
+        'pattern: notEmpty\n'
+        f'count: fileCount(file("{files.as_uri()}/", $pattern))\n'
+    )
+    rules = load_rules(files / "schema.csvs", cache_dir=None)
+    rows = [["path", "pattern", "count"], ["a.tif", "*.tif", "2"], ["sub/d.tif", "sub/*", "1"]]
+    assert CSV_Stream_Validator(iter(rows), rules).check()
+    for bad_row in (["e.tif", "*.tif", "2"], ["a.tif", "*.jpg", "2"], ["a.tif", "*.jpg", "one"]):
+        assert not CSV_Stream_Validator(iter(rows[:1] + [bad_row]), rules).check()
+
+
+def test_value_lists(tmp_path):
+    value_list = tmp_path / "codes.txt"
+    value_list.write_bytes("\ufeffA1\r\n\nB2 \nzoë".encode("utf-8"))
+    lists = ValueLists()
+    values = lists.get(value_list)
+    assert values == {"A1", "B2 ", "zoë"}
+    assert lists.get(str(value_list)) is values
+    # Read again once it's changed
+    value_list.write_text("C3\n")
+    os.utime(value_list, ns=(1, 1))
+    assert lists.get(value_list) == {"C3"}
+
+
+def test_value_list_rule(tmp_path, monkeypatch):
+    monkeypatch.setattr(external_validators, "_value_lists", ValueLists())
+    (tmp_path / "codes.txt").write_text("".join(f"fmt/{i}\n" for i in range(5000)))
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text('version 1.2\n@totalColumns 2\n'
+                           f'puid: any(file("{tmp_path / "codes.txt"}"))\n'
+                           f'previous: empty or any(file("{tmp_path.as_uri()}/codes.txt"))\n')
+    rules = load_rules(schema_file, cache_dir=None)
+    rows = [["puid", "previous"], ["fmt/4999", ""], ["fmt/5000", "fmt/12"], ["fmt/1", "x-fmt/1"]]
+    validator = CSV_Stream_Validator(iter(rows), rules, max_errors=None)
+    assert not validator.check()
+    assert [(issue.row, issue.column) for issue in validator.issues] == [(1, 0), (2, 1)]
+    assert len(external_validators.value_lists()._lists) == 1
+
+    schema_file.write_text('version 1.2\npuid: any(file("missing.txt"))\n')
+    with pytest.raises(SchemaError, match="missing.txt"):
+        load_rules(schema_file, cache_dir=None)
+
+
+def test_value_list_beside_schema(tmp_path, monkeypatch):
+    monkeypatch.setattr(external_validators, "_value_lists", ValueLists())
+    rows = [["puid"], ["fmt/1"]]
+    results = []
+    # The same schema text in two folders, each with its own list
+    for folder, codes in [("a", "fmt/1\n"), ("b", "fmt/2\n")]:
+        (tmp_path / folder).mkdir()
+        (tmp_path / folder / "codes.txt").write_text(codes)
+        schema_file = tmp_path / folder / "schema.csvs"
+        schema_file.write_text('version 1.2\n@totalColumns 1\npuid: any(file("codes.txt"))\n')
+        monkeypatch.chdir(tmp_path)
+        rules = load_rules(schema_file, cache_dir=tmp_path / "cache")
+        results.append(CSV_Stream_Validator(iter(rows), rules).check())
+    assert results == [True, False]
@@ -0,0 +1,96 @@
+import os
+
+
+def walk_manifest(root, include_folders=False):
+    # Every file below root, and every folder with include_folders, in one
+    # walk of the tree. Values say whether the CSV has referenced the path.
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            manifest[os.path.normpath(os.path.join(dirpath, name))] = False
+        if include_folders:
+            for name in dirnames:
+                manifest[os.path.normpath(os.path.join(dirpath, name))] = False
+    return manifest
+
+
+class IntegrityRule:
+    # integrityCheck compares the paths in a column with the files under a
+    # folder. resolve_path turns a cell into a path, resolve_root gives the
+    # folder to walk. Like UniqueRule each run has its own state.
+    def __init__(self, resolve_path, resolve_root, include_folders=False):
+        self.resolve_path = resolve_path
+        self.resolve_root = resolve_root
+        self.include_folders = include_folders
+
+    def __repr__(self):
+        folders = "includeFolder" if self.include_folders else "excludeFolder"
+        return f"IntegrityRule({folders})"
+
+    def start(self):
+        return IntegrityCheck(self)
+
+
+class IntegrityCheck:
+    def __init__(self, rule):
+        self.rule = rule
+        self.root = None
+        self.manifest = None
+
+    def _walk(self, row, colmap):
+        # The folder comes from the first row, in case it's given by a
+        # column reference
+        self.root = os.path.normpath(self.rule.resolve_root(row, colmap))
+        self.manifest = walk_manifest(self.root, self.rule.include_folders)
+
+    def add(self, row_num, value, row, colmap):
+        # Message if the path isn't in the folder, otherwise None
+        if self.manifest is None:
+            self._walk(row, colmap)
+        path = os.path.normpath(self.rule.resolve_path(value, row, colmap))
+        if path in self.manifest:
+            self.manifest[path] = True
+            return None
+        if not self.rule.include_folders and os.path.isdir(path):
+            # Folders aren't part of the check
+            return None
+        if os.path.exists(path):
+            return f"File outside {self.root}!"
+        return "Missing file!"
+
+    def slow_add(self):
+        # True if the next add walks the folder
+        return self.manifest is None
+
+    def finish(self):
+        # (None, path, message) of each file in the folder no row
+        # referenced
+        if self.manifest is None:
+            try:
+                self._walk(None, None)
+            except (AttributeError, KeyError, TypeError):
+                # The folder is given by a column and there were no rows
+                return []
+        orphans = sorted(path for path, seen in self.manifest.items() if not seen)
+        self.close()
+        return [(None, path, "Orphaned file!") for path in orphans]
+
+    def snapshot(self, _snapshot_dir=None):
+        # The folder and the paths found in it so far, for restore()
+        if self.manifest is None:
+            return None
+        return self.root, [path for path, seen in self.manifest.items() if seen]
+
+    def restore(self, data):
+        # The folder is walked again, files that have gone since the
+        # snapshot are just forgotten
+        if data is None:
+            return
+        self.root, seen = data
+        self.manifest = walk_manifest(self.root, self.rule.include_folders)
+        for path in seen:
+            if path in self.manifest:
+                self.manifest[path] = True
+
+    def close(self):
+        self.manifest = None
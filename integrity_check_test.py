@@ -0,0 +1,62 @@
+import pytest
+from csv_validator import CSV_Stream_Validator
+from csvs_compiler import load_rules
+from integrity_check import walk_manifest
+
+
+@pytest.fixture
+def transfer(tmp_path):
+    content = tmp_path / "content"
+    (content / "series" / "empty").mkdir(parents=True)
+    for name in ("a.tif", "b.tif", "series/c.tif"):
+        (content / name).write_bytes(b"")
+    return tmp_path
+
+
+def schema_rules(transfer, folder_option):
+    (transfer / "schema.csvs").write_text(
+        'version 1.1\n'
+        '@totalColumns 1\n'
+        f'path: integrityCheck("{transfer.as_uri()}/", "content", "{folder_option}")\n'
+    )
+    return load_rules(transfer / "schema.csvs", cache_dir=None)
+
+
+def test_walk_manifest(transfer):
+    content = transfer / "content"
+    files = {str(content / name) for name in ("a.tif", "b.tif", "series/c.tif")}
+    assert set(walk_manifest(content)) == files
+    folders = {str(content / "series"), str(content / "series" / "empty")}
+    assert set(walk_manifest(content, include_folders=True)) == files | folders
+
+
+def test_exclude_folder(transfer):
+    rules = schema_rules(transfer, "excludeFolder")
+    rows = [["path"], ["content/a.tif"], ["content/series"], ["content/series/c.tif"], ["content/b.tif"]]
+    assert CSV_Stream_Validator(iter(rows), rules).check()
+
+
+def test_include_folder(transfer):
+    rules = schema_rules(transfer, "includeFolder")
+    rows = [["path"], ["content/a.tif"], ["content/series"], ["content/series/c.tif"], ["content/b.tif"]]
+    validator = CSV_Stream_Validator(iter(rows), rules)
+    assert not validator.check()
+    assert validator.errors == [(None, 0, str(transfer / "content" / "series" / "empty"))]
+
+
+def test_missing_file(transfer):
+    rules = schema_rules(transfer, "excludeFolder")
+    rows = [["path"], ["content/a.tif"], ["content/d.tif"], ["content/b.tif"]]
+    validator = CSV_Stream_Validator(iter(rows), rules)
+    assert not validator.check()
+    assert validator.errors == [(1, 0, "content/d.tif")]
+    assert validator.issues[0].message == "Missing file!"
+
+
+def test_orphaned_files(transfer):
+    rules = schema_rules(transfer, "excludeFolder")
+    validator = CSV_Stream_Validator(iter([["path"], ["content/b.tif"]]), rules, max_errors=None)
+    assert not validator.check()
+    content = transfer / "content"
+    assert validator.errors == [(None, 0, str(content / "a.tif")), (None, 0, str(content / "series" / "c.tif"))]
+    assert {issue.message for issue in validator.issues} == {"Orphaned file!"}
@@ -0,0 +1,106 @@
+import logging
+import mmap
+import os
+import re
+from compressed_input import detect_compression
+from csv_validator import CSV_Stream_Validator
+from csvs_compiler import column_references
+
+logger = logging.getLogger(__name__)
+
+# Carriage returns that aren't part of a \r\n line ending, which the csv
+# module takes as the end of a record
+_BARE_CR = re.compile(rb"\r(?!\n)")
+
+
+class CSV_Mmap_Validator(CSV_Stream_Validator):
+    # Reads the CSV file through mmap and splits records at the byte
+    # level. Only the fields some rule reads are decoded, the rest are
+    # left as "" in the row, so wide files with a few checked columns skip
+    # most of the decoding and allocation. Rows with the wrong number of
+    # fields are split in full so they're reported as before. Files that
+    # need quoting rules, schemas with @quoted, encodings that aren't
+    # ASCII compatible and compressed files are read by the csv module.
+    def _fast_path_reason(self, mapped):
+        # Reason the bytes can't just be split, or None
+        directives = self.rules["@global_directives"]
+        if directives["quoted"]:
+            return "schema has @quoted"
+        special = f'\n{directives["separator"]}"'
+        try:
+            ascii_compatible = special.encode(self.encoding) == special.encode("ascii")
+        except UnicodeEncodeError:
+            ascii_compatible = False
+        if not ascii_compatible:
+            return f"{self.encoding} isn't split at the byte level"
+        # Searched separately as a memchr for one byte is many times
+        # faster than a regex for either
+        if mapped.find(b'"') != -1:
+            return "file has quotes"
+        if mapped.find(b"\r") != -1 and _BARE_CR.search(mapped):
+            return "file has carriage returns on their own"
+        return None
+
+    def _read_columns(self):
+        # Numbers of the columns whose values are read by a rule
+        read = set()
+        for index, key in self.column_map.items():
+            rule = self.rules[key]
+            if rule["functions"] or rule.get("aggregates") or rule.get("prefetch"):
+                read.add(index)
+            for expr in rule["exprs"] + rule.get("aggregate_exprs", []):
+                read.update(self.column_name_map[name] for name in column_references(expr)
+                            if name in self.column_name_map)
+        return sorted(read)
+
+    def _rows(self):
+        if not isinstance(self.csv_file, (str, os.PathLike)) or detect_compression(self.csv_file):
+            yield from super()._rows()
+            return
+        with open(self.csv_file, "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                reason = self._fast_path_reason(mapped)
+                if reason is not None:
+                    logger.info("Reading with the csv module, %s", reason)
+                    yield from super()._rows()
+                    return
+                yield from self._split_rows(mapped)
+
+    def _split_rows(self, mapped):
+        encoding = self.encoding
+        delimiter = self.rules["@global_directives"]["separator"]
+        separator = delimiter.encode(encoding)
+        lines = iter(mapped.readline, b"")
+        if self.rules["@global_directives"]["header"]:
+            line = next(lines, b"").rstrip(b"\r\n")
+            yield line.decode(encoding).split(delimiter) if line else []
+        # The header has been read by now, so the columns are known
+        read = self._read_columns()
+        width = max(self.column_map, default=-1) + 1
+        # Fields after the last one read are never split out
+        split_count = read[-1] + 1 if read else 0
+        if len(read) == width:
+            # Nothing to leave out, one decode and split is quickest
+            for line in lines:
+                line = line.rstrip(b"\r\n")
+                yield line.decode(encoding).split(delimiter) if line else []
+            return
+        for line in lines:
+            line = line.rstrip(b"\r\n")
+            if not line:
+                yield []
+                continue
+            fields = line.split(separator, split_count)
+            count = len(fields)
+            if count > split_count:
+                # The last piece is the rest of the line
+                count = split_count + fields[split_count].count(separator) + 1
+            if count != width:
+                yield line.decode(encoding).split(delimiter)
+                continue
+            row = [""] * count
+            for index in read:
+                row[index] = fields[index].decode(encoding)
+            yield row
@@ -0,0 +1,87 @@
+import random
+import pytest
+from csv_validator import CSV_Stream_Validator
+from csvs_compiler import load_rules
+from mmap_reader import CSV_Mmap_Validator
+
+SCHEMA = """version 1.0
+@totalColumns 6
+id: unique
+a:
+b: is($a) or empty
+c:
+d: range(0, 100)
+e:
+"""
+
+
+@pytest.fixture
+def rules(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(SCHEMA)
+    return load_rules(schema_file, cache_dir=None)
+
+
+def _issues(validator):
+    assert validator.check() == (not validator.error_count)
+    return [(issue.row, issue.column, issue.value, issue.message) for issue in validator.issues]
+
+
+def _rows(validator):
+    rows = iter(validator._rows())
+    validator._read_header(rows)
+    return list(rows)
+
+
+def test_same_issues_as_stream(tmp_path, rules):
+    rng = random.Random(1)
+    values = ["", "x", "y", "5", "50", "500", "é"]
+    lines = ["id,a,b,c,d,e"]
+    for i in range(2000):
+        fields = [str(i % 1500)] + [rng.choice(values) for _ in range(5)]
+        if i % 97 == 0:
+            fields = fields[:rng.randint(1, 5)]
+        elif i % 89 == 0:
+            fields.append("extra")
+        elif i % 83 == 0:
+            fields = []
+        lines.append(",".join(fields))
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_text("\r\n".join(lines), encoding="utf-8")
+    expected = _issues(CSV_Stream_Validator(csv_file, rules, max_errors=None))
+    assert expected
+    assert _issues(CSV_Mmap_Validator(csv_file, rules, max_errors=None)) == expected
+    assert _issues(CSV_Mmap_Validator(csv_file, rules, block_size=64, max_errors=None)) == expected
+
+
+def test_unread_columns_are_not_decoded(tmp_path, rules):
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_text("id,a,b,c,d,e\n1,x,y,z,5,w\n2,x\n")
+    # a is read by b's rule, c and e by nothing, and a short row is split in full
+    assert _rows(CSV_Mmap_Validator(csv_file, rules)) == [["1", "x", "y", "", "5", ""], ["2", "x"]]
+
+
+def test_quoted_files_use_csv_module(tmp_path, rules):
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_text('id,a,b,c,d,e\n1,"x,y",,z,5,w\n2,a,b,\rc,5,\n')
+    expected = _rows(CSV_Stream_Validator(csv_file, rules))
+    assert _rows(CSV_Mmap_Validator(csv_file, rules)) == expected
+    assert expected[0][1] == "x,y"
+
+
+@pytest.mark.parametrize("text", ["", "id,a,b,c,d,e", "id,a,b,c,d,e\n\n"])
+def test_short_files(tmp_path, rules, text):
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_text(text)
+    assert _issues(CSV_Mmap_Validator(csv_file, rules)) == _issues(CSV_Stream_Validator(csv_file, rules))
+
+
+def test_every_column_read(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text("version 1.0\n@totalColumns 2\na: notEmpty\nb: is($a)\n")
+    rules = load_rules(schema_file, cache_dir=None)
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_text("a,b\r\nx,x\r\n,y\r\nz\r\n\r\nq,q,q\r\n")
+    assert _rows(CSV_Mmap_Validator(csv_file, rules)) == [["x", "x"], ["", "y"], ["z"], [], ["q", "q", "q"]]
+    assert _issues(CSV_Mmap_Validator(csv_file, rules, max_errors=None)) == _issues(
+        CSV_Stream_Validator(csv_file, rules, max_errors=None))
@@ -0,0 +1,208 @@
+import csv
+import io
+import itertools
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from compressed_input import detect_compression
+from csv_validator import CSV_Stream_Validator, CSV_Validator
+from csvs_compiler import load_rules
+
+logger = logging.getLogger(__name__)
+
+# Default size of the byte range given to each worker
+CHUNK_SIZE = 16 * 1024 * 1024
+# Size of the reads used when looking for record boundaries
+BLOCK_SIZE = 1024 * 1024
+
+# Rules rebuilt once in each worker process, the compiled validators are
+# closures so they can't be sent to the workers
+_worker_rules = None
+# Validator each worker checks its chunks with, so its generated row
+# function and memos carry on from one chunk to the next
+_worker_validator = None
+
+
+def _init_worker(schema_file, adaptive):
+    global _worker_rules, _worker_validator
+    _worker_rules = load_rules(schema_file, adaptive=adaptive)
+    _worker_validator = None
+
+
+def read_header(csv_file):
+    # Returns the raw header record and the byte offset just after it
+    with open(csv_file, "rb") as f:
+        record = f.readline()
+        # An odd number of quotes means a quoted newline, keep reading
+        while record.count(b'"') % 2:
+            line = f.readline()
+            if not line:
+                break
+            record += line
+        return record, f.tell()
+
+
+def find_chunks(csv_file, start=0, chunk_size=CHUNK_SIZE, block_size=BLOCK_SIZE):
+    # Split the file from start into (start, end) byte ranges of roughly
+    # chunk_size that always end on a record boundary. A newline only ends
+    # a record when it is outside quotes, i.e. the number of quotes seen
+    # since the last boundary is even. Doubled quotes ("") inside a field
+    # count twice so they don't change the parity.
+    boundaries = [start]
+    target = start + chunk_size
+    parity = 0
+    with open(csv_file, "rb") as f:
+        f.seek(start)
+        offset = start
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            cur = 0
+            while cur < len(block):
+                # Next target is past this block, just keep the quote count
+                if offset + len(block) <= target:
+                    parity ^= block.count(b'"', cur) & 1
+                    break
+                i = max(cur, target - offset)
+                parity ^= block.count(b'"', cur, i) & 1
+                cur = i
+                # Look for the first newline outside quotes
+                while True:
+                    j = block.find(b"\n", cur)
+                    if j == -1:
+                        parity ^= block.count(b'"', cur) & 1
+                        cur = len(block)
+                        break
+                    parity ^= block.count(b'"', cur, j) & 1
+                    cur = j + 1
+                    if not parity:
+                        boundaries.append(offset + cur)
+                        target = offset + cur + chunk_size
+                        break
+            offset += len(block)
+    if boundaries[-1] < offset:
+        boundaries.append(offset)
+    return list(zip(boundaries, boundaries[1:]))
+
+
+def _check_chunk(task):
+    (csv_file, start, end, encoding, max_errors,
+     column_index, column_map, column_name_map) = task
+    with open(csv_file, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    # Row numbers are only local to the chunk, the parent process adds the
+    # rows of the chunks before
+    validator = _chunk_validator(column_index, column_map, column_name_map)
+    validator.csv_file = data.decode(encoding)
+    validator.max_errors = max_errors
+    validator.issues = []
+    validator.error_count = validator.warning_count = 0
+    row_count = 0
+    checking = True
+    for row_num, row in enumerate(validator._rows()):
+        # Rows past max_errors still need counting for the row numbers
+        if checking:
+            checking = validator._check_row(row_num, row)
+        row_count += 1
+    return row_count, validator.issues
+
+
+def _chunk_validator(column_index, column_map, column_name_map):
+    # The worker's validator, set up for the header on its first chunk
+    global _worker_validator
+    if _worker_validator is None:
+        validator = CSV_Validator("", _worker_rules)
+        validator.column_index = column_index
+        validator.column_map = column_map
+        validator.column_name_map = column_name_map
+        validator._compile_row_errors()
+        _worker_validator = validator
+    return _worker_validator
+
+
+class CSV_Parallel_Validator(CSV_Validator):
+    # Validates a single CSV file by splitting it into byte ranges on
+    # record boundaries and checking them in a pool of processes.
+    # Each worker rebuilds the rules from schema_file.
+    def __init__(self, csv_file, schema_file, workers=None, chunk_size=CHUNK_SIZE,
+                 encoding="utf-8", max_errors=1, issue_writer=None, adaptive=False):
+        super().__init__(csv_file, load_rules(schema_file, adaptive=adaptive), max_errors=max_errors,
+                         issue_writer=issue_writer)
+        self.schema_file = schema_file
+        self.adaptive = adaptive
+        self.workers = workers or os.cpu_count()
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+
+    def __repr__(self):
+        return str(self.csv_file)
+
+    def _single_process_reason(self):
+        if detect_compression(self.csv_file):
+            # There's no seeking to a record boundary in a compressed file
+            return "CSV file is compressed"
+        if any(rule.get("aggregates") for key, rule in self.rules.items()
+               if key != "@global_directives"):
+            # Rules like unique need every row in one place
+            return "Schema has cross-row rules"
+        return None
+
+    def check(self):
+        reason = self._single_process_reason()
+        if reason:
+            logger.info("%s, checking in one process.", reason)
+            validator = CSV_Stream_Validator(self.csv_file, self.rules, self.encoding,
+                                             max_errors=self.max_errors,
+                                             issue_writer=self.issue_writer)
+            valid = validator.check()
+            self.issues = validator.issues
+            self.error_count = validator.error_count
+            self.warning_count = validator.warning_count
+            return valid
+        start = 0
+        if self.rules["@global_directives"]["header"]:
+            record, start = read_header(self.csv_file)
+            delimiter = self.rules['@global_directives']['separator']
+            header = next(csv.reader(io.StringIO(record.decode(self.encoding), newline=""),
+                                     delimiter=delimiter), None)
+            if header is None:
+                self._header_error("No header found.")
+                return False
+            if not self._check_header(header):
+                return False
+        else:
+            self._map_columns()
+
+        chunks = find_chunks(self.csv_file, start, self.chunk_size)
+        tasks = (
+            (self.csv_file, chunk_start, chunk_end, self.encoding, self.max_errors,
+             self.column_index, self.column_map, self.column_name_map)
+            for chunk_start, chunk_end in chunks
+        )
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 initializer=_init_worker,
+                                 initargs=(self.schema_file, self.adaptive)) as executor:
+            first_row = 0
+            pending = deque()
+            try:
+                while True:
+                    # Only a few chunks are in flight ahead of the one
+                    # reported next, so results aren't held for the whole
+                    # file and none are sent once max_errors is reached
+                    for task in itertools.islice(tasks, self.workers * 2 - len(pending)):
+                        pending.append(executor.submit(_check_chunk, task))
+                    if not pending:
+                        return not self.error_count
+                    # Results are taken in chunk order so the global row
+                    # number is the sum of the rows in the chunks before
+                    row_count, issues = pending.popleft().result()
+                    for issue in issues:
+                        if not self._add_issue(issue._replace(row=first_row + issue.row)):
+                            return False
+                    first_row += row_count
+            finally:
+                for future in pending:
+                    future.cancel()
@@ -0,0 +1,109 @@
+from concurrent.futures import ProcessPoolExecutor
+import parallel_validator
+from parallel_validator import CSV_Parallel_Validator, find_chunks, read_header
+
+SCHEMA = """version 1.0
+@totalColumns 3
+name: notEmpty
+age: range(0, 120)
+note: notEmpty
+"""
+
+
+def write_files(tmp_path, rows):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(SCHEMA)
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_text("name,age,note\n" + "".join(rows))
+    return schema_file, csv_file
+
+
+def test_find_chunks_quoted_newlines(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    data = b'a,b\n"x\ny\nz",1\n"q",2\n"multi\n\nline",3\n'
+    csv_file.write_bytes(data)
+    _, start = read_header(csv_file)
+    assert start == 4
+    for chunk_size in range(1, len(data)):
+        for block_size in (1, 3, 7, 1024):
+            chunks = find_chunks(csv_file, start, chunk_size, block_size)
+            ends = [end for _, end in chunks]
+            # Every chunk ends after a complete record
+            assert set(ends) <= {14, 20, 36}
+            assert chunks[0][0] == start and ends[-1] == len(data)
+
+
+def test_read_header_quoted_newline(tmp_path):
+    csv_file = tmp_path / "test.csv"
+    csv_file.write_bytes(b'"a\nb",c\n1,2\n')
+    assert read_header(csv_file) == (b'"a\nb",c\n', 8)
+
+
+def test_parallel_valid(tmp_path):
+    rows = [f'name{i},{i % 100},"line\none"\n' for i in range(200)]
+    schema_file, csv_file = write_files(tmp_path, rows)
+    validator = CSV_Parallel_Validator(csv_file, schema_file, workers=2, chunk_size=256)
+    assert validator.check()
+
+
+def test_parallel_row_numbers(tmp_path):
+    rows = [f'name{i},{i % 100},"line\none"\n' for i in range(200)]
+    rows[57] = 'bad,200,"x"\n'
+    rows[150] = ',5,"y\nz"\n'
+    schema_file, csv_file = write_files(tmp_path, rows)
+    validator = CSV_Parallel_Validator(csv_file, schema_file, workers=3, chunk_size=200,
+                                       max_errors=None)
+    assert not validator.check()
+    assert validator.errors == [(57, 1, "200"), (150, 0, "")]
+    # The first error only, as without workers
+    validator = CSV_Parallel_Validator(csv_file, schema_file, workers=3, chunk_size=200)
+    assert not validator.check()
+    assert validator.errors == [(57, 1, "200")]
+
+
+def test_parallel_adaptive(tmp_path):
+    rows = [f'name{i},{i % 100},"x"\n' for i in range(200)]
+    schema_file, csv_file = write_files(tmp_path, rows)
+    validator = CSV_Parallel_Validator(csv_file, schema_file, workers=2, chunk_size=256, adaptive=True)
+    assert validator.rules[0]["adaptive"]
+    assert validator.check()
+    # As each worker builds its rules
+    parallel_validator._init_worker(schema_file, True)
+    assert parallel_validator._worker_rules[0]["adaptive"]
+
+
+def test_worker_compiles_row_errors(tmp_path, monkeypatch):
+    rows = [f"name{i},{i % 10},x\n" for i in range(100)]
+    schema_file, csv_file = write_files(tmp_path, rows)
+    validator = CSV_Parallel_Validator(csv_file, schema_file)
+    header, start = read_header(csv_file)
+    validator._check_header(header.decode().rstrip("\n").split(","))
+    monkeypatch.setattr(parallel_validator, "_worker_validator", None)
+    parallel_validator._init_worker(schema_file, False)
+    chunks = find_chunks(csv_file, start, 200)
+    for chunk_start, chunk_end in chunks:
+        parallel_validator._check_chunk((csv_file, chunk_start, chunk_end, "utf-8", 1, validator.column_index,
+                                         validator.column_map, validator.column_name_map))
+    # One validator for the worker's chunks, with the generated row
+    # function and the age column's memo carried from chunk to chunk
+    worker = parallel_validator._worker_validator
+    assert hasattr(worker._row_errors, "source")
+    assert len(chunks) > 1 and worker.memo_stats() == {"age": (90, 10)}
+
+
+def test_parallel_stops_submitting_at_max_errors(tmp_path, monkeypatch):
+    submitted = []
+
+    class Executor(ProcessPoolExecutor):
+        def submit(self, *args):
+            submitted.append(args)
+            return super().submit(*args)
+    monkeypatch.setattr(parallel_validator, "ProcessPoolExecutor", Executor)
+    rows = [f"name{i},{i % 100},x\n" for i in range(400)]
+    rows[3] = "bad,200,x\n"
+    schema_file, csv_file = write_files(tmp_path, rows)
+    validator = CSV_Parallel_Validator(csv_file, schema_file, workers=1, chunk_size=100)
+    assert not validator.check()
+    assert validator.errors == [(3, 1, "200")]
+    assert len(find_chunks(csv_file, read_header(csv_file)[1], 100)) > 20
+    assert len(submitted) == 2
@@ -0,0 +1,164 @@
+import time
+
+
+class RuleStats:
+    # Counters for one rule of one column. Updated without a lock, so with
+    # several threads the counts can be a little low.
+    __slots__ = ("column", "rule", "calls", "time_ns", "passes", "fails", "exceptions")
+
+    def __init__(self, column, rule):
+        self.column = column
+        self.rule = rule
+        self.calls = 0
+        self.time_ns = 0
+        self.passes = 0
+        self.fails = 0
+        self.exceptions = 0
+
+
+class RuleProfiler:
+    # Counts calls, time and results of each compiled validator. Only the
+    # rules given to a validator with a profiler are wrapped, so the
+    # normal run is untouched. calls counts cells, a block of cells
+    # checked by a batch validator counts each of them.
+    def __init__(self):
+        self._stats = {}
+
+    def stats(self, column, rule):
+        key = (column, rule)
+        found = self._stats.get(key)
+        if found is None:
+            found = self._stats[key] = RuleStats(column, rule)
+        return found
+
+    def wrap(self, column, rule, function, match_is_false=False):
+        # Validator taking (value, row, colmap) that counts into the
+        # stats of column and rule
+        stats = self.stats(column, rule)
+        perf_counter_ns = time.perf_counter_ns
+
+        def profiled_validator(value, row, colmap):
+            start = perf_counter_ns()
+            try:
+                result = function(value, row, colmap)
+            except Exception:
+                stats.exceptions += 1
+                raise
+            finally:
+                stats.time_ns += perf_counter_ns() - start
+                stats.calls += 1
+            if bool(result) == match_is_false:
+                stats.fails += 1
+            else:
+                stats.passes += 1
+            return result
+        return profiled_validator
+
+    def wrap_batch(self, column, rule, batch_function, match_is_false=False):
+        # The same for a batch validator taking (values, rows, colmap)
+        stats = self.stats(column, rule)
+        perf_counter_ns = time.perf_counter_ns
+
+        def profiled_batch(values, rows, colmap):
+            start = perf_counter_ns()
+            try:
+                mask = batch_function(values, rows, colmap)
+            except Exception:
+                stats.exceptions += 1
+                raise
+            finally:
+                stats.time_ns += perf_counter_ns() - start
+            fails = sum(1 for valid in mask if bool(valid) == match_is_false)
+            stats.calls += len(values)
+            stats.fails += fails
+            stats.passes += len(values) - fails
+            return mask
+        return profiled_batch
+
+    def wrap_aggregate(self, column, rule, state):
+        return ProfiledAggregate(self.stats(column, rule), state)
+
+    def profile_rules(self, rules):
+        # Copy of compiled rules with every validator wrapped
+        profiled = {}
+        for key, rule in rules.items():
+            if key == "@global_directives":
+                profiled[key] = rule
+                continue
+            match_is_false = rule["directives"]["matchIsFalse"]
+            profiled[key] = dict(rule, functions=[
+                self.wrap(rule["name"], str(expr), function, match_is_false)
+                for function, expr in zip(rule["functions"], rule["exprs"])
+            ])
+        return profiled
+
+    def results(self):
+        # Stats of every rule that was called, slowest first
+        return sorted((stats for stats in self._stats.values() if stats.calls),
+                      key=lambda stats: stats.time_ns, reverse=True)
+
+    def column_times(self):
+        # Total time in each column's rules, slowest first
+        totals = {}
+        for stats in self._stats.values():
+            totals[stats.column] = totals.get(stats.column, 0) + stats.time_ns
+        return sorted(totals.items(), key=lambda total: total[1], reverse=True)
+
+    def report(self, top=None):
+        results = self.results()[:top]
+        total_ns = sum(stats.time_ns for stats in self._stats.values()) or 1
+        lines = [f"{'column':20} {'rule':40} {'calls':>10} {'ms':>10} {'us/call':>9} "
+                 f"{'%':>6} {'pass':>10} {'fail':>10}"]
+        for stats in results:
+            lines.append(
+                f"{stats.column[:20]:20} {stats.rule[:40]:40} {stats.calls:10,} "
+                f"{stats.time_ns / 1e6:10.1f} {stats.time_ns / stats.calls / 1e3:9.2f} "
+                f"{100 * stats.time_ns / total_ns:6.1f} {stats.passes:10,} {stats.fails:10,}"
+            )
+        lines.append("")
+        lines.append(f"{'column':20} {'ms':>10} {'%':>6}")
+        for column, time_ns in self.column_times()[:top]:
+            lines.append(f"{column[:20]:20} {time_ns / 1e6:10.1f} {100 * time_ns / total_ns:6.1f}")
+        return "\n".join(lines)
+
+
+class ProfiledAggregate:
+    # Stands in for the state of a rule checked across rows, like unique,
+    # counting each row added and the time to finish
+    def __init__(self, stats, state):
+        self.stats = stats
+        self.state = state
+
+    def add(self, row_num, value, row, colmap):
+        stats = self.stats
+        start = time.perf_counter_ns()
+        try:
+            message = self.state.add(row_num, value, row, colmap)
+        finally:
+            stats.time_ns += time.perf_counter_ns() - start
+            stats.calls += 1
+        if message is None:
+            stats.passes += 1
+        else:
+            stats.fails += 1
+        return message
+
+    def slow_add(self):
+        return self.state.slow_add()
+
+    def finish(self):
+        # Passes on the state's issues as they're taken, timing each
+        issues = iter(self.state.finish())
+        while True:
+            start = time.perf_counter_ns()
+            try:
+                issue = next(issues, None)
+            finally:
+                self.stats.time_ns += time.perf_counter_ns() - start
+            if issue is None:
+                return
+            self.stats.fails += 1
+            yield issue
+
+    def close(self):
+        self.state.close()
@@ -0,0 +1,56 @@
+import pytest
+from csv_validator import CSV_Stream_Validator, CSV_Threaded_Validator
+from csvs_compiler import load_rules
+from rule_profiler import RuleProfiler
+
+SCHEMA = """version 1.0
+@totalColumns 3
+id: unique
+age: range(0, 120)
+gender: is("m") or is("f")
+"""
+
+ROWS = [["id", "age", "gender"]] + [[str(n), str(n % 150), "mf"[n % 2]] for n in range(300)]
+
+
+@pytest.fixture
+def rules(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(SCHEMA)
+    return load_rules(schema_file, cache_dir=None)
+
+
+def _counts(profiler):
+    return {(stats.column, stats.rule): (stats.calls, stats.passes, stats.fails)
+            for stats in profiler.results()}
+
+
+@pytest.mark.parametrize("options", [{}, {"block_size": 64}])
+def test_profile_counts(rules, options):
+    profiler = RuleProfiler()
+    validator = CSV_Stream_Validator(iter(ROWS), rules, max_errors=None, profiler=profiler,
+                                     **options)
+    assert not validator.check()
+    counts = _counts(profiler)
+    calls, passes, fails = counts[("gender", 'is("m") or is("f")')]
+    assert calls >= 300 and passes == calls and not fails
+    assert counts[("id", "unique")] == (300, 300, 0)
+    if not options:
+        # 29 of each 150 ages are out of range
+        assert counts[("age", "range(0, 120)")] == (300, 242, 58)
+    assert all(stats.time_ns > 0 for stats in profiler.results())
+    report = profiler.report()
+    assert "range(0, 120)" in report and "unique" in report
+
+
+def test_profile_leaves_rules_alone(rules):
+    functions = list(rules[1]["functions"])
+    CSV_Stream_Validator(iter(ROWS), rules, profiler=RuleProfiler()).check()
+    assert rules[1]["functions"] == functions
+
+
+def test_profile_threads(rules):
+    profiler = RuleProfiler()
+    CSV_Threaded_Validator(iter(ROWS), rules, workers=1, rows_per_task=16, max_errors=None,
+                           profiler=profiler).check()
+    assert _counts(profiler)[("age", "range(0, 120)")] == (300, 242, 58)
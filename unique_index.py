@@ -0,0 +1,218 @@
+import hashlib
+import heapq
+import os
+import struct
+import tempfile
+
+# Values are stored as 16 byte digests, so a key of any length costs the
+# same and the chance of two different values colliding is negligible
+DIGEST_SIZE = 16
+# Rough memory used by each digest in the in-memory dict, used to work out
+# when to spill to disk
+ENTRY_SIZE = 112
+# Default memory budget of a UniqueIndex
+MEMORY_BUDGET = 256 * 1024 * 1024
+# Records in the on-disk runs, digest then row number
+RECORD = struct.Struct(">16sQ")
+# Records in the runs of duplicates found by the merge, duplicate row
+# then first row
+PAIR = struct.Struct(">QQ")
+# Records read at a time when merging the runs
+RECORDS_PER_READ = 4096
+
+
+def value_digest(values):
+    # Digest of one value, or of several with the length of each
+    # included so ("ab", "c") and ("a", "bc") are different keys
+    if isinstance(values, str):
+        data = values.encode("utf-8", "surrogatepass")
+    else:
+        encoded = [value.encode("utf-8", "surrogatepass") for value in values]
+        data = b"".join(len(value).to_bytes(4, "big") + value for value in encoded)
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+
+def _read_run(run_file, record=RECORD):
+    with open(run_file, "rb") as f:
+        while True:
+            data = f.read(record.size * RECORDS_PER_READ)
+            if not data:
+                return
+            yield from record.iter_unpack(data)
+
+
+class UniqueIndex:
+    # Finds repeated keys among any number of rows. Digests are kept in a
+    # dict until it passes memory_budget, then written out as a sorted run
+    # and the dict is started again. Until the first spill, repeats are
+    # found as soon as they are added. After it a key's first row could be
+    # in any run, so every row is kept and repeats are found when the runs
+    # are merged by duplicates().
+    def __init__(self, memory_budget=MEMORY_BUDGET, tmp_dir=None):
+        self.max_entries = max(1, memory_budget // ENTRY_SIZE)
+        self.tmp_dir = tmp_dir
+        self._seen = {}
+        self._added = []
+        self._runs = []
+        self._run_dir = None
+
+    def add(self, digest, row_num):
+        # Row number of the first row with this digest if it's known to be
+        # a repeat now, otherwise None
+        if self._runs:
+            self._added.append((digest, row_num))
+            size = len(self._added)
+        else:
+            first_row = self._seen.setdefault(digest, row_num)
+            if first_row != row_num:
+                return first_row
+            size = len(self._seen)
+        if size >= self.max_entries:
+            self._spill()
+        return None
+
+    def full(self):
+        # True if the next new key spills to disk
+        return max(len(self._seen), len(self._added)) + 1 >= self.max_entries
+
+    def _spill(self):
+        self._runs.append(self._write_run(f"run-{len(self._runs)}", RECORD, self._in_memory()))
+        self._seen = {}
+        self._added = []
+
+    def _write_run(self, name, record, records):
+        if self._run_dir is None:
+            self._run_dir = tempfile.TemporaryDirectory(prefix="csv-validator-unique-",
+                                                        dir=self.tmp_dir)
+        run_file = os.path.join(self._run_dir.name, name)
+        with open(run_file, "wb") as f:
+            f.writelines(record.pack(*fields) for fields in records)
+        return run_file
+
+    def duplicates(self):
+        # (duplicate row, first row) of every repeat not already returned
+        # by add(), in row order. The merge finds them in digest order, so
+        # they're sorted in runs of their own within the memory budget and
+        # those are merged in turn.
+        if not self._runs:
+            return
+        pairs = []
+        pair_runs = []
+        last_digest = first_row = None
+        # Sorted by digest then row number, so the first record for each
+        # digest is its first row
+        for digest, row_num in self._records():
+            if digest != last_digest:
+                last_digest, first_row = digest, row_num
+                continue
+            pairs.append((row_num, first_row))
+            if len(pairs) >= self.max_entries:
+                pairs.sort()
+                pair_runs.append(self._write_run(f"pairs-{len(pair_runs)}", PAIR, pairs))
+                pairs = []
+        pairs.sort()
+        yield from heapq.merge(pairs, *(_read_run(run_file, PAIR) for run_file in pair_runs))
+
+    def _in_memory(self):
+        return sorted(self._added) if self._added else sorted(self._seen.items())
+
+    def _records(self):
+        # Every (digest, row number) added, sorted
+        return heapq.merge(self._in_memory(), *map(_read_run, self._runs))
+
+    def snapshot(self, snapshot_dir):
+        # The first row of every key, merged into one sorted run in
+        # snapshot_dir and written as it's merged, so memory stays within
+        # the budget. Repeats were reported by this run, so they're left
+        # out and not reported again after a restore(). The
+        # (path, size) of the run is what restore() takes in a later run,
+        # the run is left for the caller to delete.
+        fd, run_file = tempfile.mkstemp(dir=snapshot_dir, prefix="unique-", suffix=".run")
+        with os.fdopen(fd, "wb") as f:
+            f.writelines(RECORD.pack(digest, row_num) for digest, row_num in _first_rows(self._records()))
+        return run_file, os.path.getsize(run_file)
+
+    def restore(self, data):
+        # Start from a snapshot(). If it fits in the memory budget it goes
+        # in the dict, so repeats of its keys are found straight away,
+        # otherwise its run is merged with this run's. Raises OSError if
+        # the run is missing or isn't the size it was.
+        run_file, size = data
+        if os.path.getsize(run_file) != size:
+            raise OSError(f"{run_file} has changed since the snapshot")
+        if size // RECORD.size < self.max_entries:
+            for digest, row_num in _read_run(run_file):
+                self._seen.setdefault(digest, row_num)
+            return
+        self._runs.append(run_file)
+
+    def close(self):
+        if self._run_dir is not None:
+            self._run_dir.cleanup()
+            self._run_dir = None
+        self._runs = []
+        self._seen = {}
+        self._added = []
+
+
+def _first_rows(records):
+    last_digest = None
+    for digest, row_num in records:
+        if digest != last_digest:
+            last_digest = digest
+            yield digest, row_num
+
+
+class UniqueRule:
+    # unique and unique($a, $b) are checked across rows, so rather than a
+    # validator they compile to this. Each validation run calls start()
+    # for its own index so the compiled rules can be shared.
+    def __init__(self, columns=(), memory_budget=MEMORY_BUDGET):
+        self.columns = tuple(columns)
+        self.memory_budget = memory_budget
+
+    def __repr__(self):
+        return f"UniqueRule({self.columns!r})"
+
+    def start(self, tmp_dir=None):
+        return UniqueCheck(self, tmp_dir)
+
+
+class UniqueCheck:
+    def __init__(self, rule, tmp_dir=None):
+        self.columns = rule.columns
+        self.index = UniqueIndex(rule.memory_budget, tmp_dir)
+
+    def add(self, row_num, value, row, colmap):
+        # Message if the key was in an earlier row, otherwise None
+        if self.columns:
+            key = [column.resolve(row, colmap) for column in self.columns]
+        else:
+            key = value
+        first_row = self.index.add(value_digest(key), row_num)
+        if first_row is not None:
+            return f"Duplicate of row {first_row}!"
+        return None
+
+    def slow_add(self):
+        # True if the next add can write a run to disk
+        return self.index.full()
+
+    def finish(self):
+        # Yields (row number, value, message) of each duplicate only found
+        # once the spilled runs are merged, in row order. Only digests are
+        # kept, so the value is gone by now.
+        try:
+            for row_num, first_row in self.index.duplicates():
+                yield row_num, None, f"Duplicate of row {first_row}!"
+        finally:
+            self.close()
+
+    def snapshot(self, snapshot_dir):
+        return self.index.snapshot(snapshot_dir)
+
+    def restore(self, data):
+        self.index.restore(data)
+
+    def close(self):
+        self.index.close()
@@ -0,0 +1,165 @@
+import os
+import pytest
+from csv_validator import CSV_Stream_Validator, CSV_Threaded_Validator
+from csvs_compiler import load_rules
+from unique_index import ENTRY_SIZE, RECORD, UniqueCheck, UniqueIndex, value_digest
+
+SCHEMA = """version 1.0
+@totalColumns 3
+id: unique
+first: notEmpty
+last: unique($first,$last)
+"""
+
+
+@pytest.fixture
+def rules(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(SCHEMA)
+    return load_rules(schema_file, cache_dir=None)
+
+
+def test_value_digest():
+    assert len(value_digest("a")) == 16
+    assert value_digest(["ab", "c"]) != value_digest(["a", "bc"])
+    assert value_digest(["é", "a"]) != value_digest(["éa", ""])
+
+
+def test_index_in_memory():
+    index = UniqueIndex()
+    assert index.add(value_digest("a"), 0) is None
+    assert index.add(value_digest("b"), 1) is None
+    assert index.add(value_digest("a"), 2) == 0
+    assert list(index.duplicates()) == []
+
+
+def test_index_spills_to_disk(tmp_path):
+    # Room for 10 digests at a time
+    index = UniqueIndex(memory_budget=ENTRY_SIZE * 10, tmp_dir=tmp_path)
+    for row_num in range(100):
+        assert index.add(value_digest(str(row_num)), row_num) is None
+    assert len(index._runs) == 10
+    for row_num in range(100, 135):
+        assert index.add(value_digest(f"new {row_num}"), row_num) is None
+    assert index.add(value_digest("42"), 135) is None
+    assert index.add(value_digest("17"), 136) is None
+    # In memory with row 135, but its first row is in a run
+    assert index.add(value_digest("42"), 137) is None
+    assert sorted(index.duplicates()) == [(135, 42), (136, 17), (137, 42)]
+    # Only first rows are snapshotted, the repeats have been reported
+    (tmp_path / "snapshot").mkdir()
+    run_file, size = index.snapshot(tmp_path / "snapshot")
+    assert size == 135 * RECORD.size
+    os.remove(run_file)
+    os.rmdir(tmp_path / "snapshot")
+    index.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_index_duplicates_in_row_order(tmp_path):
+    index = UniqueIndex(memory_budget=ENTRY_SIZE * 10, tmp_dir=tmp_path)
+    for row_num in range(20):
+        index.add(value_digest(str(row_num)), row_num)
+    for row_num in range(20, 200):
+        assert index.add(value_digest(str(row_num % 7)), row_num) is None
+    duplicates = index.duplicates()
+    assert next(duplicates) == (20, 6)
+    # Found in digest order, so sorted in runs of their own within the
+    # budget rather than all at once
+    (run_dir,) = tmp_path.iterdir()
+    assert len([run for run in run_dir.iterdir() if run.name.startswith("pairs-")]) > 10
+    assert list(duplicates) == [(row_num, row_num % 7) for row_num in range(21, 200)]
+    index.close()
+
+
+@pytest.mark.parametrize("entries", [10, 1000])
+def test_index_snapshot(tmp_path, entries):
+    index = UniqueIndex(memory_budget=ENTRY_SIZE * 1000)
+    for row_num in range(50):
+        index.add(value_digest(str(row_num)), row_num)
+    (tmp_path / "snapshot").mkdir()
+    data = index.snapshot(tmp_path / "snapshot")
+    index.close()
+    assert data[1] == 50 * RECORD.size
+    # Too big for the new index's budget, it becomes a run on disk
+    restored = UniqueIndex(memory_budget=ENTRY_SIZE * entries, tmp_dir=tmp_path)
+    restored.restore(data)
+    assert len(restored._runs) == (entries < 50)
+    found = restored.add(value_digest("7"), 50)
+    assert found == (None if entries < 50 else 7)
+    assert list(restored.duplicates()) == ([(50, 7)] if entries < 50 else [])
+    restored.close()
+    # The snapshot's run is the caller's to delete
+    assert [path.name for path in (tmp_path / "snapshot").iterdir()] == [os.path.basename(data[0])]
+
+
+def rows(duplicate_row=None):
+    rows = [["id", "first", "last"]] + [[str(n), "james", f"smith {n}"] for n in range(300)]
+    if duplicate_row is not None:
+        rows[duplicate_row + 1] = ["1000", "james", "smith 7"]
+    return rows
+
+
+def test_unique(rules):
+    assert CSV_Stream_Validator(iter(rows()), rules).check()
+    validator = CSV_Stream_Validator(iter(rows(250)), rules)
+    assert not validator.check()
+    assert validator.errors == [(250, 2, "smith 7")]
+    assert validator.issues[0].message == "Duplicate of row 7!"
+    assert validator.issues[0].rule == "unique($first, $last)"
+    # Same last name but a different first name is fine
+    data = rows()
+    data[100] = ["1000", "simon", "smith 7"]
+    assert CSV_Stream_Validator(iter(data), rules).check()
+
+
+def test_unique_spilled(rules):
+    for key in (0, 2):
+        for aggregate in rules[key]["aggregates"]:
+            aggregate.memory_budget = ENTRY_SIZE * 16
+    data = rows(250)
+    data[261][0] = "3"
+    data[271][0] = "3"
+    validator = CSV_Stream_Validator(iter(data), rules, max_errors=None)
+    assert not validator.check()
+    assert validator.errors == [(250, 2, None), (260, 0, None), (270, 0, None)]
+    assert [issue.message for issue in validator.issues] == [
+        "Duplicate of row 7!", "Duplicate of row 3!", "Duplicate of row 3!"]
+
+
+def test_unique_spilled_stops_at_max_errors(rules, monkeypatch):
+    for aggregate in rules[0]["aggregates"]:
+        aggregate.memory_budget = ENTRY_SIZE * 16
+    data = rows()
+    # Every id from row 100 on repeats one from before the spill, so all
+    # 200 duplicates are only found once the runs are merged
+    for row_num in range(100, 300):
+        data[row_num + 1][0] = str(row_num % 8)
+    taken = []
+    finish = UniqueCheck.finish
+
+    def counted_finish(self):
+        for issue in finish(self):
+            taken.append(issue)
+            yield issue
+    monkeypatch.setattr(UniqueCheck, "finish", counted_finish)
+    validator = CSV_Stream_Validator(iter(data), rules, max_errors=1)
+    assert not validator.check()
+    assert validator.errors == [(100, 0, None)]
+    assert [issue.message for issue in validator.issues] == ["Duplicate of row 4!"]
+    # Only the issue reported was taken from the merge
+    assert len(taken) == 1
+
+
+@pytest.mark.parametrize("options", [{"block_size": 16}, {"block_size": 16, "use_numpy": True}])
+def test_unique_blocks(rules, options):
+    validator = CSV_Stream_Validator(iter(rows(250)), rules, **options)
+    assert not validator.check()
+    assert validator.errors == [(250, 2, "smith 7")]
+
+
+def test_unique_threaded(rules):
+    assert CSV_Threaded_Validator(iter(rows()), rules, workers=4, rows_per_task=9).check()
+    validator = CSV_Threaded_Validator(iter(rows(250)), rules, workers=4, rows_per_task=9)
+    assert not validator.check()
+    assert validator.errors == [(250, 2, "smith 7")]
@@ -0,0 +1,120 @@
+#! /usr/bin/env python
+
+# Sends CSV files to a validation_server.py. Only uses the standard
+# library so it starts quickly, the schema is compiled once by the server.
+
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import socket
+import sys
+
+DEFAULT_PORT = 8760
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ValidationError(Exception):
+    pass
+
+
+class ValidationClient:
+    # Checks CSV files against schema files on a server at port, or at
+    # socket_path if given. The schema is only sent when the server hasn't
+    # got it, and one connection is kept for every request.
+    def __init__(self, port=DEFAULT_PORT, socket_path=None, timeout=None):
+        if socket_path:
+            self._connection = UnixHTTPConnection(socket_path, timeout)
+        else:
+            self._connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _request(self, method, path, body=None, headers=None):
+        # (status, JSON answer)
+        self._connection.request(method, path, body, headers or {})
+        response = self._connection.getresponse()
+        answer = json.loads(response.read() or b"{}")
+        if response.will_close:
+            self._connection.close()
+        return response.status, answer
+
+    def send_schema(self, schema_text):
+        digest = hashlib.sha256(schema_text).hexdigest()
+        status, answer = self._request("GET", f"/schemas/{digest}")
+        if status == 404:
+            status, answer = self._request("PUT", f"/schemas/{digest}", schema_text)
+            if status != 200:
+                raise ValidationError(answer.get("error", f"HTTP {status}"))
+        return digest
+
+    def check(self, schema_file, csv_file, max_errors=None, encoding="utf-8"):
+        # The server's answer: valid, error_count, warning_count and issues
+        with open(schema_file, "rb") as f:
+            schema_text = f.read()
+        path = f"/validate/{self.send_schema(schema_text)}?encoding={encoding}"
+        if max_errors:
+            path += f"&max_errors={max_errors}"
+        with open(csv_file, "rb") as f:
+            headers = {"Content-Length": str(os.fstat(f.fileno()).st_size)}
+            status, answer = self._request("POST", path, f, headers)
+            if status == 404:
+                # Dropped from the server's cache since it was sent
+                self.send_schema(schema_text)
+                f.seek(0)
+                status, answer = self._request("POST", path, f, headers)
+        if status != 200:
+            raise ValidationError(answer.get("error", f"HTTP {status}"))
+        return answer
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Validate CSV files on a running "
+                                                     "validation_server.py.")
+    arg_parser.add_argument('schema_file', help="CSV Schema file.")
+    arg_parser.add_argument('csv_file', nargs='+', help="CSV files to be validated.")
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                            help="Port of the server at 127.0.0.1.")
+    arg_parser.add_argument('--socket', help="Unix socket of the server.")
+    arg_parser.add_argument('--max-errors', type=int, default=0,
+                            help="Stop after this many errors, 0 for no limit.")
+
+    args = arg_parser.parse_args()
+
+    all_valid = True
+    try:
+        with ValidationClient(args.port, args.socket) as client:
+            for csv_file in args.csv_file:
+                result = client.check(args.schema_file, csv_file, args.max_errors)
+                for issue in result["issues"]:
+                    print(f"{issue['severity']}: [{issue['row']}, {issue['column']}] "
+                          f"{issue['message']} {issue['rule'] or ''} {issue['value']!r}",
+                          file=sys.stderr)
+                verdict = "VALID" if result["valid"] else "INVALID"
+                name = f"{csv_file}: " if len(args.csv_file) > 1 else ""
+                print(f"{name}{verdict}: {result['error_count']} errors, "
+                      f"{result['warning_count']} warnings")
+                all_valid = all_valid and result["valid"]
+    except (OSError, ValidationError) as e:
+        print(f"Validation failed: {e}", file=sys.stderr)
+        raise SystemExit(2)
+    raise SystemExit(0 if all_valid else 1)
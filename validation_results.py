@@ -0,0 +1,90 @@
+import csv
+import json
+import sys
+from typing import Any, NamedTuple, Optional
+
+ERROR = "error"
+WARNING = "warning"
+
+# Issues held before each write to the output file
+ISSUES_PER_WRITE = 1024
+# Buffer size of the output file
+BUFFER_SIZE = 1024 * 1024
+
+
+class ValidationIssue(NamedTuple):
+    # One problem found by a validator. row is the data row number (not
+    # counting the header) and column the column number, either is None
+    # for problems that aren't in one place, like a bad header or a file
+    # that no row lists. rule is the CSVS text of the failing rule.
+    row: Optional[int]
+    column: Optional[int]
+    column_name: Optional[str]
+    rule: Optional[str]
+    value: Any
+    severity: str
+    message: str
+
+
+def jsonl_issues(file):
+    # One JSON object per line
+    def write_issues(issues):
+        file.writelines(json.dumps(issue._asdict()) + "\n" for issue in issues)
+    return write_issues
+
+
+def csv_issues(file):
+    # A CSV file with a header row of the issue fields
+    writer = csv.writer(file)
+    writer.writerow(ValidationIssue._fields)
+    return writer.writerows
+
+
+# Output formats, each a function taking the open output file and
+# returning the function that writes a batch of issues to it
+ISSUE_FORMATS = {"jsonl": jsonl_issues, "csv": csv_issues}
+
+
+class Issue_Writer:
+    # Writes issues to a file, or stdout for "-", a batch at a time, in the
+    # format given by one of ISSUE_FORMATS
+    def __init__(self, output_file="-", issue_format=jsonl_issues):
+        self.output_file = output_file
+        if output_file == "-":
+            self._file = sys.stdout
+        else:
+            self._file = open(output_file, "w", encoding="utf-8", newline="",
+                              buffering=BUFFER_SIZE)
+        self._write = issue_format(self._file)
+        self._pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, issue):
+        self._pending.append(issue)
+        if len(self._pending) >= ISSUES_PER_WRITE:
+            self.flush()
+
+    def flush(self):
+        self._write(self._pending)
+        self._pending = []
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+def open_issue_writer(output_file="-", output_format=None):
+    # Writer for output_file, in output_format ("jsonl" or "csv") or the
+    # format given by the file's extension, JSON Lines otherwise
+    if output_format is None:
+        output_format = "csv" if str(output_file).lower().endswith(".csv") else "jsonl"
+    if output_format not in ISSUE_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    return Issue_Writer(output_file, ISSUE_FORMATS[output_format])
@@ -0,0 +1,74 @@
+import csv
+import json
+import pytest
+from csv_validator import CSV_Validator
+from csvs_compiler import load_rules
+from validation_results import ERROR, WARNING, ValidationIssue, open_issue_writer
+
+SCHEMA = """version 1.0
+@totalColumns 3
+name: notEmpty
+age: range(0, 120)
+gender: is("m") or is("f") @warning
+"""
+
+CSV = "name,age,gender\njames,old,m\n,19,x\nlauren,200,f\n"
+
+
+@pytest.fixture
+def rules(tmp_path):
+    schema_file = tmp_path / "schema.csvs"
+    schema_file.write_text(SCHEMA)
+    return load_rules(schema_file, cache_dir=None)
+
+
+def test_fail_fast(rules):
+    validator = CSV_Validator(CSV, rules)
+    assert not validator.check()
+    assert validator.issues == [
+        ValidationIssue(0, 1, "age", "range(0, 120)", "old", ERROR, "Invalid element!"),
+    ]
+
+
+def test_all_issues(rules):
+    validator = CSV_Validator(CSV, rules, max_errors=None)
+    assert not validator.check()
+    assert [(issue.row, issue.column, issue.severity) for issue in validator.issues] == [
+        (0, 1, ERROR), (1, 0, ERROR), (1, 2, WARNING), (2, 1, ERROR),
+    ]
+    assert validator.issues[2].rule == 'is("m") or is("f")'
+    assert (validator.error_count, validator.warning_count) == (3, 1)
+    validator = CSV_Validator(CSV, rules, max_errors=2)
+    assert not validator.check()
+    assert validator.errors == [(0, 1, "old"), (1, 0, "")]
+
+
+def test_warnings_are_valid(rules):
+    validator = CSV_Validator("name,age,gender\njames,21,x\n", rules)
+    assert validator.check()
+    assert validator.warning_count == 1
+
+
+def test_header_issue(rules):
+    validator = CSV_Validator("name,gender\njames,m\n", rules)
+    assert not validator.check()
+    (issue,) = validator.issues
+    assert (issue.row, issue.rule, issue.severity) == (None, "header", ERROR)
+
+
+@pytest.mark.parametrize("output_format", ["jsonl", "csv"])
+def test_issue_writer(rules, tmp_path, output_format):
+    output_file = tmp_path / f"issues.{output_format}"
+    with open_issue_writer(output_file) as writer:
+        validator = CSV_Validator(CSV, rules, max_errors=None, issue_writer=writer)
+        assert not validator.check()
+    # Written out rather than kept
+    assert validator.issues == []
+    with open(output_file, newline="") as f:
+        if output_format == "jsonl":
+            issues = [json.loads(line) for line in f]
+        else:
+            issues = list(csv.DictReader(f))
+    assert len(issues) == 4
+    assert issues[0]["column_name"] == "age" and issues[0]["value"] == "old"
+    assert issues[2]["severity"] == WARNING
@@ -0,0 +1,345 @@
+#! /usr/bin/env python
+
+import argparse
+import codecs
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import socketserver
+import tempfile
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from lark.exceptions import LarkError
+from csv_validator import CSV_Stream_Validator
+from csvs_compiler import load_rules
+from csvs_parser import SchemaError
+from external_validators import file_index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8760
+# Compiled schemas kept by a server, least recently used go first
+SCHEMA_CACHE_SIZE = 32
+
+
+def schema_digest(schema_text):
+    # Key of a schema in the server's cache, from the bytes of its file
+    return hashlib.sha256(schema_text).hexdigest()
+
+
+class SchemaCache:
+    # Compiled rules of the schemas sent to the server by digest. The rules
+    # are shared by every request using them, as with the threaded
+    # validator.
+    def __init__(self, size=SCHEMA_CACHE_SIZE):
+        self.size = size
+        self._rules = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __contains__(self, digest):
+        return digest in self._rules
+
+    def get(self, digest):
+        # Rules of a cached schema, or None
+        with self._lock:
+            rules = self._rules.get(digest)
+            if rules is not None:
+                self._rules.move_to_end(digest)
+            return rules
+
+    def add(self, schema_text):
+        # Compiles the schema's bytes and returns its digest, raises
+        # SchemaError or a Lark error for an invalid schema
+        digest = schema_digest(schema_text)
+        if self.get(digest) is not None:
+            return digest
+        # The parser reads schemas from files, and the on-disk parse cache
+        # still saves the Lark run after a restart
+        fd, schema_file = tempfile.mkstemp(suffix=".csvs")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(schema_text)
+            rules = load_rules(schema_file)
+        finally:
+            os.unlink(schema_file)
+        with self._lock:
+            self._rules[digest] = rules
+            self._rules.move_to_end(digest)
+            while len(self._rules) > self.size:
+                evicted, _rules = self._rules.popitem(last=False)
+                logger.info("Schema %s dropped from the cache", evicted)
+        return digest
+
+
+class _LengthReader(io.RawIOBase):
+    # Body of a request with a Content-Length
+    def __init__(self, rfile, length):
+        self._rfile = rfile
+        self.left = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.left:
+            return 0
+        data = self._rfile.read(min(len(buffer), self.left))
+        if not data:
+            raise EOFError("Request body ended early")
+        buffer[:len(data)] = data
+        self.left -= len(data)
+        return len(data)
+
+
+class _ChunkedReader(io.RawIOBase):
+    # Body of a request sent with Transfer-Encoding: chunked
+    def __init__(self, rfile):
+        self._rfile = rfile
+        self._chunk_left = 0
+        self.left = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.left:
+            return 0
+        if not self._chunk_left:
+            self._chunk_left = int(self._rfile.readline().split(b";")[0], 16)
+            if not self._chunk_left:
+                # Trailers end with an empty line
+                while self._rfile.readline() not in (b"\r\n", b"\n", b""):
+                    pass
+                self.left = False
+                return 0
+        data = self._rfile.read(min(len(buffer), self._chunk_left))
+        if not data:
+            raise EOFError("Request body ended early")
+        buffer[:len(data)] = data
+        self._chunk_left -= len(data)
+        if not self._chunk_left:
+            self._rfile.readline()
+        return len(data)
+
+
+class _BadRequest(Exception):
+    # Answered with a 400
+    pass
+
+
+class ValidationHandler(BaseHTTPRequestHandler):
+    # GET /schemas/<digest>       200 if the schema is cached, else 404
+    # PUT /schemas/<digest>       compiles the schema in the body
+    # POST /validate/<digest>     validates the CSV file in the body, with
+    #                             ?max_errors=N to stop after N errors
+    # Answers are JSON. Bodies are read as they're validated, so a
+    # request's memory doesn't grow with the size of the CSV file.
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # Headers and body go out in separate writes, which Nagle's
+        # algorithm would hold back for a delayed ACK on every answer
+        self.disable_nagle_algorithm = isinstance(self.server, ValidationServer)
+        super().setup()
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        logger.info("%s %s", self.address_string(), format % args)
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            return _ChunkedReader(self.rfile)
+        length = self.headers.get("Content-Length", "0").strip()
+        if not length.isdigit():
+            # Where the body ends isn't known
+            self.close_connection = True
+            raise _BadRequest(f"Invalid Content-Length: {length!r}")
+        return _LengthReader(self.rfile, int(length))
+
+    def _answer(self, handler):
+        # Runs a request's handler, answering errors it didn't expect
+        # rather than dropping the connection without a response
+        try:
+            handler()
+        except _BadRequest as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            logger.exception("Error answering %s %s", self.command, self.path)
+            self.close_connection = True
+            try:
+                self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            except OSError:
+                pass
+
+    def _skip(self, body):
+        # Reads the rest of the body so the connection can be used again.
+        # Closing it with the body unread would lose the answer.
+        while body.read(1024 * 1024):
+            pass
+
+    def _route(self, prefix):
+        # Digest from a path like /prefix/<digest>, or None
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == prefix:
+            return parts[1]
+        return None
+
+    def do_GET(self):
+        self._answer(self._get_schema)
+
+    def do_PUT(self):
+        self._answer(self._put_schema)
+
+    def do_POST(self):
+        self._answer(self._validate)
+
+    def _get_schema(self):
+        digest = self._route("schemas")
+        if digest is None:
+            self._send_json(404, {"error": "Not found"})
+        elif digest in self.server.schemas:
+            self._send_json(200, {"schema": digest})
+        else:
+            self._send_json(404, {"error": "Unknown schema", "schema": digest})
+
+    def _put_schema(self):
+        digest = self._route("schemas")
+        body = self._body()
+        schema_text = body.read()
+        if digest is None:
+            self._send_json(404, {"error": "Not found"})
+            return
+        if schema_digest(schema_text) != digest:
+            self._send_json(400, {"error": "Schema doesn't match its digest", "schema": digest})
+            return
+        try:
+            self.server.schemas.add(schema_text)
+        except (SchemaError, LarkError, UnicodeDecodeError) as e:
+            self._send_json(400, {"error": f"Invalid schema: {e}", "schema": digest})
+            return
+        self._send_json(200, {"schema": digest})
+
+    def _query(self):
+        # max_errors and encoding of a validate request
+        query = parse_qs(urlsplit(self.path).query)
+        max_errors = query.get("max_errors", ["0"])[0]
+        if not max_errors.isdigit():
+            raise _BadRequest(f"Invalid max_errors: {max_errors!r}")
+        encoding = query.get("encoding", ["utf-8"])[0]
+        try:
+            codecs.lookup(encoding)
+        except LookupError:
+            raise _BadRequest(f"Unknown encoding: {encoding!r}")
+        return int(max_errors) or None, encoding
+
+    def _validate(self):
+        digest = self._route("validate")
+        rules = self.server.schemas.get(digest) if digest is not None else None
+        body = self._body()
+        if rules is None:
+            self._skip(body)
+            self._send_json(404, {"error": "Unknown schema", "schema": digest})
+            return
+        try:
+            max_errors, encoding = self._query()
+        except _BadRequest:
+            self._skip(body)
+            raise
+        # Files may have changed since the last request, so fileExists and
+        # fileCount list their directories again
+        file_index().clear()
+        validator = CSV_Stream_Validator(io.BufferedReader(body), rules, encoding,
+                                         max_errors=max_errors)
+        try:
+            valid = validator.check()
+        except (UnicodeDecodeError, LookupError, EOFError, ValueError, csv.Error) as e:
+            # Where the next request starts isn't known
+            self.close_connection = True
+            self._send_json(400, {"error": f"Couldn't read the CSV file: {e}"})
+            return
+        # Left if checking stopped at max_errors
+        self._skip(body)
+        self._send_json(200, {
+            "valid": valid,
+            "error_count": validator.error_count,
+            "warning_count": validator.warning_count,
+            "issues": [issue._asdict() for issue in validator.issues],
+        })
+
+
+class ValidationServer(ThreadingHTTPServer):
+    # Validates CSV files sent by validation_client.py, keeping compiled
+    # schemas between requests. Only listens on localhost.
+    daemon_threads = True
+
+    def __init__(self, port=DEFAULT_PORT, schema_cache_size=SCHEMA_CACHE_SIZE):
+        super().__init__(("127.0.0.1", port), ValidationHandler)
+        self.schemas = SchemaCache(schema_cache_size)
+
+
+class UnixValidationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # The same on a Unix socket, which only local users with access to
+    # socket_path can connect to
+    daemon_threads = True
+
+    def __init__(self, socket_path, schema_cache_size=SCHEMA_CACHE_SIZE):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, ValidationHandler)
+        self.schemas = SchemaCache(schema_cache_size)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+if __name__ == "__main__":
+
+    arg_parser = argparse.ArgumentParser(description="Keep compiled CSV schemas in memory and "
+                                                     "validate the CSV files sent to them.")
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT,
+                            help="Port to listen on at 127.0.0.1.")
+    arg_parser.add_argument('--socket',
+                            help="Listen on this Unix socket instead of a port.")
+    arg_parser.add_argument('--schema-cache-size', type=int, default=SCHEMA_CACHE_SIZE,
+                            help="Number of compiled schemas to keep.")
+    arg_parser.add_argument('-v', '--verbose', action='count', default=0,
+                            help="Log each request.")
+
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING - 10 * min(args.verbose, 2),
+                        format="%(levelname)s: %(message)s")
+    if args.socket:
+        server = UnixValidationServer(args.socket, args.schema_cache_size)
+    else:
+        server = ValidationServer(args.port, args.schema_cache_size)
+    logger.warning("Listening on %s", args.socket or f"127.0.0.1:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
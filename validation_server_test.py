@@ -0,0 +1,137 @@
+import http.client
+import json
+import socket
+import threading
+import pytest
+import validation_server
+from csv_validator import CSV_Stream_Validator
+from csvs_compiler import load_rules
+from validation_client import ValidationClient, ValidationError
+from validation_server import SchemaCache, schema_digest, UnixValidationServer, ValidationServer
+
+SCHEMA = """version 1.0
+@totalColumns 2
+name: notEmpty
+age: range(0, 120)
+"""
+
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / "schema.csvs").write_text(SCHEMA)
+    (tmp_path / "other.csvs").write_text(SCHEMA.replace("120", "20"))
+    (tmp_path / "data.csv").write_text("name,age\njames,21\n,old\nlauren,130\n")
+    return tmp_path
+
+
+def _serve(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+@pytest.fixture
+def server():
+    server = _serve(ValidationServer(port=0, schema_cache_size=1))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _issues(issues):
+    return [(issue["row"], issue["column"], issue["value"]) for issue in issues]
+
+
+def test_same_issues_as_cli(files, server):
+    expected = CSV_Stream_Validator(files / "data.csv", load_rules(files / "schema.csvs", cache_dir=None),
+                                    max_errors=None)
+    expected.check()
+    with ValidationClient(server.server_address[1]) as client:
+        result = client.check(files / "schema.csvs", files / "data.csv")
+    assert not result["valid"] and result["error_count"] == 3
+    assert _issues(result["issues"]) == [(issue.row, issue.column, issue.value)
+                                         for issue in expected.issues]
+
+
+def test_schema_cache(files, server):
+    with ValidationClient(server.server_address[1]) as client:
+        client.check(files / "schema.csvs", files / "data.csv")
+        assert len(server.schemas) == 1
+        # other.csvs pushes schema.csvs out, which is sent again when needed
+        assert client.check(files / "other.csvs", files / "data.csv")["error_count"] == 4
+        assert client.check(files / "schema.csvs", files / "data.csv")["error_count"] == 3
+        # Stopping early leaves the connection usable
+        assert client.check(files / "schema.csvs", files / "data.csv", max_errors=1)["error_count"] == 1
+        assert client.check(files / "schema.csvs", files / "data.csv")["error_count"] == 3
+
+
+def test_lru_order(files):
+    cache = SchemaCache(size=2)
+    digests = [cache.add((files / name).read_bytes()) for name in ("schema.csvs", "other.csvs")]
+    cache.get(digests[0])
+    cache.add(b"version 1.0\nname: notEmpty\n")
+    assert digests[0] in cache and digests[1] not in cache
+
+
+def test_invalid_schema(files, server):
+    (files / "bad.csvs").write_text("version 1.0\nname: rubbish(((\n")
+    with ValidationClient(server.server_address[1]) as client:
+        with pytest.raises(ValidationError, match="Invalid schema"):
+            client.check(files / "bad.csvs", files / "data.csv")
+        assert client.check(files / "schema.csvs", files / "data.csv")["error_count"] == 3
+
+
+def _post(connection, path, body, headers=None):
+    connection.request("POST", path, body, headers or {})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_bad_requests(files, server, monkeypatch):
+    digest = schema_digest((files / "schema.csvs").read_bytes())
+    body = (files / "data.csv").read_bytes()
+    with ValidationClient(server.server_address[1]) as client:
+        client.send_schema((files / "schema.csvs").read_bytes())
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+    try:
+        for query in ("max_errors=x", "max_errors=-1", "encoding=nope"):
+            status, answer = _post(connection, f"/validate/{digest}?{query}", body)
+            assert status == 400 and answer["error"].startswith(("Invalid", "Unknown"))
+        # The connection is still usable after a bad query
+        assert _post(connection, f"/validate/{digest}", body)[1]["error_count"] == 3
+        connection.putrequest("POST", f"/validate/{digest}")
+        connection.putheader("Content-Length", "lots")
+        connection.endheaders()
+        response = connection.getresponse()
+        assert response.status == 400 and "Content-Length" in json.loads(response.read())["error"]
+        connection.close()
+
+        def broken_check(self):
+            raise RuntimeError("broken")
+        monkeypatch.setattr(validation_server.CSV_Stream_Validator, "check", broken_check)
+        status, answer = _post(connection, f"/validate/{digest}", body)
+        assert status == 500 and answer["error"] == "RuntimeError: broken"
+    finally:
+        connection.close()
+
+
+def test_files_listed_for_each_request(files, server):
+    (files / "paths.csvs").write_text(
+        f'version 1.0\n@totalColumns 1\npath: fileExists("{files.as_uri()}/")\n')
+    (files / "paths.csv").write_text("path\nnew.tif\n")
+    with ValidationClient(server.server_address[1]) as client:
+        assert not client.check(files / "paths.csvs", files / "paths.csv")["valid"]
+        (files / "new.tif").write_bytes(b"")
+        assert client.check(files / "paths.csvs", files / "paths.csv")["valid"]
+
+
+@pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="No Unix sockets")
+def test_unix_socket(files):
+    socket_path = str(files / "server.sock")
+    server = _serve(UnixValidationServer(socket_path))
+    try:
+        with ValidationClient(socket_path=socket_path) as client:
+            assert client.check(files / "schema.csvs", files / "data.csv")["error_count"] == 3
+    finally:
+        server.shutdown()
+        server.server_close()